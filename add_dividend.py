@@ -0,0 +1,148 @@
+# 説明: 価格ストアにある全Tickerの配当を同時に取得し、配当ストア（dividends_store.npz）に新しい権利落ち日の分だけを足すスクリプト。
+# 入力方法: リポジトリルートに `prices_close_wide.csv`（または作成済みの `prices_store/`）を置き、`python add_dividend.py [--years 10] [--full] [--source synthetic]` を実行。
+# 出力されるモノ: `dividends_store.npz` を作成/更新（保存済みの行はそのまま、各銘柄の最後の権利落ち日より新しい配当だけを追加）。取得できなかったTickerは標準出力で報告。
+#                 これを実行しておけば、配当を使うシミュレーションは実行中に取得しに行かない。
+
+from __future__ import annotations
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from dividend_store import DIVIDENDS_PATH, DividendIndex, load_dividend_index, save_dividend_store
+from download_cache import cached_dividends
+from fetch_engine import BACKOFF_SEC, RETRIES
+from price_source import SOURCES, PriceSource, get_source
+from price_store import CSV_PATH, load_store_index
+
+# 同時に取得する銘柄数（配当は1銘柄1リクエスト）
+MAX_WORKERS = 8
+# 配当を1件も保存していない銘柄は、過去この年数分だけ取り込む
+YEARS = 10
+
+
+def _fetch_one(ticker: str, source: PriceSource, retries: int, backoff: float) -> pd.Series:
+    """1銘柄の配当を取る。例外が出たら待ち時間を倍にしながら取り直し、それでもだめなら例外を投げる。"""
+    error: Exception | None = None
+    for attempt in range(retries + 1):
+        if attempt:
+            time.sleep(backoff * 2 ** (attempt - 1))
+        try:
+            div = cached_dividends(ticker, source=source)
+            return div if div is not None else pd.Series(dtype=float)
+        except Exception as e:
+            error = e
+    raise error
+
+
+def fetch_dividends_since(
+    tickers: list[str],
+    since: dict[str, np.datetime64],
+    default_start: pd.Timestamp,
+    source: PriceSource | None = None,
+    max_workers: int = MAX_WORKERS,
+    retries: int = RETRIES,
+    backoff: float = BACKOFF_SEC,
+) -> tuple[pd.DataFrame, list[str]]:
+    """
+    全銘柄の配当を同時に取得し、銘柄ごとに since[ticker] より後の権利落ち日だけを残す。
+    （yfinance は配当を期間指定で取れず毎回全履歴が返るので、絞り込みは取得後に行う）
+    since: 銘柄ごとの保存済みの最後の権利落ち日（無い銘柄は default_start 以降を取り込む）
+    return:
+      long: ticker / date / dividend の縦持ち表（date はタイムゾーン無しの日付）
+      failed: 取得できなかったTicker
+    """
+    if source is None:
+        source = get_source()
+    parts: list[pd.DataFrame] = []
+    failed: list[str] = []
+    default_day = np.datetime64(default_start.date(), "D")
+
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = {pool.submit(_fetch_one, t, source, retries, backoff): t for t in tickers}
+        for n, fut in enumerate(as_completed(futures), start=1):
+            t = futures[fut]
+            try:
+                div = fut.result()
+            except Exception as e:
+                print(f"【配当取得エラー】{t} / {repr(e)}")
+                failed.append(t)
+                continue
+            if n % 50 == 0 or n == len(tickers):
+                print(f"【取得中】{n} / {len(tickers)} 銘柄")
+            if len(div) == 0:
+                continue
+
+            idx = pd.DatetimeIndex(div.index)
+            if idx.tz is not None:
+                idx = idx.tz_localize(None)
+            days = idx.normalize().to_numpy(dtype="datetime64[D]")
+            last = since.get(t)
+            keep = days > last if last is not None else days >= default_day
+            if keep.any():
+                parts.append(pd.DataFrame({
+                    "ticker": t,
+                    "date": days[keep],
+                    "dividend": pd.to_numeric(div, errors="coerce").to_numpy(dtype=np.float64)[keep],
+                }))
+
+    elapsed = time.perf_counter() - t0
+    if elapsed > 0:
+        print(f"【速度】{len(tickers)} 銘柄 / {elapsed:.1f} 秒 = {len(tickers) / elapsed:.1f} 銘柄/秒")
+    if not parts:
+        return pd.DataFrame(columns=["ticker", "date", "dividend"]), failed
+    return pd.concat(parts, ignore_index=True), failed
+
+
+def update_dividend_store(
+    tickers: list[str],
+    years: int = YEARS,
+    path: str | Path = DIVIDENDS_PATH,
+    full: bool = False,
+    source: PriceSource | None = None,
+) -> tuple[DividendIndex, int, list[str]]:
+    """
+    配当ストアに新しい権利落ち日の分だけを足して保存する。
+    full=True なら保存済みの配当を捨てて、過去 years 年分を取り直す。
+    return: (更新後の索引, 足した件数, 取得できなかったTicker)
+    """
+    index = None if full else load_dividend_index(path)
+    if index is None:
+        index = DividendIndex.from_long(pd.DataFrame({"ticker": [], "date": [], "dividend": []}))
+    default_start = pd.Timestamp.now().normalize() - pd.DateOffset(years=years)
+
+    long, failed = fetch_dividends_since(tickers, index.last_dates(), default_start, source=source)
+    index, n_added = index.merge_newer(long)
+    save_dividend_store(index, path)
+    return index, n_added, failed
+
+
+def main():
+    ap = argparse.ArgumentParser(description="全銘柄の配当を取得し、配当ストアに新しい分だけを足します。")
+    ap.add_argument("--years", type=int, default=YEARS, help=f"配当が未保存の銘柄を何年分取り込むか（default: {YEARS}）")
+    ap.add_argument("--full", action="store_true", help="保存済みの配当を捨てて取り直す")
+    ap.add_argument("--source", choices=SOURCES, default=None, help="取得元（default: 環境変数 PRICE_SOURCE、無ければ yfinance）")
+    ap.add_argument("--csv", default=str(CSV_PATH), help=f"対象Tickerを読む価格CSV（default: {CSV_PATH}。ストアがあればそちらを読む）")
+    ap.add_argument("--out", default=DIVIDENDS_PATH, help=f"配当ストアの保存先（default: {DIVIDENDS_PATH}）")
+    args = ap.parse_args()
+
+    tickers, _dates = load_store_index(args.csv)
+    tickers = [t for t in tickers if not t.startswith("^")]  # 指数は配当なし
+    print(f"対象ティッカー数: {len(tickers)}")
+
+    index, n_added, failed = update_dividend_store(
+        tickers, years=args.years, path=args.out, full=args.full, source=get_source(args.source),
+    )
+    print(f"【保存】配当ストアを保存しました: {args.out}")
+    print(f"【結果】追加した配当の件数={n_added}、配当のある銘柄={len(index.tickers)}、件数={len(index.dates)}")
+    if failed:
+        print("【まとめ】配当を取得できなかったTicker一覧（次回の実行で取り直します）:")
+        print("  " + ", ".join(sorted(failed)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,34 @@
-# 説明: prices_close_wide.csv を yfinance で最新日まで更新するスクリプト。
-# 入力方法: リポジトリルートに `prices_close_wide.csv` を置き、`python add_price.py` を実行。
-# 出力されるモノ: 同名 `prices_close_wide.csv` を上書き保存（UTF-8-SIG、小数2桁）。取得失敗Tickerは標準出力で報告。
+# 説明: 終値ストア（prices_store/）を yfinance で最新日まで更新するスクリプト。
+# 入力方法: リポジトリルートに `prices_close_wide.csv`（または作成済みの `prices_store/`）を置き、`python add_price.py [--export-csv]` を実行。
+# 出力されるモノ: `prices_store/` に新しい日付だけを追記（最新月のファイルと manifest のみ書き換え。始値などがあるストアはそれも追記。RSRパネルがあれば新しい日付の分を計算。`--rsr-top N` で取得した終値を流し込んだRSR上位N件も表示）。Tickerごとに最後に値がある日から取り直すので、前回取れなかったTickerの欠けも埋まる。`--export-csv` 指定時は `prices_close_wide.csv` も書き出す（UTF-8-SIG、小数2桁）。取得失敗Tickerは標準出力で報告。
 
 from __future__ import annotations
+import argparse
 from pathlib import Path
 import pandas as pd
-import yfinance as yf
+
+from download_cache import RECENT_TTL_SEC, DownloadCache
+from fetch_engine import fetch_wide, source_downloader
+from price_source import SOURCES, PriceSource, get_source
+from price_store import ensure_store, export_close_csv, last_valid_dates, merge_close_sessions, read_manifest
+from rsr_panel import has_rsr_panel, update_rsr_panel
+from rsr_stream import StreamingRsr, print_top_changes
 
 CSV_PATH = Path("prices_close_wide.csv")
 
 INTERVAL = "1d"
+# 取得のチャンクの大きさ・同時数の初期値（取得中は fetch_engine.ChunkScheduler が増減させる）
 CHUNK_SIZE = 50
+MAX_WORKERS = 4
+# Tickerごとに遅れを取り戻すときに遡る最大日数（暦日）
+MAX_CATCHUP_DAYS = 60
 
-def load_csv() -> pd.DataFrame:
-    if not CSV_PATH.exists():
+def load_manifest() -> tuple[Path, dict]:
+    """ストアを用意して manifest（Ticker一覧と日付一覧）だけを読む。行列本体は読まない。"""
+    if not CSV_PATH.exists() and not (CSV_PATH.with_name("prices_store") / "manifest.json").exists():
         raise FileNotFoundError(f"CSVが見つかりません: {CSV_PATH}")
-    df = pd.read_csv(CSV_PATH, index_col=0)
-    return df
+    store_dir = ensure_store(CSV_PATH)
+    return store_dir, read_manifest(store_dir)
 
 def get_latest_saved_date(columns: list[str]) -> pd.Timestamp | None:
     # 列名のうち、日付として解釈できるものだけで最大を取る
@@ -25,145 +37,142 @@ def get_latest_saved_date(columns: list[str]) -> pd.Timestamp | None:
         return None
     return parsed.max()
 
-def fetch_close_range(tickers: list[str], start: str, end: str) -> tuple[pd.DataFrame, list[str]]:
+def fetch_close_range(
+    tickers: list[str],
+    start: str,
+    end: str,
+    source: PriceSource | None = None,
+) -> tuple[pd.DataFrame, list[str], dict[str, pd.DataFrame]]:
     """
     期間[start, end) の日足終値を取得して close_wide で返す（縦=Ticker, 横=Date）
     return:
       new_wide: index=Ticker, columns=YYYY-MM-DD(str), values=Close
       failed: 取れなかったTicker
+      fields: 始値・高値・安値・出来高 {"open": ワイド表, ...}（new_wide と同じ形）
+    source: 取得元（省略時は yfinance。price_source.get_source を参照）
     """
-    parts: list[pd.DataFrame] = []
-    failed: list[str] = []
-
-    for i in range(0, len(tickers), CHUNK_SIZE):
-        chunk = tickers[i:i + CHUNK_SIZE]
-        print(f"【取得中】{i+1}〜{min(i+CHUNK_SIZE, len(tickers))} / {len(tickers)} 銘柄（{start} 〜 {end}）")
-
-        try:
-            data = yf.download(
-                tickers=chunk,
-                start=start,   # inclusive
-                end=end,       # exclusive（今日まで欲しければ明日をendにする）
-                interval=INTERVAL,
-                progress=False,
-                threads=True,
-            )
-        except Exception as e:
-            print("【株価取得エラー】yfinance取得で例外が発生しました。")
-            print(f"  対象（先頭10）: {chunk[:10]}")
-            print(f"  エラー内容: {repr(e)}")
-            failed.extend(chunk)
-            continue
-
-        if data is None or data.empty:
-            print("【注意】この範囲のデータが空でした（休場/データ欠落の可能性）。")
-            continue
-
-        try:
-            close = data["Close"]
-        except Exception as e:
-            print("【株価取得エラー】'Close' 列の取り出しに失敗しました。")
-            print(f"  エラー内容: {repr(e)}")
-            failed.extend(chunk)
-            continue
-
-        # 1銘柄だとSeriesになることがある
-        if isinstance(close, pd.Series):
-            close = close.to_frame(name=chunk[0])
-
-        if close.empty:
-            print("【注意】Closeが空でした。")
-            continue
-
-        # 返ってきたTicker列に含まれないものを failed 扱い
-        returned_cols = set(map(str, close.columns))
-        missing_cols = [t for t in chunk if t not in returned_cols]
-        if missing_cols:
-            print("【注意】このチャンクで取得できなかったTickerがあります（yfinance側エラーの可能性）:")
-            print("  " + ", ".join(missing_cols))
-            failed.extend(missing_cols)
-
-        # 日付を "YYYY-MM-DD" に統一
-        close.index = pd.to_datetime(close.index).strftime("%Y-%m-%d")
-
-        wide = close.T  # 行=Ticker, 列=Date
-
-        # 全部NaNのTickerは失敗扱い
-        all_nan = wide.isna().all(axis=1)
-        failed.extend(wide.index[all_nan].tolist())
-        wide = wide.loc[~all_nan]
-
-        parts.append(wide)
-
-    out = pd.concat(parts, axis=0) if parts else pd.DataFrame()
-    out = out[~out.index.duplicated(keep="first")]
-    out = out.sort_index()
-    out = out.reindex(sorted(out.columns), axis=1)
-
-    return out, sorted(set(map(str, failed)))
+    res = fetch_wide(
+        tickers,
+        # start は inclusive、end は exclusive（今日まで欲しければ明日をendにする）
+        source_downloader(source, cache=DownloadCache(ttl=RECENT_TTL_SEC), start=start, end=end, interval=INTERVAL),
+        chunk_size=CHUNK_SIZE,
+        max_workers=MAX_WORKERS,
+        # 休場日だけの範囲では空が返るので、それは失敗扱いにしない
+        empty_ok=True,
+        label=f"{start} 〜 {end}",
+    )
+    return res.close, res.failed, res.fields
+
+def plan_fetch_groups(last_valid: pd.Series, latest: pd.Timestamp, today: pd.Timestamp) -> dict[pd.Timestamp, list[str]]:
+    """
+    Tickerごとに「最後に値がある日の翌日」から今日までを取りに行く。開始日が同じTickerは1つにまとめる。
+    - 値が1つも無いTicker（取得失敗のまま保存されたものなど）は対象外（get_price.py で取り直す）
+    - 遅れが MAX_CATCHUP_DAYS を超えるTickerは、その日数分だけ遡って取る
+      （上場廃止・売買停止の銘柄のために毎回長い期間を取りに行かないように）
+    return: {開始日: [Ticker, ...]}（開始日の昇順）
+    """
+    floor = (latest - pd.Timedelta(days=MAX_CATCHUP_DAYS)).normalize()
+    starts = (last_valid.dropna() + pd.Timedelta(days=1)).dt.normalize().clip(lower=floor)
+    starts = starts[starts <= today]
+    return {pd.Timestamp(d): sorted(map(str, g.index)) for d, g in starts.groupby(starts)}
 
 def main():
-    df = load_csv()
+    ap = argparse.ArgumentParser(description="終値ストアを最新日まで更新します。")
+    ap.add_argument("--export-csv", action="store_true", help=f"更新後に {CSV_PATH} も書き出す（全期間の書き直しになるので遅い）")
+    ap.add_argument("--source", choices=SOURCES, default=None, help="取得元（default: 環境変数 PRICE_SOURCE、無ければ yfinance）")
+    ap.add_argument("--rsr-top", type=int, default=0, help="取得した終値でRSRランキングを更新し、上位N件と入れ替わりを表示する（default: 0 = 表示しない）")
+    args = ap.parse_args()
+    source = get_source(args.source)
 
-    tickers = df.index.astype(str).tolist()
+    store_dir, manifest = load_manifest()
+
+    tickers = manifest["tickers"]
     print(f"【対象】銘柄数: {len(tickers)}")
 
-    latest = get_latest_saved_date(list(df.columns))
+    latest = get_latest_saved_date(manifest["dates"])
     if latest is None:
-        print("【致命的】CSVの列から日付が判定できません（列名が日付形式ではない可能性）。")
+        print("【致命的】ストアから最新日付が判定できません（日付が1つも保存されていない可能性）。")
         return
 
     latest_str = latest.strftime("%Y-%m-%d")
 
-    # 既存の最新日付の「翌日」から取りに行く
-    start_dt = (latest + pd.Timedelta(days=1)).normalize()
+    # Tickerごとの「最後に値がある日」（manifest に記録してある）
+    last_valid = last_valid_dates(store_dir)
+    empty = last_valid.index[last_valid.isna()].tolist()
+    if empty:
+        print("【注意】値が1つも無いTickerは対象外です（get_price.py で取り直してください）:")
+        print("  " + ", ".join(empty[:50]) + (" …" if len(empty) > 50 else ""))
 
     # 今日まで取りたいので end は「明日」（endはexclusive）
     today = pd.Timestamp.today().normalize()
-    end_dt = today + pd.Timedelta(days=1)
-
-    start = start_dt.strftime("%Y-%m-%d")
-    end = end_dt.strftime("%Y-%m-%d")
+    end = (today + pd.Timedelta(days=1)).strftime("%Y-%m-%d")
 
-    if start_dt > today:
+    groups = plan_fetch_groups(last_valid, latest, today)
+    if not groups:
         print("【完了】すでに最新です（追加する日付がありません）。")
-        print(f"  CSV最新日付: {latest_str}")
+        print(f"  ストア最新日付: {latest_str}")
         return
 
-    print(f"【更新範囲】CSV最新日付: {latest_str} → 追加取得: {start} 〜 {today.strftime('%Y-%m-%d')}")
+    print(f"【更新範囲】ストア最新日付: {latest_str} → 取得終了日: {today.strftime('%Y-%m-%d')}")
+    for start_dt, group in groups.items():
+        behind = "" if start_dt > latest else "（遅れているTicker）"
+        print(f"  {start_dt.strftime('%Y-%m-%d')} 〜 : {len(group)} 銘柄{behind}")
+
+    wides: list[pd.DataFrame] = []
+    field_parts: dict[str, list[pd.DataFrame]] = {}
+    failed: list[str] = []
+    for start_dt, group in groups.items():
+        start = start_dt.strftime("%Y-%m-%d")
+        wide, group_failed, fields = fetch_close_range(group, start=start, end=end, source=source)
+        failed.extend(group_failed)
 
-    new_wide, failed = fetch_close_range(tickers, start=start, end=end)
+        # ★重要：yfinanceが「開始日以降データ無し」でも直前日を返すことがあるため、開始日以降だけを使う
+        if wide.empty:
+            continue
+        cols = [c for c in wide.columns if c >= start]
+        wides.append(wide.reindex(columns=cols))
+        for field, frame in fields.items():
+            field_parts.setdefault(field, []).append(frame.reindex(columns=cols))
 
-    # ★重要：yfinanceが「開始日以降データ無し」でも直前日を返すことがあるため、
-    # 「CSV最新日付より後」だけを追加扱いにする
-    if not new_wide.empty:
-        new_cols = [c for c in new_wide.columns if c > latest_str]
-        new_wide = new_wide.reindex(columns=new_cols)
+    new_wide = pd.concat(wides, axis=0) if wides else pd.DataFrame()
+    new_wide = new_wide.dropna(axis=1, how="all")
+    new_fields = {f: pd.concat(frames, axis=0) for f, frames in field_parts.items()}
 
     if new_wide.empty:
         print("【完了】追加できる新しい取引日がありません。")
-        print(f"  CSV最新日付: {latest_str}")
+        print(f"  ストア最新日付: {latest_str}")
         print("  休場日・週末・引け前実行などが原因の可能性があります。")
         if failed:
             print("【注意】取得できなかった可能性のあるTicker（参考）:")
             print("  " + ", ".join(failed[:50]) + (" …" if len(failed) > 50 else ""))
         return
 
-    # 既存dfに新しい日付列を追加して、値を上書き更新
-    merged = df.copy()
+    # 更新前のストアの状態からランキングを作っておき、取得した終値だけを流し込む（全銘柄の計算し直しはしない）
+    scorer = StreamingRsr.from_store(CSV_PATH) if args.rsr_top > 0 else None
+    if scorer is not None:
+        before = scorer.ranking(args.rsr_top)
+        scorer.feed_wide(new_wide)
+
+    # 遅れていたTickerの欠けを埋め、新しい日付列だけを追記（過去分の既存値は書き直さない）
+    filled, appended = merge_close_sessions(new_wide, store_dir, fields=new_fields)
+    print(f"【保存】ストアを更新しました: {store_dir}")
 
-    # 列を拡張
-    all_cols = sorted(set(merged.columns).union(new_wide.columns))
-    merged = merged.reindex(columns=all_cols)
+    # RSRパネルを作ってあれば、増えた日付（と埋まった欠けのある月以降）の分だけ計算する
+    if has_rsr_panel(store_dir):
+        _lo, n_rsr = update_rsr_panel(CSV_PATH)
+        print(f"【保存】RSRパネルを更新しました（{n_rsr} 日分を計算）")
 
-    # 値を反映（同じ日付があれば上書き）
-    merged.update(new_wide)
+    if args.export_csv:
+        export_close_csv(store_dir, CSV_PATH)
+        print(f"【保存】CSVを書き出しました: {CSV_PATH}")
 
-    # 保存（小数2桁固定）
-    merged.to_csv(CSV_PATH, encoding="utf-8-sig", float_format="%.2f")
+    print(f"【結果】追加した日付列数: {appended}、埋めた欠損値の数: {filled}")
 
-    print(f"【保存】CSVを更新しました: {CSV_PATH}")
-    print(f"【結果】追加取得できた日付列数: {len(new_wide.columns)}（{new_wide.columns[0]} … {new_wide.columns[-1]}）")
+    if scorer is not None:
+        print(f"【RSR】{scorer.session.strftime('%Y/%m/%d')} の上位 {args.rsr_top} 銘柄")
+        for i, (t, v) in enumerate(scorer.ranking(args.rsr_top), 1):
+            print(f"{i}位：{t} : {v:.2f}(値)")
+        print_top_changes(before, scorer.ranking(args.rsr_top), "【RSR】")
 
     if failed:
         print("【注意】取得できなかった可能性のあるTicker:")
@@ -0,0 +1,120 @@
+# 説明: 「その日以前で直近の有効値」を配列の添字だけで引く as-of 索引。銘柄ごとに「日付 i 以前で最後に値がある列」の整数配列と、前方に埋めた値の行列を一度だけ作る。
+# 入力方法: 各スクリプトから `from asof_index import asof_index_for` として使う（単体実行はしない）。
+# 出力されるモノ: なし（索引オブジェクトを返すだけ）。
+
+from __future__ import annotations
+
+import weakref
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+from jit_kernels import asof_lookup
+from ticker_alias import alias_index
+
+
+def last_valid_positions(values: np.ndarray) -> np.ndarray:
+    """各 (行, 列) について、同じ行でその列以前に最後に値がある列番号（無ければ -1）。int32 の行列。"""
+    values = np.asarray(values)
+    n_dates = values.shape[1]
+    last = np.where(~np.isnan(values), np.arange(n_dates, dtype=np.int32), np.int32(-1))
+    if n_dates:
+        np.maximum.accumulate(last, axis=1, out=last)
+    return last
+
+
+def forward_fill(values: np.ndarray) -> np.ndarray:
+    """行列の NaN を、同じ行のそれより前の直近の値で埋めた行列（前に値が無ければ NaN のまま）。"""
+    values = np.asarray(values, dtype=np.float64)
+    last = last_valid_positions(values)
+    out = np.take_along_axis(values, last.clip(min=0), axis=1)
+    out[last < 0] = np.nan
+    return out
+
+
+class AsofIndex:
+    """
+    Ticker x 日付 の行列から一度だけ作る as-of 索引。
+    - last[i, j]   : Ticker i が日付 j 以前で最後に値を持つ列番号（無ければ -1）
+    - filled[i, j] : その値（無ければ NaN）
+    - value_and_date(ticker, day) : 1件を (値, 実際に使った日付) で返す（二分探索1回 + 添字）
+    - lookup(rows, days)          : 多数の (Ticker, 日付) の組をまとめて引く（ブロードキャスト可）
+    - gather(days)                : 全Tickerの days 時点の値（Ticker x len(days)）
+    """
+
+    def __init__(self, values: np.ndarray, tickers: Iterable[str], dates: pd.DatetimeIndex):
+        values = np.asarray(values, dtype=np.float64)
+        self.tickers = pd.Index([str(t) for t in tickers], name="Ticker")
+        self.dates = pd.DatetimeIndex(dates)
+        self.last = last_valid_positions(values)
+        self.filled = np.take_along_axis(values, self.last.clip(min=0), axis=1)
+        self.filled[self.last < 0] = np.nan
+        self._aliases = alias_index(self.tickers)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame) -> "AsofIndex":
+        """ワイド表（index=Ticker, columns=日付 昇順）から作る。"""
+        return cls(df.to_numpy(dtype=np.float64), df.index, pd.DatetimeIndex(df.columns))
+
+    def __contains__(self, ticker: str) -> bool:
+        return self._aliases.position(ticker) >= 0
+
+    def columns(self, days) -> np.ndarray:
+        """各 days について「その日以前で直近の列」の位置（その日以前に列が無ければ -1）。"""
+        days = pd.DatetimeIndex(pd.to_datetime(list(np.atleast_1d(days)))).normalize()
+        return self.dates.searchsorted(days, side="right") - 1
+
+    def rows(self, tickers: Iterable[str]) -> np.ndarray:
+        """Ticker（表記揺れ可）を行番号に変換する（見つからなければ -1）。"""
+        return self._aliases.positions(tickers)
+
+    def lookup(self, rows: np.ndarray, cols: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+        """
+        行番号と「その日以前の列」の組（同じ形、またはブロードキャストできる形）をまとめて引く。
+        return: (値, 実際に値があった列番号)。値が無い所は (NaN, -1)
+        """
+        return asof_lookup(self.last, self.filled, rows, cols)
+
+    def value_and_date(self, ticker: str, day) -> tuple[float | None, pd.Timestamp | None]:
+        """day 以前で直近の有効値と、その日付。無ければ (None, None)。"""
+        i = self._aliases.position(ticker)
+        j = int(self.dates.searchsorted(pd.Timestamp(day).normalize(), side="right")) - 1
+        if i < 0 or j < 0 or self.last[i, j] < 0:
+            return None, None
+        return float(self.filled[i, j]), self.dates[self.last[i, j]]
+
+    def value(self, ticker: str, day) -> float | None:
+        return self.value_and_date(ticker, day)[0]
+
+    def latest(self, ticker: str) -> tuple[float | None, pd.Timestamp | None]:
+        """最後に値がある日の値と、その日付。無ければ (None, None)。"""
+        if len(self.dates) == 0:
+            return None, None
+        return self.value_and_date(ticker, self.dates[-1])
+
+    def gather(self, days) -> np.ndarray:
+        """全Tickerについて、各 days 以前で直近の値（Ticker x len(days)、無ければ NaN）。"""
+        cols = self.columns(days)
+        out = self.filled[:, cols.clip(min=0)]
+        out[:, cols < 0] = np.nan
+        return out
+
+
+_CACHE: dict[int, tuple[weakref.ref, AsofIndex]] = {}
+
+
+def asof_index_for(df: pd.DataFrame) -> AsofIndex:
+    """
+    ワイド表から索引を返す。
+    同じ DataFrame オブジェクトに対しては1回だけ作り、以後は使い回す。
+    """
+    key = id(df)
+    hit = _CACHE.get(key)
+    if hit is not None and hit[0]() is df:
+        return hit[1]
+
+    index = AsofIndex.from_frame(df)
+    _CACHE[key] = (weakref.ref(df), index)
+    weakref.finalize(df, _CACHE.pop, key, None)
+    return index
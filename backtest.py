@@ -0,0 +1,213 @@
+# 説明: RSR上位N銘柄を定期的に入れ替えるバックテスト。価格は1回だけ読み、入れ替え日ごとに「RSR上位N銘柄を選ぶ → 資産を等分して買う → 次の入れ替え日に売って次へ回す」を同じプロセス内で繰り返し、日次の資産推移を出す。
+# 入力方法: `python backtest.py [--freq monthly|quarterly] [--dates YYYY-MM-DD ...] [--start YYYY-MM-DD] [--end YYYY-MM-DD] [--top 40] [--capital 1000000] [--plot]`
+#           （--dates を指定するとその日だけで入れ替える。--start の既定はストアの最初の日の1年後 = RSRが計算できる最初の頃）。
+# 出力されるモノ: 入れ替えごとの損益と、資産推移の要約（日経平均との比較）を標準出力に表示。`backtest_equity.csv`（日付, 資産, 日経平均を同じ元本で持った場合）を保存。--plot でグラフ表示。
+
+from __future__ import annotations
+
+import argparse
+import time
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from asof_index import forward_fill
+from jit_kernels import buy_sell_pnl
+from price_store import CSV_PATH, ensure_store, load_store, load_store_index
+from rsr_topn import base_positions, rsr_rows, top_n_columns
+from session_calendar import get_session_calendar
+
+CAL_NAME = "XTKS"
+BENCH = "^N225"
+TOP_NUMBER = 40
+CAPITAL = 1_000_000
+FREQ_MONTHS = {"monthly": 1, "quarterly": 3}
+OUT_PATH = "backtest_equity.csv"
+
+
+class BacktestResult(NamedTuple):
+    equity: pd.DataFrame    # index=日付 / columns=equity, ^N225（同じ元本で日経平均を持った場合）
+    periods: pd.DataFrame   # 入れ替えごとの 買った日, 売った日, 銘柄数, 期首資産, 期末資産, 損益率%
+    holdings: pd.DataFrame  # index=(入れ替え日, 順位) / columns=Ticker, RSR, buy, sell, shares, profit_pct
+
+
+def schedule_days(start, end, freq: str) -> list[pd.Timestamp]:
+    """start から freq（monthly / quarterly）ごとの日付（end より前まで）。"""
+    months = FREQ_MONTHS[freq]
+    start, end = pd.Timestamp(start).normalize(), pd.Timestamp(end).normalize()
+    out, k = [], 0
+    while (day := start + pd.DateOffset(months=k * months)) < end:
+        out.append(day)
+        k += 1
+    return out
+
+
+def run_backtest(
+    days,
+    end=None,
+    top_n: int = TOP_NUMBER,
+    capital: float = CAPITAL,
+    csv_path: str | Path = CSV_PATH,
+    cal_name: str = CAL_NAME,
+) -> BacktestResult:
+    """
+    days の各日（ストアの日付に寄せる）で入れ替える。end（省略時はストアの最終日）に最後の保有を評価して終わる。
+    - 各入れ替え日に、その日のRSR上位 top_n 銘柄（指数 = "^" で始まるTickerは除く）を、その日の終値で資産を等分して買う（端数株あり）
+    - 次の入れ替え日の終値で全部売り、その資産で次の銘柄を買う
+    - その日の終値が無い（まだ上場していない等）銘柄は選ばない。買った後に値が無い日は直近の終値で評価する
+    """
+    tickers, dates = load_store_index(csv_path)
+    raw = load_store(ensure_store(csv_path)).to_numpy()  # 価格はここで1回だけ読む
+    filled = forward_fill(raw)
+    cal = get_session_calendar(cal_name)
+
+    end_pos = len(dates) - 1 if end is None else int(base_positions(dates, cal, [end])[0])
+    positions = base_positions(dates, cal, days)
+    positions = positions[positions < end_pos]
+    if len(positions) == 0:
+        raise ValueError("end より前の入れ替え日がありません。")
+
+    # 全入れ替え日のRSRをまとめて計算し、上位N銘柄もまとめて選ぶ（その日の終値が無い銘柄と指数は除く）
+    scores = rsr_rows(positions, csv_path, cal_name=cal_name, filled=filled)
+    names = np.asarray(tickers, dtype=object)
+    is_index = np.array([str(t).startswith("^") for t in tickers])
+    # 前方に埋める前の終値で見る（上場廃止・売買停止の銘柄は埋めた値が残るので、埋めた後では除けない）
+    price_at = raw[:, positions].T  # 入れ替え日 x Ticker
+    scores[:, is_index] = np.nan
+    scores[~(np.isfinite(price_at) & (price_at > 0))] = np.nan
+    picks = top_n_columns(scores, top_n)
+
+    stops = np.append(positions[1:], end_pos)
+    curve = np.empty(end_pos - positions[0] + 1)
+    equity = float(capital)
+    period_rows, holding_parts = [], []
+    for k, (p, q) in enumerate(zip(positions, stops)):
+        cols = picks[k]
+        seg = slice(p - positions[0], q - positions[0] + 1)
+        start_equity = equity
+        if len(cols) == 0:
+            curve[seg] = equity  # 買える銘柄が無ければ現金のまま
+        else:
+            buy, sell = filled[cols, p], filled[cols, q]
+            shares = equity / len(cols) / buy
+            curve[seg] = shares @ filled[cols, p : q + 1]
+            equity = float(curve[seg][-1])
+            _cost, _value, _profit, pct = buy_sell_pnl(buy, sell, shares)
+            holding_parts.append(pd.DataFrame({
+                "date": dates[p],
+                "rank": np.arange(1, len(cols) + 1),
+                "Ticker": names[cols],
+                "RSR": scores[k, cols],
+                "buy": buy,
+                "sell": sell,
+                "shares": shares,
+                "profit_pct": pct,
+            }))
+        period_rows.append({
+            "buy_date": dates[p],
+            "sell_date": dates[q],
+            "n": len(cols),
+            "start_equity": start_equity,
+            "end_equity": equity,
+            "pct": (equity / start_equity - 1) * 100 if start_equity else np.nan,
+        })
+
+    index = dates[positions[0] : end_pos + 1]
+    eq = pd.DataFrame({"equity": curve}, index=pd.DatetimeIndex(index, name="date"))
+    b = list(names).index(BENCH) if BENCH in tickers else -1
+    if b >= 0 and filled[b, positions[0]] > 0:
+        eq[BENCH] = capital * filled[b, positions[0] : end_pos + 1] / filled[b, positions[0]]
+
+    holdings = (
+        pd.concat(holding_parts, ignore_index=True).set_index(["date", "rank"]) if holding_parts
+        else pd.DataFrame(columns=["Ticker", "RSR", "buy", "sell", "shares", "profit_pct"])
+    )
+    return BacktestResult(eq, pd.DataFrame(period_rows), holdings)
+
+
+def summarize(curve: pd.Series) -> dict[str, float]:
+    """資産推移から 総損益率% / 年率% / 最大下落率% を出す。"""
+    v = curve.dropna().to_numpy()
+    if len(v) < 2 or v[0] <= 0:
+        return {"total": np.nan, "cagr": np.nan, "max_dd": np.nan}
+    years = (curve.dropna().index[-1] - curve.dropna().index[0]).days / 365.25
+    peak = np.maximum.accumulate(v)
+    return {
+        "total": (v[-1] / v[0] - 1) * 100,
+        "cagr": ((v[-1] / v[0]) ** (1 / years) - 1) * 100 if years > 0 else np.nan,
+        "max_dd": float(((v / peak) - 1).min() * 100),
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="RSR上位N銘柄を定期的に入れ替えるバックテストを行います。")
+    ap.add_argument("--freq", choices=sorted(FREQ_MONTHS), default="monthly", help="入れ替えの間隔（default: monthly）")
+    ap.add_argument("--dates", nargs="+", default=None, help="入れ替え日を直接指定する（YYYY-MM-DD ...）")
+    ap.add_argument("--start", default=None, help="最初の入れ替え日（default: ストアの最初の日の1年後）")
+    ap.add_argument("--end", default=None, help="最後に評価する日（default: ストアの最終日）")
+    ap.add_argument("--top", type=int, default=TOP_NUMBER, help=f"上位何銘柄を持つか（default: {TOP_NUMBER}）")
+    ap.add_argument("--capital", type=float, default=CAPITAL, help=f"元本（円, default: {CAPITAL:,}）")
+    ap.add_argument("--out", default=OUT_PATH, help=f"資産推移の保存先（default: {OUT_PATH}）")
+    ap.add_argument("--plot", action="store_true", help="資産推移をグラフで表示する")
+    ap.add_argument("--csv", default=CSV_PATH, help=f"終値ワイドCSV（default: {CSV_PATH}）")
+    args = ap.parse_args()
+
+    _tickers, dates = load_store_index(args.csv)
+    end = pd.Timestamp(args.end) if args.end else dates[-1]
+    if args.dates:
+        days = [pd.Timestamp(d) for d in args.dates]
+        label = f"指定日 {len(days)} 回"
+    else:
+        start = pd.Timestamp(args.start) if args.start else dates[0] + pd.DateOffset(years=1)
+        days = schedule_days(start, end, args.freq)
+        label = args.freq
+
+    t0 = time.perf_counter()
+    res = run_backtest(days, end, args.top, args.capital, args.csv)
+    elapsed = time.perf_counter() - t0
+
+    print("ーーーー")
+    print(f"条件: RSR上位{args.top}銘柄を等分で購入 / 入れ替え={label} / 元本={args.capital:,.0f} 円")
+    print("")
+    for r in res.periods.itertuples():
+        print(
+            f"{r.buy_date.strftime('%Y/%m/%d')} → {r.sell_date.strftime('%Y/%m/%d')} | "
+            f"{r.n:3d}銘柄 | {r.start_equity:,.0f} → {r.end_equity:,.0f} 円 ({r.pct:+.2f}%)"
+        )
+    print("")
+    first, last = res.equity.index[0], res.equity.index[-1]
+    print(f"期間: {first.strftime('%Y/%m/%d')} 〜 {last.strftime('%Y/%m/%d')}（入れ替え {len(res.periods)} 回）")
+    for col, name in (("equity", "RSR上位"), (BENCH, "日経平均")):
+        if col not in res.equity:
+            continue
+        s = summarize(res.equity[col])
+        print(
+            f"{name}: 最終 {res.equity[col].iloc[-1]:,.0f} 円 / 損益率 {s['total']:,.2f}% / "
+            f"年率 {s['cagr']:.2f}% / 最大下落 {s['max_dd']:.2f}%"
+        )
+    print("ーーーー")
+    print(f"【速度】{len(res.equity)} 営業日 / {elapsed:.2f} 秒")
+
+    res.equity.to_csv(args.out, date_format="%Y-%m-%d", float_format="%.2f")
+    print(f"【保存】{args.out}")
+
+    if args.plot:
+        import matplotlib.pyplot as plt
+
+        plt.figure(figsize=(10, 4))
+        plt.plot(res.equity.index, res.equity["equity"], label=f"RSR top{args.top}")
+        if BENCH in res.equity:
+            plt.plot(res.equity.index, res.equity[BENCH], color="red", label=BENCH)
+        plt.title("Equity curve")
+        plt.xlabel("Date")
+        plt.ylabel("JPY")
+        plt.legend()
+        plt.grid(True)
+        plt.tight_layout()
+        plt.show()
+
+
+if __name__ == "__main__":
+    main()
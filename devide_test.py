@@ -1,11 +1,16 @@
-import yfinance as yf
+import sys
+
 import pandas as pd
 
+from download_cache import cached_dividends
+
 
 # シンプル版: yfinance から配当を取得して CSV に保存します。
 # 使い方:
 # - このファイル内の `ticker` と `years` を変更するだけで実行できます。
 # - 例: ticker = "3382.T" (東証コード形式)、years = 10
+# - 全銘柄をまとめて取得する場合は `python devide_test.py --all`（= `python add_dividend.py`）
+#   （prices_close_wide.csv の全Tickerを同時に取得して dividends_store.npz に新しい分だけ追加）
 # 依存: yfinance, pandas
 
 
@@ -19,8 +24,8 @@ def fetch_dividends(ticker: str = "3382.T", years: int = 10) -> pd.DataFrame:
 	返り値:
 	  Date と Dividend カラムを持つ pandas.DataFrame（該当データがなければ空の DataFrame）
 	"""
-	tk = yf.Ticker(ticker)
-	div = tk.dividends
+	# 同じ銘柄は期限内ならディスクのキャッシュから返す
+	div = cached_dividends(ticker)
 	if div is None or div.empty:
 		return pd.DataFrame(columns=["Date", "Dividend"])
 
@@ -41,6 +46,14 @@ if __name__ == "__main__":
 	ticker = "3382.T"  # 取得する銘柄
 	years = 10          # 過去何年分を取得するか
 
+	if "--all" in sys.argv[1:]:
+		# 全銘柄の取得は add_dividend.py に任せる（同時取得・新しい権利落ち日だけを追加）
+		import add_dividend
+
+		sys.argv = [sys.argv[0], "--years", str(years)]
+		add_dividend.main()
+		sys.exit(0)
+
 	# 配当を取得して表示・CSV保存
 	result = fetch_dividends(ticker, years)
 	if result.empty:
@@ -0,0 +1,202 @@
+# 説明: 全銘柄の配当をひとつにまとめたストア（銘柄ごとに日付昇順の配列 + 累積和）。期間内の配当有無・合計を二分探索で求める。
+# 入力方法: 各スクリプトから `from dividend_store import load_dividend_index` として使う。作成・更新は `python add_dividend.py`（新しい権利落ち日だけを足す）。
+# 出力されるモノ: `dividends_store.npz`（tickers / offsets / dates / amounts）。
+
+from __future__ import annotations
+
+import os
+import weakref
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from ticker_alias import TickerAliasIndex
+
+DIVIDENDS_PATH = "dividends_store.npz"
+
+
+def _to_day(d) -> np.datetime64:
+    """日付をタイムゾーン無しの日単位に揃える（タイムゾーン付きは現地の日付のまま外す）。"""
+    ts = pd.Timestamp(d)
+    if ts.tzinfo is not None:
+        ts = ts.tz_localize(None)
+    return np.datetime64(ts.normalize().date(), "D")
+
+
+def _to_days(values) -> np.ndarray:
+    s = pd.to_datetime(pd.Series(values), errors="coerce")
+    if getattr(s.dt, "tz", None) is not None:
+        s = s.dt.tz_localize(None)
+    return s.dt.normalize().to_numpy(dtype="datetime64[D]")
+
+
+class DividendIndex:
+    """
+    全銘柄の配当を (銘柄ごとに連続した) 日付昇順の配列で持つ。
+    - any_in(ticker, start, end)   : [start, end] に配当があるか
+    - total_in(ticker, start, end) : [start, end] の1株あたり配当合計
+    どちらも二分探索2回 + 累積和の差だけで求まる。
+    """
+
+    def __init__(self, tickers: list[str], offsets: np.ndarray, dates: np.ndarray, amounts: np.ndarray):
+        self.tickers = [str(t) for t in tickers]
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.dates = np.asarray(dates, dtype="datetime64[D]")
+        self.amounts = np.asarray(amounts, dtype=np.float64)
+        self._cum = np.concatenate([[0.0], np.cumsum(self.amounts)])
+        self._aliases = TickerAliasIndex(self.tickers)
+
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, ticker: str | None = None) -> "DividendIndex":
+        """
+        縦持ちの配当表から作る。受け付ける形:
+        - 列: ticker / date(Date) / dividend(Dividend, dividends, div, value)
+        - ticker 列が無いときは引数 ticker の1銘柄分とみなす
+        - date 列が無いときは index を日付とみなす
+        """
+        cols = {str(c).lower(): c for c in df.columns}
+        if "date" in cols:
+            dates = _to_days(df[cols["date"]])
+        else:
+            dates = _to_days(df.index)
+
+        amount_col = next((cols[c] for c in ("dividend", "dividends", "div", "value") if c in cols), None)
+        if amount_col is None:
+            amounts = np.zeros(len(df))
+        else:
+            amounts = pd.to_numeric(df[amount_col], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)
+
+        if "ticker" in cols:
+            names = df[cols["ticker"]].astype(str).to_numpy()
+        else:
+            names = np.full(len(df), "" if ticker is None else str(ticker), dtype=object)
+
+        ok = ~np.isnat(dates)
+        long = pd.DataFrame({"ticker": names[ok], "date": dates[ok], "dividend": amounts[ok]})
+        return cls.from_long(long)
+
+    @classmethod
+    def from_long(cls, long: pd.DataFrame) -> "DividendIndex":
+        """ticker / date / dividend 列の縦持ち表から作る（並べ替えはここで行う）。"""
+        long = long.sort_values(["ticker", "date"], kind="stable")
+        names = long["ticker"].astype(str).to_numpy()
+        tickers, first = np.unique(names, return_index=True)
+        offsets = np.append(first, len(names))
+        return cls(list(tickers), offsets, long["date"].to_numpy(dtype="datetime64[D]"), long["dividend"].to_numpy())
+
+    def __contains__(self, ticker: str) -> bool:
+        return self._span(ticker) is not None
+
+    def _span(self, ticker: str | None) -> tuple[int, int] | None:
+        # 銘柄名なしで作った単一銘柄の表は、どの ticker で聞かれてもその銘柄として扱う
+        if self.tickers == [""]:
+            return int(self.offsets[0]), int(self.offsets[1])
+        i = self._aliases.position(ticker) if ticker is not None else -1
+        if i < 0:
+            return None
+        return int(self.offsets[i]), int(self.offsets[i + 1])
+
+    def _range(self, ticker: str, start, end) -> tuple[int, int]:
+        span = self._span(ticker)
+        if span is None:
+            return 0, 0
+        a, b = span
+        d = self.dates[a:b]
+        lo = a + int(np.searchsorted(d, _to_day(start), side="left"))
+        hi = a + int(np.searchsorted(d, _to_day(end), side="right"))
+        return lo, hi
+
+    def any_in(self, ticker: str, start, end) -> bool:
+        lo, hi = self._range(ticker, start, end)
+        return hi > lo
+
+    def total_in(self, ticker: str, start, end) -> float:
+        lo, hi = self._range(ticker, start, end)
+        return float(self._cum[hi] - self._cum[lo]) if hi > lo else 0.0
+
+    def for_ticker(self, ticker: str) -> pd.DataFrame:
+        """1銘柄分の配当を date / dividend の表で返す。"""
+        span = self._span(ticker) or (0, 0)
+        a, b = span
+        return pd.DataFrame({"date": pd.to_datetime(self.dates[a:b]), "dividend": self.amounts[a:b]})
+
+    def to_long(self) -> pd.DataFrame:
+        names = np.repeat(np.array(self.tickers, dtype=object), np.diff(self.offsets))
+        return pd.DataFrame({"ticker": names, "date": pd.to_datetime(self.dates), "dividend": self.amounts})
+
+    def last_dates(self) -> dict[str, np.datetime64]:
+        """銘柄ごとの最後の権利落ち日（配当が1件も無い銘柄は含まない）。"""
+        sizes = np.diff(self.offsets)
+        has = np.flatnonzero(sizes > 0)
+        return dict(zip((self.tickers[i] for i in has), self.dates[self.offsets[has + 1] - 1]))
+
+    def merge_newer(self, long: pd.DataFrame) -> tuple["DividendIndex", int]:
+        """
+        ticker / date / dividend の縦持ち表のうち、銘柄ごとに保存済みの最後の権利落ち日より新しい行だけを足す。
+        保存済みの行は書き換えない（取り直した過去分が少し違っていても、前の値のまま）。
+        return: (足したあとの索引, 足した件数)
+        """
+        if long.empty:
+            return self, 0
+        dates = _to_days(long["date"])
+        last = pd.Series(self.last_dates(), dtype="datetime64[ns]")
+        stored = last.reindex(long["ticker"].astype(str)).to_numpy(dtype="datetime64[D]")
+        newer = ~np.isnat(dates) & (np.isnat(stored) | (dates > stored))
+        if not newer.any():
+            return self, 0
+        add = pd.DataFrame({
+            "ticker": long["ticker"].astype(str).to_numpy()[newer],
+            "date": dates[newer],
+            "dividend": pd.to_numeric(long["dividend"], errors="coerce").fillna(0.0).to_numpy(dtype=np.float64)[newer],
+        })
+        add = add.drop_duplicates(["ticker", "date"], keep="last")
+        merged = pd.concat([self.to_long(), add], ignore_index=True)
+        merged["date"] = merged["date"].to_numpy(dtype="datetime64[D]")
+        return DividendIndex.from_long(merged), len(add)
+
+
+def save_dividend_store(index: DividendIndex, path: str | Path = DIVIDENDS_PATH) -> None:
+    """一時ファイルに書いてから置き換える（読み手が書きかけを見ないように）。"""
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(
+            f,
+            tickers=np.array(index.tickers, dtype=str),
+            offsets=index.offsets,
+            dates=index.dates,
+            amounts=index.amounts,
+        )
+    os.replace(tmp, path)
+
+
+def load_dividend_index(path: str | Path = DIVIDENDS_PATH) -> DividendIndex | None:
+    """ストアを読み込む。無ければ None。"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    with np.load(path, allow_pickle=False) as z:
+        return DividendIndex(z["tickers"].tolist(), z["offsets"], z["dates"], z["amounts"])
+
+
+_FRAME_CACHE: dict[int, tuple[weakref.ref, DividendIndex]] = {}
+
+
+def dividend_index_for(dividends) -> DividendIndex | None:
+    """
+    DividendIndex か配当DataFrameを受け取り、DividendIndex を返す。
+    DataFrame の場合は同じオブジェクトに対して1回だけ変換し、以後は使い回す。
+    """
+    if dividends is None or isinstance(dividends, DividendIndex):
+        return dividends
+
+    key = id(dividends)
+    hit = _FRAME_CACHE.get(key)
+    if hit is not None and hit[0]() is dividends:
+        return hit[1]
+
+    index = DividendIndex.from_frame(dividends)
+    _FRAME_CACHE[key] = (weakref.ref(dividends), index)
+    weakref.finalize(dividends, _FRAME_CACHE.pop, key, None)
+    return index
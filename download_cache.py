@@ -0,0 +1,122 @@
+# 説明: yfinance の取得結果（生の表）をディスクに保存しておくキャッシュ。同じ (Ticker集合, 期間, 足) の取得は有効期限内ならディスクから返す。
+# 入力方法: fetch_engine.source_downloader(cache=...) や配当取得から使う。`python download_cache.py --clear` でキャッシュを全部消す。
+# 出力されるモノ: リポジトリ直下の `yf_cache/`（キーの sha1 をファイル名にした .pkl）。
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Callable
+
+import pandas as pd
+
+CACHE_DIR = Path(__file__).resolve().with_name("yf_cache")
+
+# 有効期限（秒）
+PRICE_TTL_SEC = 12 * 3600
+# 当日分を含む取得は引け前の途中の値が入ることがあるので短めにする
+RECENT_TTL_SEC = 3600
+DIVIDEND_TTL_SEC = 24 * 3600
+
+
+def cache_key(kind: str, tickers, **params) -> str:
+    """
+    取得内容からキーを作る。Tickerは順番によらず同じキーになる（集合として扱う）。
+    kind: "download" / "dividends" など、取得の種類
+    params: period / start / end / interval など（None は無視）
+    """
+    payload = {
+        "kind": kind,
+        "tickers": sorted({str(t) for t in tickers}),
+        "params": {k: str(v) for k, v in sorted(params.items()) if v is not None},
+    }
+    return hashlib.sha1(json.dumps(payload, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+class DownloadCache:
+    """
+    キーごとに1ファイル（pickle）で保存する。
+    - get(key)            : 期限内なら保存した値、無い/期限切れなら None
+    - fetch(key, fetcher) : キャッシュに無ければ fetcher() を呼んで保存してから返す
+    空の結果や例外はキャッシュしない（再実行時にはネットワークへ取りに行く）。
+    """
+
+    def __init__(self, cache_dir: str | Path = CACHE_DIR, ttl: float = PRICE_TTL_SEC):
+        self.cache_dir = Path(cache_dir)
+        self.ttl = ttl
+
+    def path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.pkl"
+
+    def get(self, key: str):
+        p = self.path(key)
+        try:
+            if time.time() - p.stat().st_mtime > self.ttl:
+                return None
+            return pd.read_pickle(p)
+        except Exception:
+            # 無い・壊れている場合は取り直す
+            return None
+
+    def put(self, key: str, value) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        p = self.path(key)
+        # 同時に書く取得スレッドがあっても混ざらないよう、一時ファイル名をスレッドごとに分ける
+        tmp = p.with_name(f"{p.name}.{os.getpid()}_{threading.get_ident()}.tmp")
+        pd.to_pickle(value, tmp)
+        os.replace(tmp, p)
+
+    def fetch(self, key: str, fetcher: Callable[[], object]):
+        hit = self.get(key)
+        if hit is not None:
+            return hit
+        value = fetcher()
+        if value is not None and len(value):
+            self.put(key, value)
+        return value
+
+    def clear(self) -> int:
+        """キャッシュを全部消す。return: 消したファイル数"""
+        n = 0
+        for p in self.cache_dir.glob("*.pkl"):
+            p.unlink(missing_ok=True)
+            n += 1
+        return n
+
+
+def cached_dividends(ticker: str, cache: DownloadCache | None = None, source=None) -> pd.Series:
+    """
+    配当（yf.Ticker(ticker).dividends と同じ形）をキャッシュ経由で返す（index=権利落ち日, 値=1株あたり配当）。
+    シミュレーションを何度実行しても、期限内ならネットワークには行かない。
+    source: 取得元（price_source.PriceSource。省略時は get_source() = 既定で yfinance）
+    """
+    from price_source import get_source
+
+    if cache is None:
+        cache = DownloadCache(ttl=DIVIDEND_TTL_SEC)
+    if source is None:
+        source = get_source()
+    return cache.fetch(cache_key("dividends", [ticker], source=source.name), lambda: source.dividends(ticker))
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="yfinance の取得キャッシュを管理します。")
+    ap.add_argument("--clear", action="store_true", help="キャッシュを全部消す")
+    args = ap.parse_args()
+
+    cache = DownloadCache()
+    if args.clear:
+        print(f"【削除】キャッシュを {cache.clear()} 件削除しました: {cache.cache_dir}")
+        return
+    files = list(cache.cache_dir.glob("*.pkl"))
+    size = sum(p.stat().st_size for p in files)
+    print(f"【結果】キャッシュ: {len(files)} 件、{size / 1e6:.1f} MB（{cache.cache_dir}）")
+
+
+if __name__ == "__main__":
+    main()
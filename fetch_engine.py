@@ -0,0 +1,378 @@
+# 説明: 株価ダウンロードの共通エンジン。チャンクを同時に複数取得し、失敗したチャンクは間隔を空けて再試行、それでも取れなかったTickerは1銘柄ずつ取り直す。
+#       チャンクの大きさと同時実行数は、かかった時間と失敗の多さを見ながら増減させる（ChunkScheduler）。
+# 入力方法: get_price.py / add_price.py から `from fetch_engine import fetch_wide, source_downloader` として使う（単体実行はしない）。
+#           結果をチャンクごとに受け取りたいときは fetch_stream(..., on_chunk=...) を使う。
+#           取得処理は downloader（Tickerのリストを受け取り yf.download と同じ形の表を返す関数）として渡すので、ネットワーク無しでも差し替えて動かせる。
+# 出力されるモノ: なし（終値・始値などのワイド表を返すだけ）。
+
+from __future__ import annotations
+
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, NamedTuple
+
+import pandas as pd
+
+from download_cache import DownloadCache, cache_key
+from price_source import PriceSource, get_source
+
+# yfinance の列名 → ストアの項目名（終値以外）
+FIELD_COLUMNS = {"open": "Open", "high": "High", "low": "Low", "volume": "Volume"}
+
+# 同時に取りに行くチャンク数の初期値（多すぎると Yahoo 側で弾かれやすい）
+MAX_WORKERS = 4
+# ChunkScheduler が調整する範囲
+MIN_CHUNK_SIZE = 5
+MAX_CHUNK_SIZE = 100
+WORKERS_LIMIT = 8
+# 1チャンクの取得にかかってよい時間の目安（これを超えたらチャンクを小さくする）
+TARGET_CHUNK_SEC = 15.0
+# 例外が出たチャンクの再試行回数と待ち時間（1回目 BACKOFF_SEC 秒、以後倍々）
+RETRIES = 2
+BACKOFF_SEC = 1.0
+
+Downloader = Callable[[list[str]], "pd.DataFrame | None"]
+
+
+def source_downloader(source: PriceSource | None = None, cache: DownloadCache | None = None, **kwargs) -> Downloader:
+    """
+    取得元（省略時は get_source() = 既定で yfinance）から取る downloader を返す。
+    kwargs は period / start / end / interval など。
+    cache: 指定すると同じ (取得元, Ticker集合, kwargs) の取得結果をディスクから返す
+    返す downloader は fetch_stream の複数スレッドから同時に呼ばれる（取得元の download は同時に呼んでも安全であること）
+    """
+    if source is None:
+        source = get_source()
+
+    def download(chunk: list[str]) -> pd.DataFrame | None:
+        return source.download(chunk, **kwargs)
+
+    if cache is None:
+        return download
+
+    def cached_download(chunk: list[str]) -> pd.DataFrame | None:
+        key = cache_key("download", chunk, source=source.name, **kwargs)
+        return cache.fetch(key, lambda: download(chunk))
+
+    return cached_download
+
+
+class FetchResult(NamedTuple):
+    """close: index=Ticker, columns=YYYY-MM-DD / failed: 取れなかったTicker / fields: 終値以外 {"open": ワイド表, ...}"""
+    close: pd.DataFrame
+    failed: list[str]
+    fields: dict[str, pd.DataFrame]
+
+
+def _to_wide(frame, chunk: list[str]) -> pd.DataFrame:
+    """yfinance の1項目分（行=日付, 列=Ticker）を ワイド（行=Ticker, 列=YYYY-MM-DD）にする。"""
+    # 1銘柄だとSeriesになることがある
+    if isinstance(frame, pd.Series):
+        # この場合、成功していればその銘柄名で列名を付ける
+        frame = frame.to_frame(name=chunk[0])
+    frame = frame.copy()
+    frame.columns = frame.columns.astype(str)
+    frame.index = pd.to_datetime(frame.index).strftime("%Y-%m-%d")
+    return frame.T
+
+
+def _download_with_retry(
+    download: Downloader,
+    chunk: list[str],
+    retries: int,
+    backoff: float,
+    sleep: Callable[[float], None],
+) -> tuple[pd.DataFrame | None, Exception | None, int]:
+    """例外が出たら待ってから取り直す。return: (取得結果, 最後の例外, 試した回数)"""
+    error: Exception | None = None
+    for attempt in range(retries + 1):
+        if attempt:
+            sleep(backoff * 2 ** (attempt - 1))
+        try:
+            return download(chunk), None, attempt + 1
+        except Exception as e:
+            error = e
+    return None, error, retries + 1
+
+
+class _Collected(NamedTuple):
+    close: pd.DataFrame | None
+    fields: dict[str, pd.DataFrame]
+    retry: list[str]  # 1銘柄ずつ取り直す対象
+
+
+def _split(data: pd.DataFrame | None, chunk: list[str], empty_ok: bool, error: Exception | None = None) -> _Collected:
+    """
+    1回分の取得結果を終値・その他の項目・取り直し対象に分ける。
+    error: 再試行後も残った例外。例外で取れなかったのは「データが無い」のではないので、empty_ok に関係なく全部取り直し対象にする
+    """
+    if error is not None:
+        return _Collected(None, {}, list(chunk))
+    if data is None or data.empty:
+        # 休場日だけの範囲なら空で正常（add_price の差分取得など）
+        return _Collected(None, {}, [] if empty_ok else list(chunk))
+
+    try:
+        close = data["Close"]
+    except Exception:
+        return _Collected(None, {}, list(chunk))
+
+    wide = _to_wide(close, chunk)
+    returned = set(wide.index)
+    retry = [t for t in chunk if t not in returned]
+
+    # 全部NaNのTickerも取り直し対象
+    all_nan = wide.isna().all(axis=1)
+    retry += wide.index[all_nan].tolist()
+    wide = wide.loc[~all_nan]
+
+    fields: dict[str, pd.DataFrame] = {}
+    for field, col in FIELD_COLUMNS.items():
+        try:
+            fields[field] = _to_wide(data[col], chunk).reindex(wide.index)
+        except KeyError:
+            pass
+    return _Collected(wide, fields, retry)
+
+
+def _concat(parts: list[pd.DataFrame]) -> pd.DataFrame:
+    out = pd.concat(parts, axis=0) if parts else pd.DataFrame()
+    out = out[~out.index.duplicated(keep="first")]
+    return out.sort_index().reindex(sorted(out.columns), axis=1)
+
+
+def _combine(closes: list[pd.DataFrame], field_parts: dict[str, list[pd.DataFrame]], failed: list[str]) -> FetchResult:
+    close = _concat(closes)
+    fields = {
+        field: _concat(frames).reindex(index=close.index, columns=close.columns)
+        for field, frames in field_parts.items()
+        if frames
+    }
+    return FetchResult(close, sorted(set(map(str, failed))), fields)
+
+
+class _ChunkOutcome(NamedTuple):
+    result: FetchResult
+    error: Exception | None  # 再試行後も残った例外
+    retried: list[str]  # 1銘柄ずつ取り直したTicker
+    attempts: int  # チャンクとしての取得を試した回数（1 なら一発で成功）
+    seconds: float  # チャンクとしての取得にかかった時間（再試行の待ちを含む、1銘柄ずつの取り直しは含まない）
+
+
+def _fetch_chunk(
+    chunk: list[str],
+    download: Downloader,
+    retries: int,
+    backoff: float,
+    sleep: Callable[[float], None],
+    empty_ok: bool,
+    refetch_single: bool,
+) -> _ChunkOutcome:
+    """1チャンク分を取得する（取れなかったTickerの1銘柄ずつの取り直しまで含む）。"""
+    closes: list[pd.DataFrame] = []
+    field_parts: dict[str, list[pd.DataFrame]] = {f: [] for f in FIELD_COLUMNS}
+    failed: list[str] = []
+
+    def collect(got: _Collected) -> None:
+        if got.close is not None and len(got.close):
+            closes.append(got.close)
+            for field, frame in got.fields.items():
+                field_parts[field].append(frame)
+
+    t0 = time.perf_counter()
+    data, error, attempts = _download_with_retry(download, chunk, retries, backoff, sleep)
+    seconds = time.perf_counter() - t0
+    got = _split(data, chunk, empty_ok, error)
+    collect(got)
+
+    retry = list(dict.fromkeys(got.retry))
+    for t in retry:
+        if not refetch_single:
+            failed.append(t)
+            continue
+        data, single_error, _ = _download_with_retry(download, [t], retries, backoff, sleep)
+        # チャンクが例外で取れなかったTickerは、1銘柄で取れて空なら empty_ok に従う
+        # （チャンクで他の銘柄は返ってきたのに無かったTickerは、空なら失敗）
+        single = _split(data, [t], empty_ok=empty_ok and error is not None, error=single_error)
+        collect(single)
+        if single.retry:
+            failed.append(t)
+    return _ChunkOutcome(_combine(closes, field_parts, failed), error, retry, attempts, seconds)
+
+
+class ChunkScheduler:
+    """
+    1回に取る銘柄数（chunk_size）と同時実行数（workers）を、取得の様子から調整する。
+    - 例外が出た / 取れないTickerが多かった: 銘柄数を半分、同時実行数を1減らす
+    - 目標時間（target_sec）を超えた: 銘柄数を3/4に
+    - 一発で目標時間内に取れたことが grow_after 回続いた: 銘柄数を1.5倍、同時実行数を1増やす
+    adaptive=False なら最初の値のまま（従来どおりの固定チャンク）。
+    """
+
+    def __init__(
+        self,
+        chunk_size: int = 40,
+        workers: int = MAX_WORKERS,
+        min_chunk: int = MIN_CHUNK_SIZE,
+        max_chunk: int = MAX_CHUNK_SIZE,
+        max_workers: int = WORKERS_LIMIT,
+        target_sec: float = TARGET_CHUNK_SEC,
+        missing_tolerance: float = 0.2,
+        grow_after: int = 2,
+        adaptive: bool = True,
+    ):
+        self.chunk_size = chunk_size
+        self.workers = max(1, workers)
+        self.min_chunk = min(min_chunk, chunk_size)
+        self.max_chunk = max(max_chunk, chunk_size)
+        self.max_workers = max(max_workers, self.workers)
+        self.target_sec = target_sec
+        self.missing_tolerance = missing_tolerance
+        self.grow_after = grow_after
+        self.adaptive = adaptive
+
+        self.tickers_done = 0
+        self.chunks_done = 0
+        self.errors = 0
+        self._healthy = 0
+        self._t0: float | None = None
+
+    def start(self) -> None:
+        if self._t0 is None:
+            self._t0 = time.perf_counter()
+
+    @property
+    def elapsed(self) -> float:
+        return time.perf_counter() - self._t0 if self._t0 is not None else 0.0
+
+    @property
+    def throughput(self) -> float:
+        """ここまでの銘柄/秒。"""
+        return self.tickers_done / self.elapsed if self.elapsed > 0 else 0.0
+
+    def record(self, n_tickers: int, seconds: float, attempts: int, n_missing: int) -> None:
+        """1チャンクの結果を記録し、次からの銘柄数・同時実行数を決める。"""
+        self.tickers_done += n_tickers
+        self.chunks_done += 1
+        troubled = attempts > 1 or n_missing > self.missing_tolerance * n_tickers
+        if troubled:
+            self.errors += 1
+        if not self.adaptive:
+            return
+
+        if troubled:
+            self._healthy = 0
+            self.chunk_size = max(self.min_chunk, self.chunk_size // 2)
+            self.workers = max(1, self.workers - 1)
+        elif seconds > self.target_sec:
+            self._healthy = 0
+            self.chunk_size = max(self.min_chunk, self.chunk_size * 3 // 4)
+        else:
+            self._healthy += 1
+            if self._healthy >= self.grow_after:
+                self._healthy = 0
+                self.chunk_size = min(self.max_chunk, self.chunk_size * 3 // 2)
+                self.workers = min(self.max_workers, self.workers + 1)
+
+    def summary(self) -> str:
+        return (
+            f"{self.tickers_done} 銘柄 / {self.elapsed:.1f} 秒 = {self.throughput:.1f} 銘柄/秒"
+            f"（チャンク {self.chunks_done} 回、うち不調 {self.errors} 回、最終: {self.chunk_size} 銘柄 x {self.workers} 本）"
+        )
+
+
+def fetch_stream(
+    tickers: list[str],
+    download: Downloader,
+    on_chunk: Callable[[list[str], FetchResult], None],
+    scheduler: ChunkScheduler | None = None,
+    retries: int = RETRIES,
+    backoff: float = BACKOFF_SEC,
+    empty_ok: bool = False,
+    refetch_single: bool = True,
+    sleep: Callable[[float], None] = time.sleep,
+    label: str = "",
+) -> ChunkScheduler:
+    """
+    tickers を scheduler の決める大きさ・本数で取得し、終わった順に on_chunk(そのチャンクのTicker, 結果) を呼ぶ。
+    結果はここでは溜めないので、on_chunk で保存して捨てればメモリは数チャンク分で済む。
+    - 例外が出たチャンクは retries 回まで待ち時間を倍にしながら取り直す
+    - それでも取れなかったTicker・返ってこなかったTicker・全部NaNのTickerは1銘柄ずつ取り直す
+    empty_ok: 取得は成功したが空だった結果を「その期間にデータが無い」とみなす（失敗扱いにしない）。例外で取れなかったものは常に取り直し・失敗扱い
+    label: 進捗表示に添える文字列（期間など）
+    return: 使った scheduler（速度などの記録が入っている）
+    """
+    if scheduler is None:
+        scheduler = ChunkScheduler()
+    suffix = f"（{label}）" if label else ""
+    queue = deque(tickers)
+    pending: dict = {}
+
+    with ThreadPoolExecutor(max_workers=scheduler.max_workers) as pool:
+        def submit() -> None:
+            while queue and len(pending) < scheduler.workers:
+                chunk = [queue.popleft() for _ in range(min(scheduler.chunk_size, len(queue)))]
+                fut = pool.submit(_fetch_chunk, chunk, download, retries, backoff, sleep, empty_ok, refetch_single)
+                pending[fut] = chunk
+
+        scheduler.start()
+        submit()
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                chunk = pending.pop(fut)
+                out: _ChunkOutcome = fut.result()
+                scheduler.record(len(chunk), out.seconds, out.attempts, len(out.retried))
+                print(
+                    f"【取得中】{scheduler.tickers_done} / {len(tickers)} 銘柄"
+                    f"（{len(chunk)} 銘柄を {out.seconds:.1f} 秒、{scheduler.throughput:.1f} 銘柄/秒）{suffix}"
+                )
+                if out.error is not None:
+                    print("【株価取得エラー】yfinance取得で例外が発生しました（再試行後も失敗）。")
+                    print(f"  対象（先頭10）: {chunk[:10]}")
+                    print(f"  エラー内容: {repr(out.error)}")
+                if out.retried and refetch_single:
+                    print(f"【再取得】取れなかった {len(out.retried)} 銘柄を1銘柄ずつ取り直しました（残った失敗: {len(out.result.failed)}）。")
+                on_chunk(chunk, out.result)
+            submit()
+
+    print(f"【速度】{scheduler.summary()}")
+    return scheduler
+
+
+def fetch_wide(
+    tickers: list[str],
+    download: Downloader,
+    chunk_size: int,
+    max_workers: int = MAX_WORKERS,
+    retries: int = RETRIES,
+    backoff: float = BACKOFF_SEC,
+    empty_ok: bool = False,
+    refetch_single: bool = True,
+    sleep: Callable[[float], None] = time.sleep,
+    label: str = "",
+    adaptive: bool = True,
+) -> FetchResult:
+    """
+    tickers を同時に取得し、1つの表にまとめて返す（引数は fetch_stream と同じ）。
+    chunk_size / max_workers は最初の値で、adaptive=True なら取得の様子を見て増減させる。
+    """
+    closes: list[pd.DataFrame] = []
+    field_parts: dict[str, list[pd.DataFrame]] = {f: [] for f in FIELD_COLUMNS}
+    failed: list[str] = []
+
+    def collect(_chunk: list[str], res: FetchResult) -> None:
+        if len(res.close):
+            closes.append(res.close)
+            for field, frame in res.fields.items():
+                field_parts[field].append(frame)
+        failed.extend(res.failed)
+
+    fetch_stream(
+        tickers, download, collect,
+        scheduler=ChunkScheduler(chunk_size, workers=max_workers, adaptive=adaptive),
+        retries=retries, backoff=backoff, empty_ok=empty_ok,
+        refetch_single=refetch_single, sleep=sleep, label=label,
+    )
+    return _combine(closes, field_parts, failed)
@@ -1,20 +1,40 @@
-# 説明: 複数銘柄の終値を yfinance から取得してワイド形式CSV (`prices_close_wide.csv`) を作成/更新するスクリプト。
-# 入力方法: リポジトリに置いた本スクリプトを `python3 get_price.py` で実行。
-# 出力されるモノ: `prices_close_wide.csv` を生成/上書き（行=Ticker, 列=YYYY-MM-DD）。取得状況は標準出力に表示。
+# 説明: 複数銘柄の株価（始値・高値・安値・終値・出来高）を yfinance から取得し、終値のワイド形式CSV (`prices_close_wide.csv`) とストアを作成/更新するスクリプト。
+# 入力方法: リポジトリに置いた本スクリプトを `python3 get_price.py` で実行。途中で止まったときは `python3 get_price.py --resume` で取得済みのチャンクを飛ばして再開。
+# 出力されるモノ: `prices_close_wide.csv` を生成/上書き（行=Ticker, 列=YYYY-MM-DD）し、終値と始値・高値・安値・出来高を `prices_store/` に保存。取得状況は標準出力に表示。
 
 # こっちはほぼほぼ使わないという感じ
 
 from __future__ import annotations
+import argparse
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
 import pandas as pd
-import yfinance as yf
+
+from download_cache import DownloadCache
+from fetch_engine import ChunkScheduler, FetchResult, fetch_stream, source_downloader
+from price_source import SOURCES, get_source
+from price_store import EXTRA_FIELDS, save_close_blocks, store_dir_for
 
 PERIOD = "15y"
 INTERVAL = "1d"
+# 取得のチャンクの大きさ・同時数の初期値（取得中は fetch_engine.ChunkScheduler が増減させる）
 CHUNK_SIZE = 40
+MAX_WORKERS = 4
+
+# CSVを書き出すときに一度に組み立てる銘柄数
+CSV_BATCH = 40
 
 # ★出力ファイル名は直書き（OUT_CSV未定義問題を回避）
 OUT_CSV = "prices_close_wide.csv"
 
+# 取得し終わったチャンクの置き場（出力CSVと同じフォルダに置く。全部そろってCSV・ストアを作ったら消す）
+CHECKPOINT_DIR_NAME = "prices_rebuild"
+
 TICKERS_TEXT = """
 1332.T
 1605.T
@@ -254,96 +274,214 @@ def parse_tickers(text: str) -> list[str]:
             seen.add(t)
     return out
 
-def fetch_close_wide_1y(tickers: list[str]) -> tuple[pd.DataFrame, list[str]]:
-    parts: list[pd.DataFrame] = []
-    failed: list[str] = []
+class ChunkCheckpoint(NamedTuple):
+    """保存済みの1チャンク分（値は必要になったときに memmap で読む）。"""
+    path: Path
+    tickers: list[str]
+    dates: list[str]
+    fields: list[str]
+    failed: list[str]
+    requested: list[str]  # 取得を頼んだTicker（取れなかったものも含む）
 
-    for i in range(0, len(tickers), CHUNK_SIZE):
-        chunk = tickers[i:i + CHUNK_SIZE]
-        print(f"【取得中】{i+1}〜{min(i+CHUNK_SIZE, len(tickers))} / {len(tickers)} 銘柄（期間={PERIOD}）")
+    def values(self, field: str) -> np.ndarray:
+        return np.load(self.path / f"{field}.npy", mmap_mode="r")
+
+
+def checkpoint_dir_for(csv_path: str | Path = OUT_CSV) -> Path:
+    """出力CSVと同じフォルダにある途中経過の置き場（実行した場所によらない）。"""
+    return Path(csv_path).with_name(CHECKPOINT_DIR_NAME)
 
-        try:
-            data = yf.download(
-                tickers=chunk,
-                period=PERIOD,
-                interval=INTERVAL,
-                progress=False,
-                threads=True,
-            )
-        except Exception as e:
-            print("【株価取得エラー】yfinance取得で例外が発生しました。")
-            print(f"  対象（先頭10）: {chunk[:10]}")
-            print(f"  エラー内容: {repr(e)}")
-            failed.extend(chunk)
-            continue
 
-        if data is None or data.empty:
-            print("【株価取得エラー】データが空でした。")
-            failed.extend(chunk)
+def chunk_dir(root: Path, i: int) -> Path:
+    return root / f"chunk_{i:05d}"
+
+
+def save_checkpoint(root: Path, i: int, requested: list[str], res: FetchResult) -> None:
+    """
+    取得し終わったチャンクを i 番目として保存する（i は取得し終わった順の通し番号。チャンクの大きさは毎回変わりうる）。
+    一時フォルダに書いてから名前を確定するので、途中で落ちても半端なチャンクは「取得済み」にならない。
+    """
+    final = chunk_dir(root, i)
+    tmp = final.with_name(final.name + ".tmp")
+    shutil.rmtree(tmp, ignore_errors=True)
+    tmp.mkdir(parents=True)
+
+    np.save(tmp / "close.npy", res.close.to_numpy(dtype=np.float64))
+    for field, frame in res.fields.items():
+        np.save(tmp / f"{field}.npy", frame.to_numpy(dtype=np.float32))
+    meta = {
+        "tickers": list(map(str, res.close.index)),
+        "dates": list(map(str, res.close.columns)),
+        "fields": list(res.fields),
+        "failed": res.failed,
+        "requested": list(requested),
+    }
+    (tmp / "meta.json").write_text(json.dumps(meta, ensure_ascii=False), encoding="utf-8")
+
+    shutil.rmtree(final, ignore_errors=True)
+    os.replace(tmp, final)
+
+
+def load_checkpoints(root: Path) -> list[ChunkCheckpoint]:
+    """保存済みのチャンクを番号順に読む（書きかけの .tmp は無視する）。"""
+    out = []
+    for path in sorted(root.glob("chunk_*")):
+        if path.suffix == ".tmp" or not (path / "meta.json").exists():
             continue
+        meta = json.loads((path / "meta.json").read_text(encoding="utf-8"))
+        out.append(ChunkCheckpoint(
+            path, meta["tickers"], meta["dates"], meta["fields"], meta["failed"], meta["requested"],
+        ))
+    return out
+
 
-        # Closeだけ抜く
+def prepare_checkpoints(root: Path, plan: dict, resume: bool) -> list[ChunkCheckpoint]:
+    """
+    resume=True で前回と同じ条件なら、保存済みのチャンクを返す（そのTickerは取り直さない）。
+    それ以外は途中経過を消して最初から取る。
+    """
+    plan_path = root / "plan.json"
+    if resume:
         try:
-            close = data["Close"]
-        except Exception as e:
-            print("【株価取得エラー】'Close'列が取得できませんでした。")
-            print(f"  エラー内容: {repr(e)}")
-            failed.extend(chunk)
-            continue
+            same = json.loads(plan_path.read_text(encoding="utf-8")) == plan
+        except (OSError, ValueError):
+            same = False
+        if same:
+            done = load_checkpoints(root)
+            n_done = sum(len(p.requested) for p in done)
+            print(f"【再開】取得済みの {n_done} / {len(plan['tickers'])} 銘柄（{len(done)} チャンク）を使います: {root}")
+            return done
+        print("【注意】再開できる途中経過がありません（または対象・期間が変わりました）。最初から取得します。")
+
+    shutil.rmtree(root, ignore_errors=True)
+    root.mkdir(parents=True)
+    plan_path.write_text(json.dumps(plan, ensure_ascii=False), encoding="utf-8")
+    return []
+
+
+class _Assembly(NamedTuple):
+    tickers: list[str]
+    dates: list[str]
+    fields: list[str]
+    rows: list[np.ndarray]  # チャンクごと: 各Tickerの全体での行番号
+    cols: list[np.ndarray]  # チャンクごと: 各日付の全体での列番号（昇順）
+
+
+def assemble_plan(parts: list[ChunkCheckpoint]) -> _Assembly:
+    """全チャンクの Ticker・日付を合わせた並び（Ticker昇順・日付昇順）と、チャンクごとの位置を求める。"""
+    tickers = sorted({t for p in parts for t in p.tickers})
+    dates = sorted({d for p in parts for d in p.dates})
+    fields = sorted({f for p in parts for f in p.fields}, key=EXTRA_FIELDS.index)
+    t_index, d_index = pd.Index(tickers), pd.Index(dates)
+    rows = [t_index.get_indexer(p.tickers) for p in parts]
+    cols = [d_index.get_indexer(p.dates) for p in parts]
+    return _Assembly(tickers, dates, fields, rows, cols)
 
-        # 1銘柄だとSeriesになることがある
-        if isinstance(close, pd.Series):
-            # この場合、成功していればその銘柄名で列名を付ける
-            close = close.to_frame(name=chunk[0])
 
-        # yfinanceが返した列（成功したTicker）を確認
-        returned_cols = set(map(str, close.columns))
-        missing_cols = [t for t in chunk if t not in returned_cols]
-        if missing_cols:
-            print("【注意】このチャンクで取得できなかったTickerがあります（yfinance側エラーの可能性）:")
-            print("  " + ", ".join(missing_cols))
-            failed.extend(missing_cols)
+def _first_owner(parts: list[ChunkCheckpoint]) -> dict[str, tuple[int, int]]:
+    """Ticker → (チャンク番号, その中の行)。同じTickerが複数のチャンクにあるときは最初のものを使う（従来の keep="first" と同じ）。"""
+    owner: dict[str, tuple[int, int]] = {}
+    for k, p in enumerate(parts):
+        for r, t in enumerate(p.tickers):
+            owner.setdefault(t, (k, r))
+    return owner
 
-        # 日付列を "YYYY-MM-DD" に統一してワイド化（縦=Ticker 横=Date）
-        close.index = pd.to_datetime(close.index).strftime("%Y-%m-%d")
-        wide = close.T
 
-        # 全部NaNのTickerも失敗扱い
-        all_nan = wide.isna().all(axis=1)
-        nan_failed = wide.index[all_nan].tolist()
-        if nan_failed:
-            print("【注意】終値が全て欠損のTickerがあります（取得失敗/取引停止などの可能性）:")
-            print("  " + ", ".join(map(str, nan_failed)))
-            failed.extend(map(str, nan_failed))
-            wide = wide.loc[~all_nan]
+def write_csv_from_checkpoints(parts: list[ChunkCheckpoint], plan: _Assembly, path: str) -> None:
+    """終値CSVを CSV_BATCH 銘柄ずつ書き出す（全銘柄分を一度にメモリへ載せない）。"""
+    owner = _first_owner(parts)
+    tmp = f"{path}.tmp"
+    with open(tmp, "w", encoding="utf-8-sig", newline="") as f:
+        for a in range(0, len(plan.tickers), CSV_BATCH):
+            names = plan.tickers[a:a + CSV_BATCH]
+            block = np.full((len(names), len(plan.dates)), np.nan)
+            for j, t in enumerate(names):
+                k, r = owner[t]
+                block[j, plan.cols[k]] = parts[k].values("close")[r]
+            df = pd.DataFrame(block, index=pd.Index(names, name="Ticker"), columns=plan.dates)
+            # ★小数2桁で保存（表示の揺れ対策）
+            df.to_csv(f, header=(a == 0), float_format="%.2f")
+    os.replace(tmp, path)
 
-        parts.append(wide)
 
-    out = pd.concat(parts, axis=0) if parts else pd.DataFrame()
-    out = out[~out.index.duplicated(keep="first")]
-    out = out.sort_index().reindex(sorted(out.columns), axis=1)
+def save_store_from_checkpoints(parts: list[ChunkCheckpoint], plan: _Assembly, out_csv: str) -> None:
+    """ストアを月ごとに組み立てる（読むのは各チャンクのその月の列だけ。同じTickerが複数のチャンクにあれば最初のものを使う）。"""
+    owner = _first_owner(parts)
+    # チャンクごとに、そのチャンクの値を使うTickerの行だけを選んでおく
+    keep = [np.array([owner[t] == (k, r) for r, t in enumerate(p.tickers)], dtype=bool) for k, p in enumerate(parts)]
+
+    def read_block(field: str, s: int, e: int) -> np.ndarray:
+        out = np.full((len(plan.tickers), e - s), np.nan, dtype=np.float64 if field == "close" else np.float32)
+        for p, rows, cols, mine in zip(parts, plan.rows, plan.cols, keep):
+            if field != "close" and field not in p.fields:
+                continue
+            lo, hi = np.searchsorted(cols, [s, e])
+            if hi > lo and mine.any():
+                out[np.ix_(rows[mine], cols[lo:hi] - s)] = p.values(field)[mine, lo:hi]
+        return out
+
+    dates = pd.DatetimeIndex(pd.to_datetime(plan.dates, format="%Y-%m-%d"))
+    save_close_blocks(plan.tickers, dates, read_block, store_dir_for(out_csv), source_csv=out_csv, fields=plan.fields)
 
-    return out, sorted(set(failed))
 
 def main():
+    ap = argparse.ArgumentParser(description="株価を全期間取得し直して、CSVとストアを作り直します。")
+    ap.add_argument("--resume", action="store_true", help=f"前回途中で止まった取得を再開する（出力CSVと同じフォルダの {CHECKPOINT_DIR_NAME}/ の取得済みチャンクは取り直さない）")
+    ap.add_argument("--keep-checkpoints", action="store_true", help="完了後も取得済みチャンクを消さずに残す")
+    ap.add_argument("--source", choices=SOURCES, default=None, help="取得元（default: 環境変数 PRICE_SOURCE、無ければ yfinance）")
+    ap.add_argument("--out-csv", default=OUT_CSV, help=f"出力CSV（default: {OUT_CSV}。ストアはこのCSVと同じフォルダに作る）")
+    args = ap.parse_args()
+    source = get_source(args.source)
+    out_csv = args.out_csv
+    checkpoints = checkpoint_dir_for(out_csv)
+
     tickers = parse_tickers(TICKERS_TEXT)
     print(f"対象ティッカー数: {len(tickers)}")
 
-    close_wide, failed = fetch_close_wide_1y(tickers)
+    plan = {"tickers": tickers, "period": PERIOD, "interval": INTERVAL, "source": source.name}
+    done = prepare_checkpoints(checkpoints, plan, args.resume)
+    seq = max((int(p.path.name.split("_")[1]) for p in done), default=-1) + 1
+
+    # 取得し終わった順に保存する（メモリに残るのは取得中のチャンク分だけ）
+    requested = {t for p in done for t in p.requested}
+    todo = [t for t in tickers if t not in requested]
+    if todo:
+        def on_chunk(chunk: list[str], res: FetchResult) -> None:
+            nonlocal seq
+            save_checkpoint(checkpoints, seq, chunk, res)
+            seq += 1
 
-    if close_wide.empty:
+        fetch_stream(
+            todo,
+            # 途中で失敗して再実行したときは、取れていたチャンクをディスクから返す
+            source_downloader(source, cache=DownloadCache(), period=PERIOD, interval=INTERVAL),
+            on_chunk,
+            scheduler=ChunkScheduler(CHUNK_SIZE, workers=MAX_WORKERS),
+            label=f"期間={PERIOD}",
+        )
+
+    parts = load_checkpoints(checkpoints)
+    layout = assemble_plan(parts)
+    failed = sorted({t for p in parts for t in p.failed})
+
+    if not layout.tickers or not layout.dates:
         print("【致命的】取得結果が空でした。終了します。")
         return
 
-    # ★小数2桁で保存（表示の揺れ対策）
-    close_wide.to_csv(OUT_CSV, encoding="utf-8-sig", float_format="%.2f")
+    write_csv_from_checkpoints(parts, layout, out_csv)
+    print(f"【保存】CSVを保存しました: {out_csv}")
+
+    # 各スクリプトが読むのはこちら（CSVはエクスポート用）
+    save_store_from_checkpoints(parts, layout, out_csv)
+    print(f"【保存】ストアを保存しました: {store_dir_for(out_csv)}（終値 + {', '.join(layout.fields) or 'なし'}）")
+    print(f"【結果】行数（銘柄）={len(layout.tickers)}、列数（日付）={len(layout.dates)}")
 
-    print(f"【保存】CSVを保存しました: {OUT_CSV}")
-    print(f"【結果】行数（銘柄）={len(close_wide)}、列数（日付）={len(close_wide.columns)}")
+    if not args.keep_checkpoints:
+        shutil.rmtree(checkpoints, ignore_errors=True)
 
     if failed:
         print("【まとめ】取得できなかった可能性のあるTicker一覧:")
         print("  " + ", ".join(failed))
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
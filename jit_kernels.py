@@ -0,0 +1,252 @@
+# 説明: as-of 参照・RSRの計算・売買損益の計算カーネル。numba が入っていれば JIT コンパイルした版を、無ければ NumPy 版を自動で使う（どちらでも結果は1ビット違わず同じ）。
+# 入力方法: 各モジュールから `from jit_kernels import asof_lookup, rsr_kernel, buy_sell_pnl` として使う。環境変数 `RSR_BACKEND=numpy` で NumPy 版に固定できる。
+#           `python jit_kernels.py --check` で numba 版と NumPy 版の結果が一致するかを確認する（numba が無ければ NumPy 版だけ動かす）。
+# 出力されるモノ: なし（--check のときは一致したかどうかと速度を標準出力に表示）。
+
+from __future__ import annotations
+
+import argparse
+import importlib.util
+import os
+import time
+from functools import lru_cache
+
+import numpy as np
+
+# auto: numba があれば numba / numpy: 常に NumPy 版
+BACKEND_ENV = "RSR_BACKEND"
+# numba は任意（無ければ NumPy 版を使う）。import は重い（0.5秒ほど）ので、ここでは入っているかだけ見る
+HAS_NUMBA = importlib.util.find_spec("numba") is not None
+
+
+def _choose_backend() -> str:
+    want = os.environ.get(BACKEND_ENV, "auto").strip().lower()
+    if want == "numpy" or not HAS_NUMBA:
+        return "numpy"
+    return "numba"
+
+
+BACKEND = _choose_backend()
+
+
+# ===== NumPy 版 =====
+def _asof_lookup_numpy(last: np.ndarray, filled: np.ndarray, rows: np.ndarray, cols: np.ndarray):
+    ok = (rows >= 0) & (cols >= 0)
+    r, c = rows.clip(min=0), cols.clip(min=0)
+    used = np.where(ok, last[r, c], -1).astype(np.int64)
+    vals = np.where(used >= 0, filled[r, c], np.nan)
+    return vals, used
+
+
+def _rsr_numpy(picked: np.ndarray, wq1: float, wq2: float, wq3: float, wy1: float) -> np.ndarray:
+    p0, p1y, pq1, pq2, pq3 = picked.T
+    with np.errstate(divide="ignore", invalid="ignore"):
+        score = (
+            (((p0 - pq1) / pq1) * wq1)
+            + (((p0 - pq2) / pq2) * wq2)
+            + (((p0 - pq3) / pq3) * wq3)
+            + (((p0 - p1y) / p1y) * wy1)
+        ) * 100
+    ok = ~np.isnan(picked).any(axis=1) & (picked[:, 1:] != 0).all(axis=1)
+    return np.where(ok, score, np.nan)
+
+
+def _pnl_numpy(buy: np.ndarray, sell: np.ndarray, shares: np.ndarray):
+    cost = buy * shares
+    value = sell * shares
+    profit = value - cost
+    with np.errstate(divide="ignore", invalid="ignore"):
+        pct = profit / cost * 100.0
+    pct = np.where(cost == 0, np.nan, pct)
+    return cost, value, profit, pct
+
+
+# ===== numba 版（NumPy 版と同じ式・同じ順で計算する。fastmath は使わない） =====
+@lru_cache(maxsize=None)
+def _numba_kernels() -> dict | None:
+    """
+    numba 版を初めて使うときに numba を import してカーネルを作る（NumPy 版だけなら numba は読み込まない）。
+    入っていても import やコンパイルに失敗したとき（NumPy との版の食い違いなど）は、以後 NumPy 版を使い None を返す。
+    """
+    global BACKEND
+    try:
+        return _build_numba_kernels()
+    except Exception as e:
+        BACKEND = "numpy"
+        print(f"【注意】numba 版のカーネルを使えないので NumPy 版を使います: {e!r}")
+        return None
+
+
+def _build_numba_kernels() -> dict:
+    import numba
+
+    @numba.njit(cache=True)
+    def asof_lookup(last, filled, rows, cols):
+        n = rows.shape[0]
+        vals = np.empty(n, dtype=np.float64)
+        used = np.empty(n, dtype=np.int64)
+        for k in range(n):
+            r, c = rows[k], cols[k]
+            u = last[r, c] if r >= 0 and c >= 0 else -1
+            used[k] = u
+            vals[k] = filled[r, c] if u >= 0 else np.nan
+        return vals, used
+
+    @numba.njit(cache=True)
+    def rsr(picked, wq1, wq2, wq3, wy1):
+        n = picked.shape[0]
+        out = np.empty(n, dtype=np.float64)
+        for i in range(n):
+            p0, p1y, pq1, pq2, pq3 = picked[i, 0], picked[i, 1], picked[i, 2], picked[i, 3], picked[i, 4]
+            if (
+                np.isnan(p0) or np.isnan(p1y) or np.isnan(pq1) or np.isnan(pq2) or np.isnan(pq3)
+                or p1y == 0 or pq1 == 0 or pq2 == 0 or pq3 == 0
+            ):
+                out[i] = np.nan
+                continue
+            out[i] = (
+                (((p0 - pq1) / pq1) * wq1)
+                + (((p0 - pq2) / pq2) * wq2)
+                + (((p0 - pq3) / pq3) * wq3)
+                + (((p0 - p1y) / p1y) * wy1)
+            ) * 100
+        return out
+
+    @numba.njit(cache=True)
+    def pnl(buy, sell, shares):
+        n = buy.shape[0]
+        cost = np.empty(n, dtype=np.float64)
+        value = np.empty(n, dtype=np.float64)
+        profit = np.empty(n, dtype=np.float64)
+        pct = np.empty(n, dtype=np.float64)
+        for i in range(n):
+            cost[i] = buy[i] * shares[i]
+            value[i] = sell[i] * shares[i]
+            profit[i] = value[i] - cost[i]
+            pct[i] = np.nan if cost[i] == 0 else profit[i] / cost[i] * 100.0
+        return cost, value, profit, pct
+
+    # ここで1回動かしてコンパイルしておく（失敗するならここで分かる）。型は呼び出し側と同じ（last は int32）
+    last = np.zeros((1, 1), dtype=np.int32)
+    one = np.ones(1)
+    asof_lookup(last, np.ones((1, 1)), np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64))
+    rsr(np.ones((1, 5)), 0.0, 0.0, 0.0, 0.0)
+    pnl(one, one, one)
+    return {"asof_lookup": asof_lookup, "rsr": rsr, "pnl": pnl}
+
+
+def _impl(name: str, backend: str | None):
+    want = backend or BACKEND
+    if want == "numba":
+        kernels = _numba_kernels() if HAS_NUMBA else None
+        if kernels is not None:
+            return kernels[name]
+        if backend == "numba":
+            # numba 版を名指しされたとき（--check など）は黙って NumPy 版にしない
+            raise RuntimeError("numba 版のカーネルを使えません（pip install numba）。")
+    return globals()[f"_{name}_numpy"]
+
+
+# ===== 公開関数 =====
+def asof_lookup(last: np.ndarray, filled: np.ndarray, rows, cols, backend: str | None = None):
+    """
+    asof_index.AsofIndex.lookup の中身。行番号と「その日以前の列」の組（ブロードキャストできる形）をまとめて引く。
+    return: (値, 実際に値があった列番号 int64)。値が無い所は (NaN, -1)
+    """
+    rows, cols = np.broadcast_arrays(np.asarray(rows, dtype=np.int64), np.asarray(cols, dtype=np.int64))
+    shape = rows.shape
+    vals, used = _impl("asof_lookup", backend)(
+        np.asarray(last), np.asarray(filled, dtype=np.float64), np.ascontiguousarray(rows).ravel(), np.ascontiguousarray(cols).ravel(),
+    )
+    return vals.reshape(shape), used.reshape(shape)
+
+
+def rsr_kernel(picked: np.ndarray, weights: dict[str, float], backend: str | None = None) -> np.ndarray:
+    """rsr_engine.rsr_scores の中身。picked: Ticker x 5（基準日, 1年前, 3か月前, 6か月前, 9か月前）。"""
+    picked = np.ascontiguousarray(picked, dtype=np.float64).reshape(-1, 5)
+    return _impl("rsr", backend)(
+        picked, float(weights["q1"]), float(weights["q2"]), float(weights["q3"]), float(weights["y1"]),
+    )
+
+
+def buy_sell_pnl(buy, sell, shares=1.0, backend: str | None = None):
+    """
+    買値・売値・株数から (購入額, 売却額, 損益, 損益率%) を銘柄ごとにまとめて計算する。
+    購入額が0の銘柄の損益率は NaN。
+    """
+    buy, sell, shares = np.broadcast_arrays(
+        np.asarray(buy, dtype=np.float64), np.asarray(sell, dtype=np.float64), np.asarray(shares, dtype=np.float64),
+    )
+    shape = buy.shape
+    out = _impl("pnl", backend)(*(np.ascontiguousarray(a).ravel() for a in (buy, sell, shares)))
+    return tuple(a.reshape(shape) for a in out)
+
+
+# ===== 一致の確認 =====
+def _same(a: np.ndarray, b: np.ndarray) -> bool:
+    return a.dtype == b.dtype and a.shape == b.shape and np.array_equal(a, b, equal_nan=True)
+
+
+def check_parity(csv_path=None, n_pairs: int = 200_000, seed: int = 0) -> bool:
+    """
+    価格ストアの実データと乱数（NaN・0 を混ぜる）で、numba 版と NumPy 版の結果が1ビット違わず同じか確かめる。
+    numba が無ければ NumPy 版が動くことだけ確かめる。
+    """
+    from asof_index import AsofIndex
+    from price_store import CSV_PATH, load_close_wide
+    from rsr_engine import WEIGHTS
+
+    df = load_close_wide(csv_path or CSV_PATH)
+    asof = AsofIndex.from_frame(df)
+    rng = np.random.default_rng(seed)
+    n_t, n_d = asof.filled.shape
+
+    rows = rng.integers(-1, n_t, n_pairs)
+    cols = rng.integers(-1, n_d, n_pairs)
+    picked = asof.filled[rng.integers(0, n_t, n_pairs)[:, None], rng.integers(0, n_d, (n_pairs, 5))]
+    picked[rng.random(picked.shape) < 0.01] = np.nan
+    picked[rng.random(picked.shape) < 0.01] = 0.0
+    buy, sell = picked[:, 0], picked[:, 1]
+    shares = rng.integers(0, 1000, n_pairs).astype(np.float64)
+
+    cases = {
+        "as-of 参照": lambda b: asof_lookup(asof.last, asof.filled, rows, cols, backend=b),
+        "RSR": lambda b: (rsr_kernel(picked, WEIGHTS, backend=b),),
+        "売買損益": lambda b: buy_sell_pnl(buy, sell, shares, backend=b),
+    }
+    use_numba = HAS_NUMBA and _numba_kernels() is not None
+    backends = ["numpy"] + (["numba"] if use_numba else [])
+    if not use_numba:
+        print("【注意】numba が入っていない（または使えない）ので NumPy 版だけを動かします。")
+
+    ok = True
+    for label, run in cases.items():
+        results, times = {}, {}
+        for b in backends:
+            run(b)  # 1回目は numba のコンパイルを含むので捨てる
+            t0 = time.perf_counter()
+            results[b] = run(b)
+            times[b] = time.perf_counter() - t0
+        speed = " / ".join(f"{b}={times[b] * 1000:.1f}ms" for b in backends)
+        if len(backends) > 1:
+            same = all(_same(x, y) for x, y in zip(results["numpy"], results["numba"]))
+            ok &= same
+            print(f"【結果】{label}: {'一致' if same else '不一致'}（{n_pairs} 件, {speed}）")
+        else:
+            print(f"【結果】{label}: {n_pairs} 件（{speed}）")
+    return ok
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="計算カーネルの numba 版と NumPy 版を比べます。")
+    ap.add_argument("--check", action="store_true", help="numba 版と NumPy 版の結果が一致するか確認する")
+    ap.add_argument("--csv", default=None, help="確認に使う終値ワイドCSV（default: prices_close_wide.csv）")
+    args = ap.parse_args()
+
+    print(f"【設定】使用中のカーネル: {BACKEND}（環境変数 {BACKEND_ENV}={os.environ.get(BACKEND_ENV, 'auto')}）")
+    if args.check and not check_parity(args.csv):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,294 @@
+# 説明: 株価・配当の取得元を差し替えられるようにする共通モジュール。yfinance のほか、ネットワーク無しで動く合成データ（遅延・失敗・欠け・1銘柄だと Series を返す癖を再現）と、手元のストアを読む取得元がある。
+# 入力方法: 各スクリプトから `from price_source import get_source` として使う（`--source` または環境変数 PRICE_SOURCE で選ぶ。既定は yfinance）。
+#           `python price_source.py [--tickers 226] [--period 15y] [--latency 0.3] [--fail-rate 0.1] [--fixed]` で、合成データを使って取得→まとめ→ストア保存までを計測する。
+# 出力されるモノ: なし（計測時は一時フォルダにストアを作り、所要時間を標準出力に表示）。
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import re
+import tempfile
+import threading
+import time
+import zlib
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+SOURCES = ("yfinance", "synthetic", "store")
+DEFAULT_SOURCE = "yfinance"
+
+# yfinance の列の並び（download の結果と同じ）
+OHLCV_COLUMNS = ("Close", "High", "Low", "Open", "Volume")
+
+_PERIOD = re.compile(r"^(\d+)(d|wk|mo|y)$")
+
+
+def period_start(period: str, end: pd.Timestamp) -> pd.Timestamp | None:
+    """'15y' / '6mo' / '5d' などを開始日に直す（'max' は None = 先頭から）。"""
+    if period == "max":
+        return None
+    m = _PERIOD.match(period)
+    if m is None:
+        raise ValueError(f"period の形式が想定外です: {period!r}")
+    n, unit = int(m.group(1)), m.group(2)
+    offset = {
+        "d": pd.DateOffset(days=n),
+        "wk": pd.DateOffset(weeks=n),
+        "mo": pd.DateOffset(months=n),
+        "y": pd.DateOffset(years=n),
+    }[unit]
+    return (end - offset).normalize()
+
+
+def _date_range(start=None, end=None, period: str | None = None) -> tuple[pd.Timestamp | None, pd.Timestamp]:
+    """yf.download と同じ引数の解釈で [start, end) を返す（end は含まない）。"""
+    end_ts = pd.Timestamp(end).normalize() if end is not None else pd.Timestamp.today().normalize() + pd.Timedelta(days=1)
+    if start is not None:
+        return pd.Timestamp(start).normalize(), end_ts
+    return period_start(period or "1mo", end_ts), end_ts
+
+
+def _business_days(start: pd.Timestamp, last: pd.Timestamp) -> pd.DatetimeIndex:
+    """start〜last（両端含む）の平日。pd.bdate_range より速い（取得のたびに呼ぶので）。"""
+    days = np.arange(np.datetime64(start.date(), "D"), np.datetime64(last.date(), "D") + 1)
+    return pd.DatetimeIndex(days[np.is_busday(days)].astype("datetime64[ns]"), name="Date")
+
+
+class PriceSource(ABC):
+    """
+    取得元の共通の形（下の2つを実装していない取得元は作る時点で TypeError になる）。
+    - download(tickers, start/end または period, interval) → yf.download と同じ形の表
+      （列=(項目, Ticker) の2段。1銘柄だけのときは取得元によって列が1段になる）
+    - dividends(ticker) → yf.Ticker(ticker).dividends と同じ形の Series（index=権利落ち日）
+    """
+
+    name = ""
+
+    @abstractmethod
+    def download(self, tickers: list[str], start=None, end=None, period: str | None = None, interval: str = "1d") -> pd.DataFrame | None:
+        ...
+
+    @abstractmethod
+    def dividends(self, ticker: str) -> pd.Series:
+        ...
+
+
+# yf.download は呼ぶたびにモジュール全体で1つの結果置き場（yfinance.shared._DFS / _ERRORS）を空にしてから使うので、
+# 別スレッドから同時に呼ぶと他のチャンクの結果が混ざったり消えたりする。呼び出しはこのロックで1本ずつにする
+_YF_DOWNLOAD_LOCK = threading.Lock()
+
+
+class YFinanceSource(PriceSource):
+    """
+    yfinance から取る（既定）。
+    yf.download はスレッドから同時に呼べないので1本ずつ呼び、1回の中の銘柄は yfinance 側のスレッドで並べて取る。
+    """
+
+    name = "yfinance"
+
+    def download(self, tickers, start=None, end=None, period=None, interval="1d"):
+        import yfinance as yf
+
+        kwargs = {"start": start, "end": end} if start is not None else {"period": period}
+        with _YF_DOWNLOAD_LOCK:
+            return yf.download(tickers=list(tickers), interval=interval, progress=False, threads=True, **kwargs)
+
+    def dividends(self, ticker):
+        import yfinance as yf
+
+        return yf.Ticker(ticker).dividends
+
+
+class SyntheticSource(PriceSource):
+    """
+    ネットワーク無しで動く合成データ（計測・負荷試験用）。
+    - 値は (seed, Ticker) ごとに決まる乱数の株価なので、期間を変えて取っても同じ日は同じ値になる
+    - latency / jitter: 1回の取得ごとに待つ秒数（latency + 0〜jitter）
+    - fail_rate: 1回の取得が例外（ConnectionError）になる確率
+    - missing_rate: 取得結果から Ticker が抜け落ちる確率（yfinance 側の個別エラーの再現）
+    - single_as_series: 1銘柄だけの取得では列を1段にする（data["Close"] が Series になる）
+    """
+
+    name = "synthetic"
+    BASE_START = pd.Timestamp("2000-01-03")
+
+    def __init__(
+        self,
+        seed: int = 0,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        fail_rate: float = 0.0,
+        missing_rate: float = 0.0,
+        single_as_series: bool = True,
+    ):
+        self.seed = seed
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.missing_rate = missing_rate
+        self.single_as_series = single_as_series
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def _draw(self) -> float:
+        with self._lock:
+            return self._rng.random()
+
+    def _wait_and_maybe_fail(self, what: str) -> None:
+        wait = self.latency + self.jitter * self._draw()
+        if wait > 0:
+            time.sleep(wait)
+        if self._draw() < self.fail_rate:
+            raise ConnectionError(f"synthetic failure: {what}")
+
+    def _ohlcv(self, ticker: str, dates: pd.DatetimeIndex) -> pd.DataFrame:
+        """BASE_START から dates の最後までの株価を作って、dates の分だけ返す。"""
+        if len(dates) == 0:
+            return pd.DataFrame(columns=list(OHLCV_COLUMNS), index=dates, dtype=float)
+        base = _business_days(self.BASE_START, dates[-1])
+        rng = np.random.default_rng([self.seed, zlib.crc32(ticker.encode("utf-8"))])
+        n = len(base)
+        level = 100.0 * np.exp(rng.uniform(1.0, 4.0))
+        close = level * np.exp(np.cumsum(rng.normal(0.0002, 0.018, n)))
+        open_ = np.concatenate([[close[0]], close[:-1]]) * np.exp(rng.normal(0.0, 0.006, n))
+        high = np.maximum(open_, close) * (1 + np.abs(rng.normal(0.0, 0.006, n)))
+        low = np.minimum(open_, close) * (1 - np.abs(rng.normal(0.0, 0.006, n)))
+        volume = np.round(rng.lognormal(13.0, 0.6, n))
+        df = pd.DataFrame({"Close": close, "High": high, "Low": low, "Open": open_, "Volume": volume}, index=base)
+        return df.reindex(dates)
+
+    def download(self, tickers, start=None, end=None, period=None, interval="1d"):
+        tickers = list(tickers)
+        self._wait_and_maybe_fail(f"{len(tickers)} tickers")
+
+        s, e = _date_range(start, end, period)
+        dates = _business_days(s if s is not None else self.BASE_START, e - pd.Timedelta(days=1))
+        kept = [t for t in tickers if self._draw() >= self.missing_rate]
+        if not kept or len(dates) == 0:
+            return pd.DataFrame()
+
+        frames = {t: self._ohlcv(t, dates) for t in kept}
+        if len(tickers) == 1 and self.single_as_series:
+            return frames[kept[0]]
+        out = pd.concat({col: pd.DataFrame({t: f[col] for t, f in frames.items()}) for col in OHLCV_COLUMNS}, axis=1)
+        out.columns.names = ["Price", "Ticker"]
+        return out
+
+    def dividends(self, ticker):
+        self._wait_and_maybe_fail(ticker)
+        if ticker.startswith("^"):
+            return pd.Series(dtype=float, name="Dividends")
+        # 3月末・9月末の権利落ちで、そのときの株価の1%前後を配当とする
+        today = pd.Timestamp.today().normalize()
+        ex = pd.date_range(self.BASE_START, today, freq="BQE-SEP")
+        ex = ex[ex.month.isin([3, 9])]
+        close = self._ohlcv(ticker, pd.DatetimeIndex(ex))["Close"]
+        amount = (close * 0.01).round(1)
+        return pd.Series(amount.to_numpy(), index=ex.tz_localize("Asia/Tokyo"), name="Dividends")
+
+
+class StoreSource(PriceSource):
+    """手元の価格ストア・配当ストアから返す（取り直しの手順だけをネットワーク無しで試すとき用）。"""
+
+    name = "store"
+
+    def __init__(self, csv_path: str | None = None):
+        from price_store import CSV_PATH
+
+        self.csv_path = csv_path or CSV_PATH
+        self._frames: dict[str, pd.DataFrame] | None = None
+        self._lock = threading.Lock()
+
+    def _load(self) -> dict[str, pd.DataFrame]:
+        from price_store import load_field_by_date, store_fields
+
+        with self._lock:
+            if self._frames is None:
+                fields = store_fields(self.csv_path)
+                self._frames = {f.capitalize(): load_field_by_date(f, self.csv_path) for f in fields}
+            return self._frames
+
+    def download(self, tickers, start=None, end=None, period=None, interval="1d"):
+        frames = self._load()
+        close = frames["Close"]
+        s, e = _date_range(start, end, period)
+        rows = (close.index < e) & ((close.index >= s) if s is not None else True)
+        cols = [t for t in tickers if t in close.columns]
+        if not cols or not rows.any():
+            return pd.DataFrame()
+        out = pd.concat({name: df.loc[rows, cols].astype(float) for name, df in frames.items()}, axis=1)
+        out.columns.names = ["Price", "Ticker"]
+        return out
+
+    def dividends(self, ticker):
+        from dividend_store import DIVIDENDS_PATH, load_dividend_index
+
+        index = load_dividend_index(os.path.join(os.path.dirname(os.path.abspath(self.csv_path)), DIVIDENDS_PATH))
+        if index is None or ticker not in index:
+            return pd.Series(dtype=float, name="Dividends")
+        df = index.for_ticker(ticker)
+        return pd.Series(df["dividend"].to_numpy(), index=pd.DatetimeIndex(df["date"]), name="Dividends")
+
+
+def get_source(name: str | None = None, **kwargs) -> PriceSource:
+    """
+    名前から取得元を返す。name を省略したときは環境変数 PRICE_SOURCE（無ければ yfinance）。
+    kwargs は取得元のコンストラクタにそのまま渡す（synthetic の latency など）。
+    """
+    name = name or os.environ.get("PRICE_SOURCE", DEFAULT_SOURCE)
+    if name == "yfinance":
+        return YFinanceSource(**kwargs)
+    if name == "synthetic":
+        return SyntheticSource(**kwargs)
+    if name == "store":
+        return StoreSource(**kwargs)
+    raise ValueError(f"取得元は {SOURCES} のいずれかを指定してください: {name!r}")
+
+
+def main() -> None:
+    from fetch_engine import fetch_wide, source_downloader
+    from price_store import load_store, save_close_wide
+
+    ap = argparse.ArgumentParser(description="合成データで 取得→まとめ→ストア保存 を計測します（ネットワーク不要）。")
+    ap.add_argument("--tickers", type=int, default=226, help="銘柄数（default: 226）")
+    ap.add_argument("--period", default="15y", help="取得期間（default: 15y）")
+    ap.add_argument("--chunk-size", type=int, default=40, help="1回の取得の銘柄数の初期値（default: 40）")
+    ap.add_argument("--workers", type=int, default=4, help="同時に取得するチャンク数の初期値（default: 4）")
+    ap.add_argument("--latency", type=float, default=0.3, help="1回の取得の待ち時間（秒, default: 0.3）")
+    ap.add_argument("--jitter", type=float, default=0.2, help="待ち時間のばらつき（秒, default: 0.2）")
+    ap.add_argument("--fail-rate", type=float, default=0.1, help="1回の取得が失敗する確率（default: 0.1）")
+    ap.add_argument("--missing-rate", type=float, default=0.01, help="Tickerが抜け落ちる確率（default: 0.01）")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--fixed", action="store_true", help="チャンクの大きさ・同時数を調整せず固定にする（比較用）")
+    args = ap.parse_args()
+
+    tickers = [f"{1300 + i}.T" for i in range(args.tickers)]
+    source = SyntheticSource(
+        seed=args.seed, latency=args.latency, jitter=args.jitter,
+        fail_rate=args.fail_rate, missing_rate=args.missing_rate,
+    )
+
+    t0 = time.perf_counter()
+    res = fetch_wide(
+        tickers, source_downloader(source, period=args.period), args.chunk_size,
+        max_workers=args.workers, backoff=args.latency, label=f"合成データ 期間={args.period}",
+        adaptive=not args.fixed,
+    )
+    t1 = time.perf_counter()
+    with tempfile.TemporaryDirectory() as d:
+        save_close_wide(res.close, d, fields=res.fields)
+        t2 = time.perf_counter()
+        loaded = load_store(d)
+        t3 = time.perf_counter()
+
+    print(f"【結果】銘柄={len(res.close)}、日付={len(res.close.columns)}、失敗={len(res.failed)}")
+    print(f"  取得: {t1 - t0:.2f} 秒（{len(tickers) / (t1 - t0):.1f} 銘柄/秒）")
+    print(f"  保存: {t2 - t1:.2f} 秒 / 読込: {t3 - t2:.3f} 秒（{loaded.shape[0]}x{loaded.shape[1]}）")
+
+
+if __name__ == "__main__":
+    main()
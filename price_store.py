@@ -0,0 +1,769 @@
+# 説明: 終値ワイド表（行=Ticker, 列=日付）をバイナリ形式（月別 .npy + manifest.json）で保存/読込する共通モジュール。始値・高値・安値・出来高も同じ形で持てる。
+# 入力方法: `python price_store.py [--csv prices_close_wide.csv]` で既存CSVからストアを作成。各スクリプトからは import して使う。
+# 出力されるモノ: CSVと同じ階層の `prices_store/`（close/YYYY-MM.npy, open/・high/・low/・volume/YYYY-MM.npy, close_f32_*.bin, manifest.json）。CSVはエクスポート用として残す。
+
+from __future__ import annotations
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from typing import Callable, Iterable, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+CSV_PATH = "prices_close_wide.csv"
+STORE_DIR_NAME = "prices_store"
+
+STORE_VERSION = 2
+MANIFEST_NAME = "manifest.json"
+# 月ごとのパーティション（float64, 行=Ticker, 列=その月の日付）
+CLOSE_DIR_NAME = "close"
+# memmap用: float32 の生バイナリ（行=日付, 列=Ticker の日付優先並び）。形は manifest から決まる
+# 日付が増えるときは末尾に追記するだけ。Tickerが増えたとき・既存の日付の穴を埋めたときは別名で作り直す
+CLOSE_F32_PREFIX = "close_f32_"
+# 終値以外の項目（float32, 終値と同じ月・同じ形のパーティションを {項目}/YYYY-MM.npy に置く）
+# どの項目があるかは manifest の "fields" に書く。CSVから作ったストアは終値だけ
+EXTRA_FIELDS = ("open", "high", "low", "volume")
+FIELDS = ("open", "high", "low", "close", "volume")
+
+# CSV保存時と同じく小数2桁で持つ（表示の揺れ対策）
+PRICE_DECIMALS = 2
+
+
+def store_dir_for(csv_path: str | Path = CSV_PATH) -> Path:
+    """CSVと同じフォルダにあるストアのパスを返す。"""
+    return Path(csv_path).with_name(STORE_DIR_NAME)
+
+
+def _atomic_write_bytes(path: Path, write) -> None:
+    """一時ファイルに書いてから置き換える（読み手が書きかけを見ないように）。"""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+
+def _remove_quietly(path: Path) -> None:
+    # 他プロセスが memmap 中だと消せない環境もあるので、失敗しても気にしない
+    try:
+        path.unlink()
+    except OSError:
+        pass
+
+
+def read_close_csv(csv_path: str | Path) -> pd.DataFrame:
+    """
+    終値ワイドCSVを読み込み、列を日付に正規化して昇順に整列。
+    余計な列があれば日付に変換できる列だけ残す。
+    """
+    df = pd.read_csv(csv_path, index_col=0)
+
+    cols_dt = pd.to_datetime(df.columns, errors="coerce")
+    ok = ~cols_dt.isna()
+    df = df.loc[:, ok].copy()
+
+    df.columns = pd.DatetimeIndex(cols_dt[ok]).normalize()
+    df = df.reindex(sorted(df.columns), axis=1)
+    return df
+
+
+def _normalize_wide(df: pd.DataFrame) -> tuple[list[str], pd.DatetimeIndex, np.ndarray]:
+    """ワイド表を (tickers, 昇順の日付, float64 行列) に分解する。"""
+    cols_dt = pd.to_datetime(pd.Index(df.columns), errors="coerce")
+    ok = ~cols_dt.isna()
+    dates = pd.DatetimeIndex(cols_dt[ok]).normalize()
+
+    order = np.argsort(dates.values, kind="stable")
+    values = df.loc[:, ok].to_numpy(dtype=np.float64)[:, order]
+    values = np.round(values, PRICE_DECIMALS)
+    return df.index.astype(str).tolist(), dates[order], values
+
+
+def _month_spans(dates: pd.DatetimeIndex) -> list[tuple[str, int, int]]:
+    """昇順の日付を月ごとに区切り、(YYYY-MM, start, stop) のリストで返す。"""
+    if len(dates) == 0:
+        return []
+    keys = np.asarray(dates.strftime("%Y-%m"))
+    cuts = np.flatnonzero(keys[1:] != keys[:-1]) + 1
+    starts = np.concatenate([[0], cuts])
+    stops = np.concatenate([cuts, [len(keys)]])
+    return [(str(keys[s]), int(s), int(e)) for s, e in zip(starts, stops)]
+
+
+def _field_file(part: dict, field: str) -> str:
+    """パーティションの項目ごとのファイル（終値は manifest に書いてある名前）。"""
+    if field == "close":
+        return part["file"]
+    return f"{field}/{part['month']}{part.get('suffix', '')}.npy"
+
+
+def _align_field(
+    df: pd.DataFrame,
+    tickers: list[str],
+    dates: pd.DatetimeIndex,
+    dtype=np.float32,
+) -> np.ndarray:
+    """項目ごとのワイド表を終値と同じ (Ticker, 日付) の並びの行列にする（無い所は NaN）。"""
+    cols_dt = pd.to_datetime(pd.Index(df.columns), errors="coerce")
+    ok = ~cols_dt.isna()
+    df = df.loc[:, ok].copy()
+    df.index = df.index.astype(str)
+    df.columns = pd.DatetimeIndex(cols_dt[ok]).normalize()
+    df = df.loc[~df.index.duplicated(keep="first"), ~df.columns.duplicated(keep="first")]
+    return df.reindex(index=tickers, columns=dates).to_numpy(dtype=dtype)
+
+
+def _write_partition(
+    store_dir: Path,
+    month: str,
+    block: np.ndarray,
+    start: int,
+    extras: dict[str, np.ndarray] | None = None,
+    suffix: str = "",
+) -> dict:
+    """
+    suffix: ファイル名の月の後ろに付ける文字列。既存の月を別名で書き直すときに使う
+    （manifest を置き換えるまで、読み手は元のファイルを読み続ける）
+    """
+    rel = f"{CLOSE_DIR_NAME}/{month}{suffix}.npy"
+    for field, arr in (extras or {}).items():
+        _atomic_write_bytes(store_dir / f"{field}/{month}{suffix}.npy", lambda f, a=arr: np.save(f, a.astype(np.float32)))
+    _atomic_write_bytes(store_dir / rel, lambda f: np.save(f, block))
+    part = {
+        "month": month,
+        "file": rel,
+        "start": start,
+        "stop": start + block.shape[1],
+        "n_tickers": block.shape[0],
+    }
+    if suffix:
+        part["suffix"] = suffix
+    return part
+
+
+def _read_partition(
+    store_dir: Path,
+    part: dict,
+    n_tickers: int,
+    mmap_mode: str | None = None,
+    field: str = "close",
+) -> np.ndarray:
+    """
+    パーティションを manifest に書かれた形だけ読む。
+    （追記途中でファイルの方が大きくなっていても、manifest の範囲しか見ない）
+    """
+    arr = np.load(store_dir / _field_file(part, field), mmap_mode=mmap_mode)
+    arr = arr[: part["n_tickers"], : part["stop"] - part["start"]]
+    if arr.shape[0] < n_tickers:
+        pad = np.full((n_tickers - arr.shape[0], arr.shape[1]), np.nan, dtype=arr.dtype)
+        arr = np.concatenate([arr, pad], axis=0)
+    return arr
+
+
+def _first_valid(values: np.ndarray, offset: int = 0) -> np.ndarray:
+    """各Tickerで最初に値がある列の位置（値が1つも無ければ -1）。"""
+    valid = ~np.isnan(values)
+    return np.where(valid.any(axis=1), valid.argmax(axis=1) + offset, -1)
+
+
+def _last_valid(values: np.ndarray, offset: int = 0) -> np.ndarray:
+    """各Tickerで最後に値がある列の位置（値が1つも無ければ -1）。"""
+    valid = ~np.isnan(values)
+    last = values.shape[1] - 1 - valid[:, ::-1].argmax(axis=1)
+    return np.where(valid.any(axis=1), last + offset, -1)
+
+
+def _write_f32(store_dir: Path, values: np.ndarray, generation: int) -> str:
+    name = f"{CLOSE_F32_PREFIX}{generation}.bin"
+    f32 = np.ascontiguousarray(values.T, dtype=np.float32)
+    _atomic_write_bytes(store_dir / name, lambda f: f.write(f32.tobytes()))
+    return name
+
+
+def _write_manifest(store_dir: Path, manifest: dict) -> None:
+    _atomic_write_bytes(
+        store_dir / MANIFEST_NAME,
+        lambda f: f.write(json.dumps(manifest, ensure_ascii=False).encode("utf-8")),
+    )
+
+
+def _cleanup(store_dir: Path, manifest: dict) -> None:
+    """manifest から参照されなくなったファイルを消す。"""
+    fields = manifest.get("fields", [])
+    used = {_field_file(p, field) for p in manifest["partitions"] for field in ["close", *fields]}
+    for name in (CLOSE_DIR_NAME, *EXTRA_FIELDS):
+        for p in (store_dir / name).glob("*.npy"):
+            if f"{name}/{p.name}" not in used:
+                _remove_quietly(p)
+    for p in store_dir.glob(f"{CLOSE_F32_PREFIX}*.bin"):
+        if p.name != manifest["f32_file"]:
+            _remove_quietly(p)
+
+
+def _csv_signature(csv_path: Path) -> dict:
+    """CSVの同一性を判定するための情報（サイズ・更新時刻・内容ハッシュ）。"""
+    h = hashlib.sha1()
+    with open(csv_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    st = csv_path.stat()
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns, "sha1": h.hexdigest()}
+
+
+def save_close_wide(
+    df: pd.DataFrame,
+    store_dir: str | Path,
+    source_csv: str | Path | None = None,
+    fields: dict[str, pd.DataFrame] | None = None,
+) -> None:
+    """
+    終値ワイド表をストアに丸ごと保存する（全期間の作り直し用）。
+    df: index=Ticker, columns=日付（"YYYY-MM-DD" 文字列でも Timestamp でもOK）
+    source_csv: 同じ内容のCSVがあれば指定（CSVが変わったかどうかの判定に使う）
+    fields: 終値以外の項目 {"open": ワイド表, ...}（Ticker・日付は終値に合わせる。無い所は NaN）
+    """
+    tickers, dates, values = _normalize_wide(df)
+    extras = {f: _align_field(fields[f], tickers, dates) for f in EXTRA_FIELDS if fields and f in fields}
+
+    def read_block(field: str, s: int, e: int) -> np.ndarray:
+        return values[:, s:e] if field == "close" else extras[field][:, s:e]
+
+    save_close_blocks(tickers, dates, read_block, store_dir, source_csv=source_csv, fields=list(extras))
+
+
+def save_close_blocks(
+    tickers: list[str],
+    dates: pd.DatetimeIndex,
+    read_block: Callable[[str, int, int], np.ndarray],
+    store_dir: str | Path,
+    source_csv: str | Path | None = None,
+    fields: Iterable[str] = (),
+) -> None:
+    """
+    月ごとに (Ticker x その月の日付) のブロックを受け取りながらストアを丸ごと作る。
+    全期間を一度にメモリへ載せないので、チャンクごとに保存した取得結果からでも組み立てられる。
+    tickers / dates: 行と列（dates は昇順）
+    read_block(項目, start, stop): dates[start:stop] の列の行列（行は tickers の順）を返す関数
+    fields: 終値以外に保存する項目（EXTRA_FIELDS のうちのどれか）
+    """
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    dates = pd.DatetimeIndex(dates)
+    extras = [f for f in EXTRA_FIELDS if f in set(fields)]
+
+    try:
+        generation = read_manifest(store_dir).get("generation", 0) + 1
+    except (OSError, ValueError):
+        generation = 1
+
+    # 先にデータを書き、最後に manifest を置き換える
+    partitions = []
+    first_valid = np.full(len(tickers), -1)
+    last_valid = np.full(len(tickers), -1)
+    f32_file = f"{CLOSE_F32_PREFIX}{generation}.bin"
+
+    def write_months(f32) -> None:
+        nonlocal first_valid, last_valid
+        for month, s, e in _month_spans(dates):
+            block = np.round(np.asarray(read_block("close", s, e), dtype=np.float64), PRICE_DECIMALS)
+            ex = {f: np.asarray(read_block(f, s, e), dtype=np.float32) for f in extras}
+            partitions.append(_write_partition(store_dir, month, block, s, ex))
+            # float32 行列は日付優先なので、月ごとに後ろへ書き足していけばよい
+            f32.write(np.ascontiguousarray(block.T, dtype=np.float32).tobytes())
+            first_valid = np.where(first_valid >= 0, first_valid, _first_valid(block, offset=s))
+            last_valid = np.maximum(last_valid, _last_valid(block, offset=s))
+
+    _atomic_write_bytes(store_dir / f32_file, write_months)
+    manifest = {
+        "version": STORE_VERSION,
+        "generation": generation,
+        "tickers": [str(t) for t in tickers],
+        "dates": dates.strftime("%Y-%m-%d").tolist(),
+        "partitions": partitions,
+        "fields": extras,
+        "first_valid": first_valid.tolist(),
+        "last_valid": last_valid.tolist(),
+        "f32_file": f32_file,
+        "source": _csv_signature(Path(source_csv)) if source_csv is not None else None,
+    }
+    _write_manifest(store_dir, manifest)
+    _cleanup(store_dir, manifest)
+
+
+def append_close_sessions(
+    new_wide: pd.DataFrame,
+    store_dir: str | Path,
+    fields: dict[str, pd.DataFrame] | None = None,
+) -> int:
+    """
+    ストアの最新日より後の日付列だけを追記する（日次更新用）。
+    書き換えるのは最新月のパーティションと float32 行列の末尾だけなので、
+    履歴が伸びても1回の更新コストは変わらない。
+    fields: 終値以外の項目。ストアが既に持っている項目だけ追記する（渡されなければ NaN で埋める）
+    return: 追記した日付列数
+    """
+    store_dir = Path(store_dir)
+    manifest = read_manifest(store_dir)
+    new_tickers, new_dates, new_values = _normalize_wide(new_wide)
+
+    if manifest["dates"]:
+        keep = new_dates > pd.Timestamp(manifest["dates"][-1])
+        new_dates, new_values = new_dates[keep], new_values[:, keep]
+    if len(new_dates) == 0:
+        return 0
+
+    old_tickers = manifest["tickers"]
+    known = set(old_tickers)
+    tickers = old_tickers + [t for t in dict.fromkeys(new_tickers) if t not in known]
+    pos = {t: i for i, t in enumerate(tickers)}
+
+    block = np.full((len(tickers), len(new_dates)), np.nan)
+    block[[pos[t] for t in new_tickers]] = new_values
+
+    # 途中から増えた項目は過去のパーティションが無いので、ストアにある項目だけを扱う
+    store_fields = manifest.get("fields", [])
+    extra_blocks = {
+        f: (_align_field(fields[f], tickers, new_dates) if fields and f in fields
+            else np.full(block.shape, np.nan, dtype=np.float32))
+        for f in store_fields
+    }
+
+    n_old = len(manifest["dates"])
+    partitions = list(manifest["partitions"])
+    for month, s, e in _month_spans(new_dates):
+        part, start = block[:, s:e], n_old + s
+        extras = {f: b[:, s:e] for f, b in extra_blocks.items()}
+        if partitions and partitions[-1]["month"] == month:
+            last = partitions.pop()
+            part = np.concatenate([_read_partition(store_dir, last, len(tickers)), part], axis=1)
+            extras = {
+                f: np.concatenate([_read_partition(store_dir, last, len(tickers), field=f), b], axis=1)
+                for f, b in extras.items()
+            }
+            start = last["start"]
+        partitions.append(_write_partition(store_dir, month, part, start, extras))
+
+    generation = manifest.get("generation", 1)
+    f32_file = manifest["f32_file"]
+    if len(tickers) == len(old_tickers):
+        # 既存の行の後ろに追記（manifest を置き換えるまで読み手からは見えない）
+        with open(store_dir / f32_file, "r+b") as f:
+            f.truncate(n_old * len(tickers) * 4)
+            f.seek(0, os.SEEK_END)
+            f.write(np.ascontiguousarray(block.T, dtype=np.float32).tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+    else:
+        # Tickerが増えたときは行の幅が変わるので別名で作り直す
+        generation += 1
+        full = _assemble(store_dir, partitions, len(tickers))
+        f32_file = _write_f32(store_dir, full, generation)
+
+    first_valid = np.full(len(tickers), -1)
+    first_valid[: len(old_tickers)] = _manifest_first_valid(manifest)
+    first_valid = np.where(first_valid >= 0, first_valid, _first_valid(block, offset=n_old))
+    last_valid = np.full(len(tickers), -1)
+    last_valid[: len(old_tickers)] = _manifest_last_valid(manifest, store_dir)
+    last_valid = np.maximum(last_valid, _last_valid(block, offset=n_old))
+
+    manifest = {
+        **manifest,
+        "generation": generation,
+        "tickers": tickers,
+        "dates": manifest["dates"] + new_dates.strftime("%Y-%m-%d").tolist(),
+        "partitions": partitions,
+        "first_valid": first_valid.tolist(),
+        "last_valid": last_valid.tolist(),
+        "f32_file": f32_file,
+    }
+    _write_manifest(store_dir, manifest)
+    _cleanup(store_dir, manifest)
+    return len(new_dates)
+
+
+def _fill_holes(store_dir: Path, manifest: dict, new_wide: pd.DataFrame, fields: dict[str, pd.DataFrame] | None) -> tuple[dict, int]:
+    """
+    既存の日付で値が欠けている（NaN）所だけを new_wide の値で埋める。既にある値は書き換えない。
+    値が埋まった月のパーティションと float32 行列は、次の世代の別名で書く（元のファイルには触らない）。
+    読み手は manifest を置き換えるまで元のファイルを読み続けるので、一部の月だけ埋まった状態は見えない。
+    return: (新しい manifest（まだ書いていない）, 埋めた値の数)
+    """
+    tickers = manifest["tickers"]
+    dates = _manifest_dates(manifest)
+    n = len(tickers)
+    close = np.round(_align_field(new_wide, tickers, dates, dtype=np.float64), PRICE_DECIMALS)
+    if np.isnan(close).all():
+        return manifest, 0
+
+    store_fields = manifest.get("fields", [])
+    extras = {f: _align_field(fields[f], tickers, dates) for f in store_fields if fields and f in fields}
+
+    generation = manifest.get("generation", 1) + 1
+    suffix = f"_g{generation}"
+    partitions = list(manifest["partitions"])
+    filled = np.zeros(close.shape, dtype=bool)
+    patches: list[tuple[int, np.ndarray]] = []
+    for k, p in enumerate(partitions):
+        s, e = p["start"], p["stop"]
+        cur = _read_partition(store_dir, p, n)
+        hole = np.isnan(cur) & ~np.isnan(close[:, s:e])
+        if not hole.any():
+            continue
+        filled[:, s:e] = hole
+        ex = {}
+        for f in store_fields:
+            arr = _read_partition(store_dir, p, n, field=f)
+            ex[f] = np.where(hole, extras[f][:, s:e], arr) if f in extras else arr
+        cur = np.where(hole, close[:, s:e], cur)
+        partitions[k] = _write_partition(store_dir, p["month"], cur, s, ex, suffix=suffix)
+        patches.append((s, cur))
+
+    if not filled.any():
+        return manifest, 0
+
+    # float32 行列は日付優先なので、元のファイルを写してから埋まった月の日付の行だけ書き換える
+    f32_file = f"{CLOSE_F32_PREFIX}{generation}.bin"
+
+    def write_f32(f) -> None:
+        with open(store_dir / manifest["f32_file"], "rb") as src:
+            shutil.copyfileobj(src, f, 1 << 24)
+        for s, cur in patches:
+            f.seek(s * n * 4)
+            f.write(np.ascontiguousarray(cur.T, dtype=np.float32).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+    _atomic_write_bytes(store_dir / f32_file, write_f32)
+
+    got = np.where(filled, close, np.nan)
+    first_new, last_new = _first_valid(got), _last_valid(got)
+    first_valid = _manifest_first_valid(manifest)
+    first_valid = np.where((first_valid < 0) | ((first_new >= 0) & (first_new < first_valid)), first_new, first_valid)
+    last_valid = np.maximum(_manifest_last_valid(manifest, store_dir), last_new)
+
+    manifest = {
+        **manifest,
+        "generation": generation,
+        "partitions": partitions,
+        "first_valid": first_valid.tolist(),
+        "last_valid": last_valid.tolist(),
+        "f32_file": f32_file,
+    }
+    return manifest, int(filled.sum())
+
+
+def merge_close_sessions(
+    new_wide: pd.DataFrame,
+    store_dir: str | Path,
+    fields: dict[str, pd.DataFrame] | None = None,
+) -> tuple[int, int]:
+    """
+    取り直した結果をストアに反映する（Tickerごとに遅れている分だけ取った結果をそのまま渡せる）。
+    - ストアにある日付: 値が欠けている所だけ埋める（穴埋め）
+    - ストアの最新日より後の日付: append_close_sessions で追記
+    ストアに無い過去の日付（途中の休場日扱いになっている日など）は無視する。
+    return: (埋めた値の数, 追記した日付列数)
+    """
+    store_dir = Path(store_dir)
+    manifest = read_manifest(store_dir)
+    filled = 0
+    if manifest["dates"]:
+        manifest, filled = _fill_holes(store_dir, manifest, new_wide, fields)
+        if filled:
+            _write_manifest(store_dir, manifest)
+            _cleanup(store_dir, manifest)
+    return filled, append_close_sessions(new_wide, store_dir, fields=fields)
+
+
+def read_manifest(store_dir: str | Path) -> dict:
+    with open(Path(store_dir) / MANIFEST_NAME, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+class CloseMatrix(NamedTuple):
+    """memmap した終値行列。values は (Ticker x 日付) の読み取り専用ビュー。"""
+    values: np.ndarray
+    tickers: list[str]
+    dates: pd.DatetimeIndex
+
+
+def _manifest_dates(manifest: dict) -> pd.DatetimeIndex:
+    return pd.DatetimeIndex(pd.to_datetime(manifest["dates"], format="%Y-%m-%d"))
+
+
+def _manifest_first_valid(manifest: dict) -> np.ndarray:
+    # 記録が無い古い manifest では「先頭から値がある」とみなす（遡って探すだけなので結果は同じ）
+    if "first_valid" in manifest:
+        return np.asarray(manifest["first_valid"], dtype=np.int64)
+    return np.zeros(len(manifest["tickers"]), dtype=np.int64)
+
+
+def _manifest_last_valid(manifest: dict, store_dir: Path) -> np.ndarray:
+    # 記録が無い古い manifest では中身から求める（次に manifest を書くときに記録される）
+    if "last_valid" in manifest:
+        return np.asarray(manifest["last_valid"], dtype=np.int64)
+    return _last_valid(_assemble(store_dir, manifest["partitions"], len(manifest["tickers"])))
+
+
+def last_valid_dates(store_dir: str | Path) -> pd.Series:
+    """Tickerごとの最後に値がある日付（index=Ticker, 値が1つも無ければ NaT）。行列本体は読まない。"""
+    store_dir = Path(store_dir)
+    manifest = read_manifest(store_dir)
+    dates = _manifest_dates(manifest)
+    last = _manifest_last_valid(manifest, store_dir)
+    out = pd.Series(pd.NaT, index=pd.Index(manifest["tickers"], name="Ticker"), dtype=dates.dtype)
+    ok = last >= 0
+    out[ok] = dates[last[ok]]
+    return out
+
+
+def _assemble(store_dir: Path, partitions: list[dict], n_tickers: int, field: str = "close") -> np.ndarray:
+    n_dates = partitions[-1]["stop"] if partitions else 0
+    dtype = np.float64 if field == "close" else np.float32
+    values = np.full((n_tickers, n_dates), np.nan, dtype=dtype)
+    for p in partitions:
+        values[:, p["start"]:p["stop"]] = _read_partition(store_dir, p, n_tickers, field=field)
+    return values
+
+
+def open_store_matrix(store_dir: str | Path) -> CloseMatrix:
+    """
+    float32 の終値行列を読み取り専用 np.memmap で開く（コピーなし）。
+    複数プロセスで開いても OS のページキャッシュ1つを共有する。
+    """
+    store_dir = Path(store_dir)
+    manifest = read_manifest(store_dir)
+    tickers = manifest["tickers"]
+    dates = _manifest_dates(manifest)
+
+    if len(tickers) == 0 or len(dates) == 0:
+        values = np.empty((len(tickers), len(dates)), dtype=np.float32)
+    else:
+        mm = np.memmap(store_dir / manifest["f32_file"], dtype=np.float32, mode="r",
+                       shape=(len(dates), len(tickers)))
+        values = mm.T
+    return CloseMatrix(values, tickers, dates)
+
+
+def load_store(store_dir: str | Path, field: str = "close") -> pd.DataFrame:
+    """ストアから終値（または field の項目）のワイド表を読み込む（read_close_csv と同じ形で返す）。"""
+    store_dir = Path(store_dir)
+    manifest = read_manifest(store_dir)
+    if field != "close" and field not in manifest.get("fields", []):
+        raise KeyError(f"ストアに '{field}' がありません（get_price.py で取得し直してください）: {store_dir}")
+    values = _assemble(store_dir, manifest["partitions"], len(manifest["tickers"]), field=field)
+
+    dates = _manifest_dates(manifest)
+    index = pd.Index(manifest["tickers"], name="Ticker")
+    return pd.DataFrame(values, index=index, columns=dates)
+
+
+def load_store_index(csv_path: str | Path = CSV_PATH) -> tuple[list[str], pd.DatetimeIndex]:
+    """行列本体は読まずに (Ticker一覧, 日付一覧) だけを返す。"""
+    manifest = read_manifest(ensure_store(csv_path))
+    return manifest["tickers"], _manifest_dates(manifest)
+
+
+def latest_date_with_any_data(csv_path: str | Path = CSV_PATH) -> pd.Timestamp | None:
+    """どれか1銘柄でも値がある最新の日付を返す。後ろの月から順に必要な分だけ読む。"""
+    store_dir = ensure_store(csv_path)
+    manifest = read_manifest(store_dir)
+    dates = _manifest_dates(manifest)
+    for p in reversed(manifest["partitions"]):
+        arr = _read_partition(store_dir, p, p["n_tickers"], mmap_mode="r")
+        has = np.flatnonzero(~np.isnan(arr).all(axis=0))
+        if len(has):
+            return pd.Timestamp(dates[p["start"] + has[-1]])
+    return None
+
+
+def read_close_asof(dates, tickers: list[str] | None = None, csv_path: str | Path = CSV_PATH) -> pd.DataFrame:
+    """
+    指定した日付それぞれについて「その日以前で直近の有効な終値」を返す
+    （index=Ticker, columns=指定日）。値が無ければ NaN。
+
+    全期間は読まず、指定日を含む月のパーティションから遡って必要な行だけを memmap で読む。
+    数日分のランキングなら読むのは数KB〜数十KB程度。
+    tickers: 対象を絞るとき指定（ストアに無いTickerは NaN）
+    """
+    store_dir = ensure_store(csv_path)
+    manifest = read_manifest(store_dir)
+    all_dates = _manifest_dates(manifest)
+    all_tickers = manifest["tickers"]
+    parts = manifest["partitions"]
+
+    names = list(all_tickers) if tickers is None else [str(t) for t in tickers]
+    pos = {t: i for i, t in enumerate(all_tickers)}
+    rows = np.array([pos.get(t, -1) for t in names], dtype=np.int64)
+    first_valid = np.where(rows >= 0, _manifest_first_valid(manifest)[rows.clip(min=0)], -1)
+
+    req = pd.DatetimeIndex(pd.to_datetime(list(dates))).normalize()
+    ends = all_dates.searchsorted(req, side="right")  # 指定日以前の営業日数
+    starts = np.array([p["start"] for p in parts], dtype=np.int64)
+
+    out = np.full((len(names), len(req)), np.nan)
+    opened: dict[int, np.ndarray] = {}
+    for j, end in enumerate(ends):
+        # その日以前に値を持ちうる銘柄だけを探す
+        pending = np.flatnonzero((first_valid >= 0) & (first_valid < end))
+        k = int(np.searchsorted(starts, end - 1, side="right")) - 1
+        while len(pending) and k >= 0:
+            p = parts[k]
+            if k not in opened:
+                opened[k] = np.load(store_dir / p["file"], mmap_mode="r")
+            upto = min(int(end), p["stop"]) - p["start"]
+
+            r = rows[pending]
+            in_part = r < p["n_tickers"]
+            block = np.asarray(opened[k][r[in_part], :upto])
+            valid = ~np.isnan(block)
+            has = valid.any(axis=1)
+            last = upto - 1 - np.argmax(valid[:, ::-1], axis=1)
+
+            found = pending[in_part][has]
+            out[found, j] = block[has, last[has]]
+
+            # 見つかった銘柄と、これより前に値が無い銘柄は探索終了
+            done = np.zeros(len(out), dtype=bool)
+            done[found] = True
+            pending = pending[~done[pending] & (first_valid[pending] < p["start"])]
+            k -= 1
+
+    return pd.DataFrame(out, index=pd.Index(names, name="Ticker"), columns=req)
+
+
+def export_close_csv(store_dir: str | Path, csv_path: str | Path) -> None:
+    """ストアの内容をワイドCSVに書き出す（UTF-8-SIG、小数2桁）。"""
+    store_dir = Path(store_dir)
+    df = load_store(store_dir)
+    df.columns = df.columns.strftime("%Y-%m-%d")
+    df.to_csv(csv_path, encoding="utf-8-sig", float_format="%.2f")
+    # 書き出したCSVが「変更された」と判定されて取り込み直されないよう記録しておく
+    manifest = read_manifest(store_dir)
+    manifest["source"] = _csv_signature(Path(csv_path))
+    _write_manifest(store_dir, manifest)
+
+
+def _store_is_fresh(csv_path: Path, store_dir: Path) -> bool:
+    """
+    ストアがそのまま使えるか判定する。
+    CSVが取り込んだ時（または書き出した時）から変わっていなければOK。
+    更新時刻だけ変わった場合（git checkout など）は内容ハッシュで確かめる。
+    """
+    manifest_path = store_dir / MANIFEST_NAME
+    try:
+        manifest = read_manifest(store_dir)
+    except (OSError, ValueError):
+        return False
+    if manifest.get("version") != STORE_VERSION or not (store_dir / manifest["f32_file"]).exists():
+        return False
+    if not csv_path.exists():
+        return True
+
+    st = csv_path.stat()
+    source = manifest.get("source")
+    if not source:
+        # 取り込み元の記録が無いときは、CSVのほうが新しければCSVを正とする
+        return manifest_path.stat().st_mtime >= st.st_mtime
+    if source["size"] != st.st_size:
+        return False
+    if source["mtime_ns"] == st.st_mtime_ns:
+        return True
+
+    signature = _csv_signature(csv_path)
+    if signature["sha1"] != source["sha1"]:
+        return False
+    # 中身は同じなので、次回はハッシュを取らずに済むよう時刻だけ記録し直す
+    try:
+        _write_manifest(store_dir, {**manifest, "source": signature})
+    except OSError:
+        pass
+    return True
+
+
+def ensure_store(csv_path: str | Path = CSV_PATH) -> Path:
+    """
+    ストアが無い/CSVが変わったときはCSVから作り直し、ストアのパスを返す。
+    （2回目以降の実行ではCSVの解析も日付の正規化も行わない）
+    """
+    csv_path = Path(csv_path)
+    store_dir = store_dir_for(csv_path)
+    if not _store_is_fresh(csv_path, store_dir):
+        save_close_wide(read_close_csv(csv_path), store_dir, source_csv=csv_path)
+    return store_dir
+
+
+def open_close_matrix(csv_path: str | Path = CSV_PATH) -> CloseMatrix:
+    """終値行列（Ticker x 日付, float32）を memmap で返す。"""
+    return open_store_matrix(ensure_store(csv_path))
+
+
+def load_close_wide(csv_path: str | Path = CSV_PATH, mmap: bool = False) -> pd.DataFrame:
+    """
+    終値ワイド表を返す（Ticker優先: index=Ticker, columns=正規化済みDatetimeIndex, 昇順）。
+    初回はCSVを解析してストアに保存し、2回目以降はストアから読む。
+
+    mmap=True のときは float32 の memmap をそのまま包んだ読み取り専用の表を返す
+    （プロセス間でメモリを共有したいとき用。値の書き換えは不可）。
+    """
+    csv_path = Path(csv_path)
+    if mmap:
+        m = open_close_matrix(csv_path)
+        return pd.DataFrame(m.values, index=pd.Index(m.tickers, name="Ticker"), columns=m.dates, copy=False)
+
+    try:
+        store_dir = ensure_store(csv_path)
+    except OSError:
+        # ストアを書けない場所（読み取り専用など）ではCSVを直接読む
+        return read_close_csv(csv_path)
+    return load_store(store_dir)
+
+
+def load_close_by_date(csv_path: str | Path = CSV_PATH, mmap: bool = False) -> pd.DataFrame:
+    """日付優先の表（index=日付, columns=Ticker）を返す。中身は load_close_wide と同じ。"""
+    return load_close_wide(csv_path, mmap=mmap).T
+
+
+def store_fields(csv_path: str | Path = CSV_PATH) -> list[str]:
+    """ストアにある項目の一覧（終値は常にある）。"""
+    manifest = read_manifest(ensure_store(csv_path))
+    return [f for f in FIELDS if f == "close" or f in manifest.get("fields", [])]
+
+
+def load_field_wide(field: str, csv_path: str | Path = CSV_PATH) -> pd.DataFrame:
+    """
+    始値/高値/安値/終値/出来高のワイド表を返す（形は load_close_wide と同じ）。
+    終値以外は float32 のまま返す。ストアに無い項目なら KeyError。
+    """
+    if field not in FIELDS:
+        raise ValueError(f"field は {FIELDS} のいずれかを指定してください: {field!r}")
+    if field == "close":
+        return load_close_wide(csv_path)
+    return load_store(ensure_store(csv_path), field=field)
+
+
+def load_field_by_date(field: str, csv_path: str | Path = CSV_PATH) -> pd.DataFrame:
+    """load_field_wide の日付優先版（index=日付, columns=Ticker）。"""
+    return load_field_wide(field, csv_path).T
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="終値ワイドCSVからバイナリストアを作成します。")
+    ap.add_argument("--csv", default=CSV_PATH, help=f"終値ワイドCSV（default: {CSV_PATH}）")
+    args = ap.parse_args()
+
+    df = read_close_csv(args.csv)
+    store_dir = store_dir_for(args.csv)
+    save_close_wide(df, store_dir, source_csv=args.csv)
+
+    print(f"【保存】ストアを保存しました: {store_dir}")
+    print(f"【結果】行数（銘柄）={len(df)}、列数（日付）={len(df.columns)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,101 +1,113 @@
-# 説明: 過去1年の日次でRSRスコアを計算・プロットするスクリプト（銘柄とベンチマーク比較）。
-# 入力方法: python rsr_daily_1y.py TICKER [--csv prices_close_wide.csv]
+# 説明: 過去1年の日次でRSRスコアを計算・プロットするスクリプト（複数銘柄・全銘柄とベンチマーク比較）。全銘柄 x 全営業日を配列でまとめて計算する。
+# 入力方法: python rsr_daily_1y.py TICKER [TICKER ...] [--all] [--csv prices_close_wide.csv]
 # 出力されるモノ: 日次RSRのグラフをmatplotlibで表示（標準出力は主にエラーや情報）。
 
 import argparse
-from typing import Optional
+import time
+from typing import Sequence
 
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
-import exchange_calendars as xcals
-from dateutil.relativedelta import relativedelta
+
+from asof_index import asof_index_for
+from price_store import load_close_wide
+from rsr_engine import LOOKBACKS, WEIGHTS, rsr_scores
+from session_calendar import get_session_calendar
 
 CAL_NAME = "XTKS"
 BENCH = "^N225"
-
-WEIGHTS = {"q1": 0.4, "q2": 0.2, "q3": 0.2, "y1": 0.2}
-
-
-def load_close_wide(csv_path: str) -> pd.DataFrame:
-    df = pd.read_csv(csv_path, index_col=0)
-    cols_dt = pd.to_datetime(df.columns, errors="coerce")
-    df = df.loc[:, ~cols_dt.isna()]
-    df.columns = pd.to_datetime(df.columns).normalize()
-    return df.reindex(sorted(df.columns), axis=1)
-
-
-def pick_close_on_or_before(closes: pd.Series, day: pd.Timestamp) -> Optional[float]:
-    key = pd.Timestamp(day.date())
-    if key in closes.index:
-        return float(closes.loc[key])
-    idx = closes.index[closes.index <= key]
-    return float(closes.loc[idx[-1]]) if len(idx) else None
-
-
-def rsr_at_day(closes: pd.Series, s0: pd.Timestamp) -> Optional[float]:
-    p0  = pick_close_on_or_before(closes, s0)
-    p1y = pick_close_on_or_before(closes, s0 - relativedelta(years=1))
-    pq1 = pick_close_on_or_before(closes, s0 - relativedelta(months=3))
-    pq2 = pick_close_on_or_before(closes, s0 - relativedelta(months=6))
-    pq3 = pick_close_on_or_before(closes, s0 - relativedelta(months=9))
-
-    vals = [p0, p1y, pq1, pq2, pq3]
-    if any(v in (None, 0) for v in vals):
-        return None
-
-    return float((
-        ((p0 - pq1) / pq1) * WEIGHTS["q1"]
-        + ((p0 - pq2) / pq2) * WEIGHTS["q2"]
-        + ((p0 - pq3) / pq3) * WEIGHTS["q3"]
-        + ((p0 - p1y) / p1y) * WEIGHTS["y1"]
-    ) * 100)
+# 凡例を出す銘柄数の上限（これより多いと凡例で図が埋まる）
+LEGEND_MAX = 20
+
+
+def calc_daily_rsr(df: pd.DataFrame, tickers: Sequence[str] | None = None, years: int = 1) -> pd.DataFrame:
+    """
+    複数銘柄（None なら全銘柄）の日次RSRをまとめて計算する（index=営業日, columns=Ticker、計算できない日は NaN）。
+    銘柄ごとの期間は「その銘柄の最後に値がある日」から years 年前まで（1銘柄ずつ計算していたときと同じ）。
+    参照日（基準日から暦で1年/3/6/9か月遡った日）の列は営業日ごとに1回だけ求め、全銘柄で使い回す。
+    """
+    asof = asof_index_for(df)
+    names = list(asof.tickers) if tickers is None else [str(t) for t in tickers]
+    rows = asof.rows(names)
+    if (rows < 0).any():
+        missing = [t for t, r in zip(names, rows) if r < 0]
+        raise ValueError(f"ticker not found in CSV: {', '.join(missing)}")
+
+    # 銘柄ごとの最後に値がある日（= 期間の終わり）
+    last_col = asof.last[rows, -1] if len(asof.dates) else np.full(len(rows), -1)
+    has_data = last_col >= 0
+    if not has_data.any():
+        return pd.DataFrame(index=pd.DatetimeIndex([]), columns=names, dtype=float)
+    end_days = pd.DatetimeIndex(asof.dates[last_col.clip(min=0)])
+    start_days = end_days - pd.DateOffset(years=years)
+
+    cal = get_session_calendar(CAL_NAME)
+    sessions = cal.sessions_in_range(start_days[has_data].min(), end_days[has_data].max())
+
+    # 5つの参照日（LOOKBACKS の順 = 基準日, 1年前, 3か月前, 6か月前, 9か月前）の列番号（5 x 営業日）
+    cols = np.stack([
+        asof.columns(sessions - pd.DateOffset(years=lb.years, months=lb.months) if k else sessions)
+        for k, lb in enumerate(LOOKBACKS)
+    ])
+    vals, _used = asof.lookup(rows[:, None, None], cols[None, :, :])  # Ticker x 5 x 営業日
+    picked = vals.transpose(0, 2, 1).reshape(-1, len(LOOKBACKS))
+    scores = rsr_scores(picked, WEIGHTS).reshape(len(rows), len(sessions))
+    # 基準日の価格が0の日も計算しない（1銘柄ずつ計算していたときと同じ）
+    scores[vals[:, 0, :] == 0] = np.nan
+
+    # 銘柄ごとの期間の外は NaN
+    day = sessions.to_numpy()[None, :]
+    inside = (day >= start_days.to_numpy()[:, None]) & (day <= end_days.to_numpy()[:, None]) & has_data[:, None]
+    scores[~inside] = np.nan
+    return pd.DataFrame(scores.T, index=pd.DatetimeIndex(sessions), columns=pd.Index(names, name="Ticker"))
 
 
 def calc_daily_rsr_1y(df: pd.DataFrame, ticker: str) -> pd.Series:
-    closes = df.loc[ticker].dropna()
-    closes.index = pd.to_datetime(closes.index).normalize()
-
-    cal = xcals.get_calendar(CAL_NAME)
-    end_day = closes.index.max()
-    start_day = end_day - relativedelta(years=1)
-
-    sessions = cal.sessions_in_range(start_day, end_day)
-
-    values = []
-    for s in sessions:
-        values.append(rsr_at_day(closes, pd.Timestamp(s).normalize()))
-
-    return pd.Series(values, index=pd.to_datetime(sessions), name=ticker).dropna()
+    """1銘柄版（計算できない日は除く）。"""
+    return calc_daily_rsr(df, [ticker])[str(ticker)].dropna()
 
 
 def main():
     ap = argparse.ArgumentParser()
-    ap.add_argument("ticker", help="例: 7203.T")
+    ap.add_argument("tickers", nargs="*", help="例: 7203.T 6758.T")
+    ap.add_argument("--all", action="store_true", help="CSVの全銘柄を描く")
     ap.add_argument("--csv", default="prices_close_wide.csv")
     args = ap.parse_args()
 
     df = load_close_wide(args.csv)
-
-    for t in (args.ticker, BENCH):
+    if args.all:
+        tickers = [t for t in df.index.astype(str) if t != BENCH]
+    elif args.tickers:
+        tickers = [t for t in args.tickers if t != BENCH]
+    else:
+        raise SystemExit("ticker を1つ以上指定するか --all を付けてください。")
+
+    for t in (*tickers, BENCH):
         if t not in df.index:
             raise SystemExit(f"ticker not found in CSV: {t}")
 
-    s_stock = calc_daily_rsr_1y(df, args.ticker)
-    s_bench = calc_daily_rsr_1y(df, BENCH)
+    t0 = time.perf_counter()
+    rsr = calc_daily_rsr(df, [*tickers, BENCH])
+    print(f"【速度】{len(tickers) + 1} 銘柄 x {len(rsr.index)} 営業日 / {time.perf_counter() - t0:.2f} 秒")
 
     plt.figure(figsize=(10, 4))
-    plt.plot(s_stock.index, s_stock.values, label=args.ticker)
+    for t in tickers:
+        s = rsr[t].dropna()
+        plt.plot(s.index, s.values, label=t, linewidth=1.0 if len(tickers) > 1 else None)
+    s_bench = rsr[BENCH].dropna()
     plt.plot(s_bench.index, s_bench.values, color="red", label=BENCH)
 
     plt.axhline(0, color="gray", linewidth=0.8)
     plt.title(f"Daily RSR (last 1Y)")
     plt.xlabel("Date")
     plt.ylabel("RSR Score")
-    plt.legend()
+    if len(tickers) <= LEGEND_MAX:
+        plt.legend(fontsize="small", ncol=max(1, len(tickers) // 10 + 1))
     plt.grid(True)
     plt.tight_layout()
     plt.show()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,98 @@
+# 説明: RSR（3/6/9か月・1年前からの騰落率の加重和）を全銘柄まとめて NumPy で計算する共通エンジン。Tickerごとのループはしない。
+# 入力方法: 各スクリプトから `from rsr_engine import rank_rsr, reference_sessions` として使う（単体実行はしない）。
+# 出力されるモノ: なし（スコア配列・ランキングを返すだけ）。
+
+from __future__ import annotations
+
+from typing import Sequence
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from asof_index import forward_fill
+from jit_kernels import rsr_kernel
+
+WEIGHTS = {
+    "q1": 0.4,
+    "q2": 0.2,
+    "q3": 0.2,
+    "y1": 0.2,
+}
+
+# 参照日の並び（基準日, 1年前, 3か月前, 6か月前, 9か月前 = safe_detect_number の引数順）
+LOOKBACKS = (
+    relativedelta(),
+    relativedelta(years=1),
+    relativedelta(months=3),
+    relativedelta(months=6),
+    relativedelta(months=9),
+)
+
+
+def reference_sessions(cal, base_day) -> list[pd.Timestamp]:
+    """
+    基準日から暦で遡った5つの参照日を、それぞれその日以前の直近営業日に補正して返す（LOOKBACKS の順）。
+    cal: session_calendar.SessionCalendar
+    """
+    base = pd.Timestamp(base_day).date()
+    sessions = cal.prev_or_same([base - lb for lb in LOOKBACKS])
+    if sessions.isna().any():
+        raise ValueError("指定日以前の営業日が見つかりません。")
+    return list(sessions)
+
+
+def asof_columns(dates: pd.DatetimeIndex, days) -> np.ndarray:
+    """各 days について「その日以前で直近の列」の位置（その日以前に列が無ければ -1）。"""
+    days = pd.DatetimeIndex(pd.to_datetime(list(days))).normalize()
+    return pd.DatetimeIndex(dates).searchsorted(days, side="right") - 1
+
+
+def gather_asof(values: np.ndarray, dates: pd.DatetimeIndex, days: Sequence) -> np.ndarray:
+    """
+    Ticker x 日付 の行列から、各 days について「その日以前で直近の有効値」を集める（Ticker x len(days)）。
+    前方に埋めた行列を一度作り、あとは列を引くだけ。値が無ければ NaN。
+    """
+    filled = forward_fill(values)
+    cols = asof_columns(dates, days)
+    out = filled[:, cols.clip(min=0)]
+    out[:, cols < 0] = np.nan
+    return out
+
+
+def rsr_scores(picked: np.ndarray, weights: dict[str, float] = WEIGHTS) -> np.ndarray:
+    """
+    picked: Ticker x 5（基準日, 1年前, 3か月前, 6か月前, 9か月前 の価格）
+    return: Tickerごとの RSR（計算できない銘柄 = 欠けがある/過去価格が0 は NaN）
+    式と足し算の順は safe_detect_number と同じなので、値も1ビット違わず一致する。
+    計算は jit_kernels.rsr_kernel（numba があれば JIT 版、無ければ NumPy 版。どちらも同じ値）。
+    """
+    return rsr_kernel(picked, weights)
+
+
+def rank_order(scores: np.ndarray) -> np.ndarray:
+    """
+    スコアの高い順の行番号（NaN は除く）。同点は元の並び順
+    （list.sort(key=..., reverse=True) と同じ並びになる）。
+    """
+    valid = np.flatnonzero(~np.isnan(scores))
+    return valid[np.argsort(-scores[valid], kind="stable")]
+
+
+def rank_rsr(
+    tickers: Sequence[str],
+    picked: np.ndarray,
+    weights: dict[str, float] = WEIGHTS,
+) -> tuple[list[tuple[str, float]], list[str]]:
+    """
+    全銘柄のRSRを計算してランキングにする。
+    return:
+      results: [(Ticker, RSR), ...]（高い順）
+      skipped: 計算できなかったTicker（元の並び順）
+    """
+    scores = rsr_scores(picked, weights)
+    order = rank_order(scores)
+    names = [str(t) for t in tickers]
+    results = [(names[i], float(scores[i])) for i in order]
+    skipped = [names[i] for i in np.flatnonzero(np.isnan(scores))]
+    return results, skipped
@@ -0,0 +1,249 @@
+# 説明: RSRの重みと参照期間（何か月前と比べるか）の組み合わせを複数まとめて評価する。全設定の参照期間を合わせた騰落率の表を1回だけ引き、重みの行列との行列積1回で全設定のスコアを出す。
+# 入力方法: `python rsr_factors.py [--spec "q1=0.4,q2=0.2,q3=0.2,y1=0.2" --spec "3m=0.5,12m=0.5" ...] [--start 2015-01-01] [--end YYYY-MM-DD] [--every 3] [--horizon 12] [--top 40]`
+#           （--spec を省略すると既定の設定 + いくつかの比較用の設定）。各スクリプトからは `from rsr_factors import FactorSpec, evaluate_specs` として使う。
+# 出力されるモノ: 設定ごとに「基準日のRSR上位N銘柄を HORIZON か月持った平均利益率」などの比較表を標準出力に表示。
+
+from __future__ import annotations
+
+import argparse
+import re
+import time
+from typing import NamedTuple, Sequence
+
+import numpy as np
+import pandas as pd
+from dateutil.relativedelta import relativedelta
+
+from asof_index import AsofIndex, asof_index_for
+from price_store import CSV_PATH, load_close_wide
+from rsr_engine import LOOKBACKS, WEIGHTS, rank_order
+from session_calendar import SessionCalendar, get_session_calendar
+
+CAL_NAME = "XTKS"
+BENCH = "^N225"
+
+# WEIGHTS のキーと参照期間（rsr_engine.LOOKBACKS の 1年前, 3か月前, 6か月前, 9か月前 の順）
+DEFAULT_LOOKBACKS = dict(zip(("y1", "q1", "q2", "q3"), LOOKBACKS[1:]))
+
+# 一度に計算する基準日の数（Ticker数 x 参照期間数 x この日数 の表を作るので、多すぎるとメモリを食う）
+BLOCK_DATES = 250
+
+# --spec を省略したときに比べる設定
+DEFAULT_SPEC_TEXTS = (
+    "q1=0.4,q2=0.2,q3=0.2,y1=0.2",
+    "q1=0.25,q2=0.25,q3=0.25,y1=0.25",
+    "q1=1",
+    "q2=0.5,y1=0.5",
+    "1m=0.5,q1=0.5",
+)
+
+
+class FactorSpec(NamedTuple):
+    """
+    RSRの1つの設定。weights と lookbacks は同じキーを持つ（キー → 重み / 基準日から遡る期間）。
+    スコア = Σ 重み x (基準日の価格 - 遡った日の価格) / 遡った日の価格 x 100
+    """
+    name: str
+    weights: dict[str, float]
+    lookbacks: dict[str, relativedelta]
+
+
+DEFAULT_SPEC = FactorSpec("default", dict(WEIGHTS), DEFAULT_LOOKBACKS)
+
+
+def parse_spec(text: str, name: str | None = None) -> FactorSpec:
+    """
+    "q1=0.4,q2=0.2,q3=0.2,y1=0.2" や "3m=0.5,12m=0.5" のような文字列から設定を作る。
+    キーは q1/q2/q3/y1（DEFAULT_LOOKBACKS と同じ期間）か、「数字 + m（か月）/ y（年）」。
+    """
+    weights: dict[str, float] = {}
+    lookbacks: dict[str, relativedelta] = {}
+    for term in filter(None, (t.strip() for t in text.split(","))):
+        key, sep, w = term.partition("=")
+        key = key.strip()
+        if not sep:
+            raise ValueError(f"「キー=重み」の形で指定してください: {term}")
+        if key in DEFAULT_LOOKBACKS:
+            lb = DEFAULT_LOOKBACKS[key]
+        else:
+            m = re.fullmatch(r"(\d+)([my])", key)
+            if m is None:
+                raise ValueError(f"参照期間のキーが読めません（q1/q2/q3/y1 か 3m, 1y など）: {key}")
+            n = int(m.group(1))
+            lb = relativedelta(months=n) if m.group(2) == "m" else relativedelta(years=n)
+        weights[key] = float(w)
+        lookbacks[key] = lb
+    if not weights:
+        raise ValueError("設定が空です。")
+    return FactorSpec(name or text, weights, lookbacks)
+
+
+def spec_offsets(specs: Sequence[FactorSpec]) -> list[relativedelta]:
+    """全設定で使う参照期間（重複なし、最初に出てきた順）。"""
+    out: list[relativedelta] = []
+    for spec in specs:
+        for key in spec.weights:
+            lb = spec.lookbacks[key]
+            if lb not in out:
+                out.append(lb)
+    return out
+
+
+def weight_matrix(specs: Sequence[FactorSpec], offsets: Sequence[relativedelta]) -> np.ndarray:
+    """設定 x 参照期間 の重みの行列（その設定で使わない期間は 0）。"""
+    pos = {lb: k for k, lb in enumerate(offsets)}
+    W = np.zeros((len(specs), len(offsets)))
+    for s, spec in enumerate(specs):
+        for key, w in spec.weights.items():
+            W[s, pos[spec.lookbacks[key]]] += w
+    return W
+
+
+def offset_columns(
+    asof: AsofIndex,
+    cal: SessionCalendar,
+    days,
+    offsets: Sequence[relativedelta],
+) -> tuple[np.ndarray, pd.DatetimeIndex]:
+    """
+    各 days（その日以前で直近の価格表の日付を基準日にする）から offsets だけ暦で遡った日の列番号。
+    rsr_panel.reference_columns と同じく「暦で遡る → その日以前の直近営業日 → その日以前の直近の価格表の日付」。
+    return: ((1 + len(offsets)) x 基準日 の列番号（先頭行が基準日、参照できない所は -1）, 基準日)
+    """
+    base_cols = asof.columns(days)
+    if (base_cols < 0).any():
+        raise ValueError("指定日以前の価格がありません。")
+    base = asof.dates[base_cols]
+    cols = np.empty((1 + len(offsets), len(base)), dtype=np.int64)
+    for k, lb in enumerate((relativedelta(), *offsets)):
+        target = base - pd.DateOffset(years=lb.years, months=lb.months, days=lb.days) if k else base
+        s = cal.prev_or_same(target)
+        c = asof.dates.searchsorted(s, side="right") - 1
+        cols[k] = np.where(s.isna(), -1, c)
+    return cols, base
+
+
+def return_matrix(asof: AsofIndex, cols: np.ndarray) -> np.ndarray:
+    """
+    基準日の価格と各参照日の価格から騰落率の表を作る（参照期間 x 基準日 x Ticker）。
+    欠けがある所・参照日の価格が0の所は NaN。
+    """
+    picked = asof.filled[:, cols.clip(min=0)]  # Ticker x (1+参照期間) x 基準日
+    picked[:, cols < 0] = np.nan
+    p0, past = picked[:, :1], picked[:, 1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        ret = (p0 - past) / past
+    ret[past == 0] = np.nan
+    return ret.transpose(1, 2, 0)
+
+
+def evaluate_specs(
+    specs: Sequence[FactorSpec],
+    asof: AsofIndex,
+    cal: SessionCalendar,
+    days,
+    block: int = BLOCK_DATES,
+) -> tuple[np.ndarray, pd.DatetimeIndex]:
+    """
+    全設定のRSRを、全基準日・全Tickerについてまとめて計算する。
+    価格は全設定の参照期間を合わせて1回だけ引き、スコアは 重み(設定 x 期間) @ 騰落率(期間 x 基準日・Ticker) の行列積1回で出す。
+    その設定で重みを持つ期間に欠けがあるところは NaN。
+    既定の設定では rsr_engine.rsr_scores と丸め誤差（相対 1e-14 程度）の範囲で一致する（足し算の順が違うため、ビット単位では一致しないことがある）。
+    return: (設定 x 基準日 x Ticker のスコア, 基準日)
+    """
+    specs = list(specs)
+    offsets = spec_offsets(specs)
+    W = weight_matrix(specs, offsets)
+    used = (W != 0).astype(np.float64)
+
+    cols, base = offset_columns(asof, cal, days, offsets)
+    n_days, n_tickers = cols.shape[1], len(asof.tickers)
+    out = np.empty((len(specs), n_days, n_tickers))
+    for a in range(0, n_days, block):
+        b = min(a + block, n_days)
+        ret = return_matrix(asof, cols[:, a:b]).reshape(len(offsets), -1)
+        missing = np.isnan(ret)
+        scores = (W @ np.where(missing, 0.0, ret)) * 100
+        scores[(used @ missing) > 0] = np.nan
+        out[:, a:b] = scores.reshape(len(specs), b - a, n_tickers)
+    return out, base
+
+
+def forward_returns(asof: AsofIndex, cal: SessionCalendar, base: pd.DatetimeIndex, horizon_months: int) -> np.ndarray:
+    """基準日から horizon_months か月後（その日以前の直近営業日）までの利益率 %（基準日 x Ticker、無ければ NaN）。"""
+    future = cal.prev_or_same(base + pd.DateOffset(months=horizon_months))
+    cols = np.where(future.isna(), -1, asof.dates.searchsorted(future, side="right") - 1)
+    p0 = asof.gather(base)
+    p1 = asof.filled[:, cols.clip(min=0)]
+    p1[:, cols < 0] = np.nan
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fwd = (p1 - p0) / p0 * 100
+    fwd[p0 == 0] = np.nan
+    return fwd.T
+
+
+def _base_days(start: str, end: str | None, every: int, last: pd.Timestamp, horizon_months: int) -> list[pd.Timestamp]:
+    stop = pd.Timestamp(end) if end else last - pd.DateOffset(months=horizon_months)
+    out, k = [], 0
+    while (day := pd.Timestamp(start) + pd.DateOffset(months=k * every)) <= stop:
+        out.append(day)
+        k += 1
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="RSRの重み・参照期間の組み合わせを複数まとめて比較します。")
+    ap.add_argument("--spec", action="append", default=None,
+                    help='設定（例: "q1=0.4,q2=0.2,q3=0.2,y1=0.2" / "3m=0.5,12m=0.5"）。複数指定可')
+    ap.add_argument("--start", default="2015-01-01", help="最初の基準日（default: 2015-01-01）")
+    ap.add_argument("--end", default=None, help="最後の基準日（default: 価格表の最終日 - horizon）")
+    ap.add_argument("--every", type=int, default=3, help="基準日の間隔（か月, default: 3）")
+    ap.add_argument("--horizon", type=int, default=12, help="持つ期間（か月, default: 12）")
+    ap.add_argument("--top", type=int, default=40, help="上位何銘柄を持つか（default: 40）")
+    ap.add_argument("--csv", default=CSV_PATH, help=f"終値ワイドCSV（default: {CSV_PATH}）")
+    args = ap.parse_args()
+
+    specs = [parse_spec(t) for t in (args.spec or DEFAULT_SPEC_TEXTS)]
+    df = load_close_wide(args.csv)
+    asof = asof_index_for(df)
+    cal = get_session_calendar(CAL_NAME)
+
+    days = _base_days(args.start, args.end, args.every, asof.dates[-1], args.horizon)
+    if not days:
+        raise SystemExit("【注意】基準日がありません（--start / --end / --horizon を確認してください）。")
+
+    t0 = time.perf_counter()
+    scores, base = evaluate_specs(specs, asof, cal, days)
+    fwd = forward_returns(asof, cal, base, args.horizon)
+    elapsed = time.perf_counter() - t0
+    print(f"【速度】{len(specs)} 設定 x {len(base)} 基準日 x {len(asof.tickers)} 銘柄 / {elapsed:.2f} 秒")
+
+    stocks = ~asof.tickers.str.startswith("^")
+    b = asof.rows([BENCH])[0]
+    bench = fwd[:, b] if b >= 0 else np.full(len(base), np.nan)
+
+    print(f"基準日: {base[0].strftime('%Y/%m/%d')} 〜 {base[-1].strftime('%Y/%m/%d')}（{len(base)} 回, {args.every}か月ごと）、"
+          f"保有 {args.horizon}か月、上位 {args.top} 銘柄")
+    print(f"{'設定':<40} {'平均%':>8} {'中央値%':>8} {f'{BENCH}超え':>10}")
+    for s, spec in enumerate(specs):
+        means = np.full(len(base), np.nan)
+        for d in range(len(base)):
+            row = np.where(stocks, scores[s, d], np.nan)
+            top = rank_order(row)[: args.top]
+            r = fwd[d, top]
+            r = r[~np.isnan(r)]
+            if len(r):
+                means[d] = r.mean()
+        ok = ~np.isnan(means)
+        if not ok.any():
+            print(f"{spec.name:<40} {'-':>8} {'-':>8} {'-':>10}")
+            continue
+        beat = ok & ~np.isnan(bench)
+        win = f"{(means[beat] > bench[beat]).sum()}/{beat.sum()}"
+        print(f"{spec.name:<40} {np.nanmean(means):>8.2f} {np.nanmedian(means):>8.2f} {win:>10}")
+    if not np.isnan(bench).all():
+        print(f"{'(' + BENCH + ')':<40} {np.nanmean(bench):>8.2f} {np.nanmedian(bench):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+# 説明: 全銘柄 x 全営業日のRSRをまとめて計算し、価格ストアの隣に保存しておく（RSRパネル）。どの日のランキングも、どの銘柄の推移も、保存済みの表から切り出すだけで済む。
+# 入力方法: `python rsr_panel.py [--csv prices_close_wide.csv] [--full] [--date YYYY-MM-DD --top 10]`。add_price.py で日付が増えたときは、パネルがあれば新しい日付の分だけ自動で計算される。
+# 出力されるモノ: `prices_store/rsr_panel.json` と `prices_store/rsr_panel_*.bin`（float64、行=日付, 列=Ticker の日付優先並び）。`--date` 指定時はその日のランキング上位を標準出力に表示。
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+from pathlib import Path
+from typing import NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from asof_index import forward_fill
+from price_store import CSV_PATH, ensure_store, load_store, load_store_index, read_manifest
+from rsr_engine import LOOKBACKS, WEIGHTS, rank_order, rsr_scores
+from session_calendar import SessionCalendar, get_session_calendar
+
+CAL_NAME = "XTKS"
+
+PANEL_VERSION = 1
+PANEL_META_NAME = "rsr_panel.json"
+# 行=日付, 列=Ticker の float64 生バイナリ。更新のたびに別名（世代番号付き）で書き、meta を置き換えてから古いものを消す
+PANEL_PREFIX = "rsr_panel_"
+# 一度に計算する日付数（Ticker数 x この日数 x 5 の表を作るので、多すぎるとメモリを食う）
+BLOCK_DATES = 250
+
+
+class RsrPanel(NamedTuple):
+    """memmap したRSRパネル。values は (日付 x Ticker) の読み取り専用ビュー（計算できない所は NaN）。"""
+    values: np.ndarray
+    tickers: list[str]
+    dates: pd.DatetimeIndex
+
+    def on(self, day) -> pd.Series:
+        """day 以前で直近のパネルの日付のRSR（index=Ticker）。"""
+        i = int(self.dates.searchsorted(pd.Timestamp(day).normalize(), side="right")) - 1
+        if i < 0:
+            raise ValueError("指定日以前のRSRがありません。")
+        return pd.Series(np.asarray(self.values[i]), index=pd.Index(self.tickers, name="Ticker"), name=self.dates[i])
+
+    def ranking(self, day) -> list[tuple[str, float]]:
+        """day のランキング [(Ticker, RSR), ...]（高い順。並びは rsr_engine.rank_rsr と同じ）。"""
+        row = self.on(day)
+        scores = row.to_numpy()
+        return [(self.tickers[i], float(scores[i])) for i in rank_order(scores)]
+
+    def history(self, ticker: str) -> pd.Series:
+        """1銘柄のRSRの推移（index=日付, 計算できない日は除く）。"""
+        j = self.tickers.index(str(ticker))
+        s = pd.Series(np.asarray(self.values[:, j]), index=self.dates, name=str(ticker))
+        return s.dropna()
+
+
+def reference_columns(dates: pd.DatetimeIndex, cal: SessionCalendar, lo: int, hi: int) -> np.ndarray:
+    """
+    パネルの lo〜hi 番目の日付を基準日としたときの5つの参照日（LOOKBACKS の順）の列番号（5 x (hi-lo)）。
+    rsr_old.py と同じく「基準日から暦で遡る → その日以前の直近営業日 → その日以前の直近のストアの日付」。
+    参照できない所は -1。
+    """
+    return reference_columns_at(dates, cal, np.arange(lo, hi))
+
+
+def reference_columns_at(dates: pd.DatetimeIndex, cal: SessionCalendar, positions: np.ndarray) -> np.ndarray:
+    """reference_columns の飛び飛びの日付版（positions 番目の日付それぞれを基準日にする。5 x len(positions)）。"""
+    base = dates[np.asarray(positions, dtype=np.int64)]
+    cols = np.empty((len(LOOKBACKS), len(base)), dtype=np.int64)
+    for k, lb in enumerate(LOOKBACKS):
+        target = base - pd.DateOffset(years=lb.years, months=lb.months) if k else base
+        s = cal.prev_or_same(target)
+        c = dates.searchsorted(s, side="right") - 1
+        cols[k] = np.where(s.isna(), -1, c)
+    return cols
+
+
+def compute_rsr_block(
+    filled: np.ndarray,
+    dates: pd.DatetimeIndex,
+    cal: SessionCalendar,
+    lo: int,
+    hi: int,
+    weights: dict[str, float] = WEIGHTS,
+) -> np.ndarray:
+    """前方に埋めた終値行列（Ticker x 日付）から、lo〜hi 番目の日付のRSRを計算する（(hi-lo) x Ticker）。"""
+    return compute_rsr_rows(filled, dates, cal, np.arange(lo, hi), weights)
+
+
+def compute_rsr_rows(
+    filled: np.ndarray,
+    dates: pd.DatetimeIndex,
+    cal: SessionCalendar,
+    positions: np.ndarray,
+    weights: dict[str, float] = WEIGHTS,
+) -> np.ndarray:
+    """compute_rsr_block の飛び飛びの日付版（positions 番目の日付のRSR。len(positions) x Ticker）。"""
+    cols = reference_columns_at(dates, cal, positions)
+    picked = filled[:, cols.clip(min=0)]  # Ticker x 5 x 日付
+    picked[:, cols < 0] = np.nan
+    n_tickers = filled.shape[0]
+    flat = picked.transpose(2, 0, 1).reshape(-1, len(LOOKBACKS))
+    return rsr_scores(flat, weights).reshape(cols.shape[1], n_tickers)
+
+
+def _partition_signature(store_dir: Path, manifest: dict) -> list[list]:
+    """価格ストアの月ごとのパーティションの (月, 終わり, Ticker数, 更新時刻, サイズ)。書き換えられた月を見分けるのに使う。"""
+    out = []
+    for p in manifest["partitions"]:
+        st = (store_dir / p["file"]).stat()
+        out.append([p["month"], p["stop"], p["n_tickers"], st.st_mtime_ns, st.st_size])
+    return out
+
+
+def read_panel_meta(store_dir: str | Path) -> dict | None:
+    try:
+        return json.loads((Path(store_dir) / PANEL_META_NAME).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _first_stale(meta: dict | None, manifest: dict, signature: list[list], weights: dict, cal_name: str) -> int:
+    """
+    パネルのうち計算し直しが必要な最初の日付の位置（全部使えるならパネルの日付数）。
+    ある日のRSRはその日以前の終値だけで決まるので、書き換えられた最初の月より前の分はそのまま使える。
+    """
+    if (
+        meta is None
+        or meta.get("version") != PANEL_VERSION
+        or meta.get("tickers") != manifest["tickers"]
+        or meta.get("weights") != weights
+        or meta.get("cal") != cal_name
+    ):
+        return 0
+    n_done = int(meta["n_dates"])
+    old = meta.get("partitions", [])
+    for k, (a, b) in enumerate(zip(old, signature)):
+        if a != b:
+            start = manifest["partitions"][k]["start"]
+            return min(start, n_done)
+    if len(old) > len(signature):
+        return 0
+    return n_done
+
+
+def _copy_prefix(src: Path, dst, n_bytes: int, block: int = 1 << 24) -> None:
+    """src の先頭 n_bytes バイトを dst（書き込み用に開いたファイル）に写す。"""
+    with open(src, "rb") as f:
+        while n_bytes > 0:
+            buf = f.read(min(block, n_bytes))
+            if not buf:
+                raise ValueError(f"RSRパネルのファイルが meta より短いです（--full で作り直してください）: {src}")
+            dst.write(buf)
+            n_bytes -= len(buf)
+
+
+def update_rsr_panel(
+    csv_path: str | Path = CSV_PATH,
+    weights: dict[str, float] = WEIGHTS,
+    cal_name: str = CAL_NAME,
+    full: bool = False,
+) -> tuple[int, int]:
+    """
+    RSRパネルを作成/更新する。前回から変わっていない日付は計算し直さない
+    （add_price.py で日付が増えただけなら、新しい日付と最新月の分だけ計算する）。
+    full=True なら全部計算し直す。
+    return: (計算し直した最初の日付の位置, 計算した日付数)
+    """
+    store_dir = ensure_store(csv_path)
+    manifest = read_manifest(store_dir)
+    tickers, dates = load_store_index(csv_path)
+    signature = _partition_signature(store_dir, manifest)
+
+    meta = read_panel_meta(store_dir)
+    lo = 0 if full else _first_stale(meta, manifest, signature, weights, cal_name)
+    n, n_tickers = len(dates), len(tickers)
+    if lo >= n and meta is not None and meta["n_dates"] == n:
+        return n, 0
+
+    filled = forward_fill(load_store(store_dir).to_numpy())
+    cal = get_session_calendar(cal_name)
+
+    # 毎回別名の新しいファイルに書き、meta を置き換えてから古いファイルを消す
+    # （読み手が memmap している古いファイルは書き換えない。途中で落ちても meta は古いファイルを指したまま）
+    generation = (meta or {}).get("generation", 0) + 1
+    bin_name = f"{PANEL_PREFIX}{generation}.bin"
+    path = store_dir / bin_name
+
+    with open(path, "wb") as f:
+        if lo > 0:
+            # 計算し直さない先頭 lo 日分は古いファイルからそのまま写す
+            _copy_prefix(store_dir / meta["file"], f, lo * n_tickers * 8)
+        for a in range(lo, n, BLOCK_DATES):
+            b = min(a + BLOCK_DATES, n)
+            f.write(np.ascontiguousarray(compute_rsr_block(filled, dates, cal, a, b, weights)).tobytes())
+        f.flush()
+        os.fsync(f.fileno())
+
+    new_meta = {
+        "version": PANEL_VERSION,
+        "generation": generation,
+        "file": bin_name,
+        "tickers": tickers,
+        "n_dates": n,
+        "weights": dict(weights),
+        "cal": cal_name,
+        "partitions": signature,
+    }
+    # 一時ファイルに書いてから置き換える（読み手が書きかけを見ないように）
+    meta_path = store_dir / PANEL_META_NAME
+    tmp = meta_path.with_name(meta_path.name + ".tmp")
+    tmp.write_text(json.dumps(new_meta, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, meta_path)
+    for p in store_dir.glob(f"{PANEL_PREFIX}*.bin"):
+        if p.name != bin_name:
+            try:
+                p.unlink()
+            except OSError:
+                pass
+    return lo, n - lo
+
+
+def has_rsr_panel(store_dir: str | Path) -> bool:
+    return read_panel_meta(store_dir) is not None
+
+
+def open_rsr_panel(csv_path: str | Path = CSV_PATH, update: bool = True) -> RsrPanel:
+    """
+    RSRパネルを memmap で開く（コピーなし）。
+    update=True なら、価格ストアに増えた・変わった日付の分を先に計算する。
+    """
+    if update:
+        update_rsr_panel(csv_path)
+    store_dir = ensure_store(csv_path)
+    meta = read_panel_meta(store_dir)
+    if meta is None:
+        raise FileNotFoundError(f"RSRパネルがありません（python rsr_panel.py で作成してください）: {store_dir}")
+    n, tickers = meta["n_dates"], meta["tickers"]
+    dates = load_store_index(csv_path)[1][:n]
+    if n == 0 or len(tickers) == 0:
+        values = np.empty((n, len(tickers)))
+    else:
+        values = np.memmap(store_dir / meta["file"], dtype=np.float64, mode="r", shape=(n, len(tickers)))
+    return RsrPanel(values, tickers, dates)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="全銘柄 x 全営業日のRSRパネルを作成/更新します。")
+    ap.add_argument("--csv", default=CSV_PATH, help=f"終値ワイドCSV（default: {CSV_PATH}）")
+    ap.add_argument("--full", action="store_true", help="保存済みのパネルを使わず全部計算し直す")
+    ap.add_argument("--date", default=None, help="この日のランキングを表示する（YYYY-MM-DD）")
+    ap.add_argument("--top", type=int, default=10, help="--date のとき表示する件数（default: 10）")
+    args = ap.parse_args()
+
+    lo, n_new = update_rsr_panel(args.csv, full=args.full)
+    panel = open_rsr_panel(args.csv, update=False)
+    if n_new:
+        print(f"【保存】RSRパネルを更新しました: {ensure_store(args.csv)}（{panel.dates[lo].strftime('%Y-%m-%d')} 以降の {n_new} 日分を計算）")
+    else:
+        print("【完了】RSRパネルはすでに最新です。")
+    print(f"【結果】日付={len(panel.dates)}、銘柄={len(panel.tickers)}")
+
+    if args.date:
+        row = panel.on(args.date)
+        print(f"基準日: {row.name.strftime('%Y/%m/%d')}")
+        for i, (t, v) in enumerate(panel.ranking(args.date)[: args.top], 1):
+            print(f"{i}位：{t} : {v:.2f}(値)")
+
+
+if __name__ == "__main__":
+    main()
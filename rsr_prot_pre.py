@@ -4,10 +4,14 @@
 
 from typing import List, Tuple, Optional
 import pandas as pd
-import exchange_calendars as xcals
 from dateutil.relativedelta import relativedelta
 import matplotlib.pyplot as plt
 
+from asof_index import asof_index_for
+from price_store import load_close_wide
+from rsr_engine import WEIGHTS
+from session_calendar import get_session_calendar
+
 # ===== 入力パラメータ =====
 START_DATE = "2022-01-06"   # ← はじまり日
 HORIZON_MONTHS = 12         # ← 比較間隔（月） 例: 3, 6, 12
@@ -15,38 +19,11 @@ HORIZON_MONTHS = 12         # ← 比較間隔（月） 例: 3, 6, 12
 CSV_PATH = "prices_close_wide.csv"
 CAL_NAME = "XTKS"
 
-WEIGHTS = {
-    "q1": 0.4,
-    "q2": 0.2,
-    "q3": 0.2,
-    "y1": 0.2,
-}
-
-# ===== CSV =====
-def load_close_wide(csv_path: str) -> pd.DataFrame:
-    df = pd.read_csv(csv_path, index_col=0)
-    cols_dt = pd.to_datetime(df.columns, errors="coerce")
-    df = df.loc[:, ~cols_dt.isna()]
-    df.columns = pd.to_datetime(df.columns).normalize()
-    return df.reindex(sorted(df.columns), axis=1)
 
 # ===== カレンダー =====
-def prev_or_same_session(cal, ymd: str) -> pd.Timestamp:
-    ts = pd.Timestamp(ymd)
-    sessions = cal.sessions_in_range(ts - pd.Timedelta(days=40), ts)
-    return sessions[-1]
-
 def align_to_csv_available_date(df: pd.DataFrame, day: pd.Timestamp) -> pd.Timestamp:
     return pd.Timestamp(df.columns[df.columns <= day].max()).normalize()
 
-# ===== 価格取得 =====
-def pick_close_on_or_before(closes: pd.Series, day: pd.Timestamp) -> Optional[float]:
-    key = pd.Timestamp(day.date())
-    if key in closes.index:
-        return float(closes.loc[key])
-    idx = closes.index[closes.index <= key]
-    return float(closes.loc[idx[-1]]) if len(idx) else None
-
 # ===== RSR =====
 def safe_detect_number(p0, p1y, pq1, pq2, pq3) -> Optional[float]:
     vals = [p0, p1y, pq1, pq2, pq3]
@@ -71,48 +48,40 @@ def calc_scores_with_profit(
 ) -> List[Tuple[str, float, Optional[float]]]:
 
     df = load_close_wide(CSV_PATH)
-    cal = xcals.get_calendar(CAL_NAME)
+    cal = get_session_calendar(CAL_NAME)
 
     # 基準日
     s0 = align_to_csv_available_date(
         df,
-        prev_or_same_session(cal, start_date)
+        cal.prev_or_same_session(start_date)
     )
 
     # RSR用（過去）
-    s1y = prev_or_same_session(cal, (s0 - relativedelta(years=1)).strftime("%Y-%m-%d"))
-    sq1 = prev_or_same_session(cal, (s0 - relativedelta(months=3)).strftime("%Y-%m-%d"))
-    sq2 = prev_or_same_session(cal, (s0 - relativedelta(months=6)).strftime("%Y-%m-%d"))
-    sq3 = prev_or_same_session(cal, (s0 - relativedelta(months=9)).strftime("%Y-%m-%d"))
+    s1y = cal.prev_or_same_session((s0 - relativedelta(years=1)).strftime("%Y-%m-%d"))
+    sq1 = cal.prev_or_same_session((s0 - relativedelta(months=3)).strftime("%Y-%m-%d"))
+    sq2 = cal.prev_or_same_session((s0 - relativedelta(months=6)).strftime("%Y-%m-%d"))
+    sq3 = cal.prev_or_same_session((s0 - relativedelta(months=9)).strftime("%Y-%m-%d"))
 
     # 利益率用（未来）
     s_future = align_to_csv_available_date(
         df,
-        prev_or_same_session(
-            cal,
+        cal.prev_or_same_session(
             (s0 + relativedelta(months=horizon_months)).strftime("%Y-%m-%d")
         )
     )
 
     results = []
 
-    for ticker in df.index.astype(str):
-        closes = df.loc[ticker].dropna()
-        if closes.empty:
-            continue
-        closes.index = pd.to_datetime(closes.index).normalize()
+    # 全銘柄の6つの日付の終値（その日以前の直近値）を索引からまとめて引く
+    picked = asof_index_for(df).gather([s0, s1y, sq1, sq2, sq3, s_future])
 
-        p0  = pick_close_on_or_before(closes, s0)
-        p1y = pick_close_on_or_before(closes, s1y)
-        pq1 = pick_close_on_or_before(closes, sq1)
-        pq2 = pick_close_on_or_before(closes, sq2)
-        pq3 = pick_close_on_or_before(closes, sq3)
+    for ticker, prices in zip(df.index.astype(str), picked):
+        p0, p1y, pq1, pq2, pq3, p_future = (None if pd.isna(v) else float(v) for v in prices)
 
         score = safe_detect_number(p0, p1y, pq1, pq2, pq3)
         if score is None:
             continue
 
-        p_future = pick_close_on_or_before(closes, s_future)
         pr = profit_pct(p0, p_future)
 
         results.append((ticker, score, pr))
@@ -0,0 +1,255 @@
+# 説明: 新しい終値が届くたびにRSRとランキングを少しずつ更新するストリーミング版のRSR。各銘柄の4つの参照日の価格（1年前, 3/6/9か月前）と現在の順位をメモリに持ち、値が変わった銘柄だけを計算し直す。
+# 入力方法: `python rsr_stream.py --replay START END [--top 10] [--check]`（ストアの START より前の状態から、START〜END の営業日を1日ずつ流し込んで上位の入れ替わりを表示）。
+#           各スクリプトからは `StreamingRsr.from_store()` で作り、`feed_session(day, closes)` / `update(closes)` で終値を渡す。add_price.py の `--rsr-top N` からも使う。
+# 出力されるモノ: 標準出力に日ごとの上位の入れ替わり（--check ならRSRパネル/rank_rsr と同じ順位かの確認結果も）。ファイルは書かない。
+
+from __future__ import annotations
+
+import argparse
+import time
+from bisect import bisect_left, insort
+from pathlib import Path
+from typing import Mapping
+
+import numpy as np
+import pandas as pd
+
+from asof_index import forward_fill
+from price_store import CSV_PATH, ensure_store, load_store, load_store_index
+from rsr_engine import LOOKBACKS, WEIGHTS, rank_order, rsr_scores
+from session_calendar import SessionCalendar, get_session_calendar
+from ticker_alias import alias_index
+
+CAL_NAME = "XTKS"
+
+
+class StreamingRsr:
+    """
+    メモリ上で持ち続けるRSRのランキング。
+    - 営業日が進んだら（roll）：参照日の価格を全銘柄まとめて引き直し、ランキングを作り直す（1日1回）
+    - 同じ営業日の終値が届いたら（update）：その銘柄だけスコアを計算し、並びの中の位置を二分探索で入れ替える
+    スコアは rsr_engine.rsr_scores で計算し、並びは rank_order と同じ（同点は元の並び順）なので、
+    その日の終値を全部流し込んだ後のランキングは rank_rsr / RSRパネルと一致する。
+    """
+
+    def __init__(
+        self,
+        tickers,
+        dates: pd.DatetimeIndex,
+        filled: np.ndarray,
+        cal: SessionCalendar,
+        weights: dict[str, float] = WEIGHTS,
+    ):
+        """
+        dates / filled: それまでの営業日と、前方に埋めた終値（Ticker x 日付）。最後の日付を現在の営業日とする。
+        """
+        self.tickers = [str(t) for t in tickers]
+        self.weights = dict(weights)
+        self.cal = cal
+        self._aliases = alias_index(self.tickers)
+
+        dates = pd.DatetimeIndex(dates).normalize()
+        if len(dates) == 0:
+            raise ValueError("営業日が1日もありません。")
+        n = len(dates) - 1
+        # 過去の営業日の終値（現在の営業日は含まない）。日付が増えるたびに末尾に足すので、容量は倍々で広げる
+        self._hist = np.empty((len(self.tickers), max(n, 1) * 2))
+        self._hist[:, :n] = filled[:, :n]
+        self._hist_days = np.empty(max(n, 1) * 2, dtype="datetime64[D]")
+        self._hist_days[:n] = dates[:n].to_numpy(dtype="datetime64[D]")
+        self._n_hist = n
+
+        self.session = dates[-1]
+        self._p0 = np.array(filled[:, n], dtype=np.float64)
+        self._anchors = self._anchor_prices(self.session)
+        self._rebuild()
+
+    @classmethod
+    def from_store(
+        cls,
+        csv_path: str | Path = CSV_PATH,
+        day=None,
+        weights: dict[str, float] = WEIGHTS,
+        cal_name: str = CAL_NAME,
+    ) -> "StreamingRsr":
+        """価格ストアの day 以前で直近の日付（省略時は最新日）の状態から始める。"""
+        tickers, dates = load_store_index(csv_path)
+        filled = forward_fill(load_store(ensure_store(csv_path)).to_numpy())
+        pos = len(dates) - 1 if day is None else int(dates.searchsorted(pd.Timestamp(day).normalize(), side="right")) - 1
+        if pos < 0:
+            raise ValueError("CSVに指定日以前のデータがありません。")
+        return cls(tickers, dates[: pos + 1], filled[:, : pos + 1], get_session_calendar(cal_name), weights)
+
+    # ===== 参照日の価格 =====
+    def _anchor_prices(self, day: pd.Timestamp) -> np.ndarray:
+        """day を基準日にした4つの参照日（LOOKBACKS[1:] の順）の価格（Ticker x 4）。rsr_panel.reference_columns と同じ寄せ方。"""
+        days = self._hist_days[: self._n_hist]
+        out = np.full((len(self.tickers), len(LOOKBACKS) - 1), np.nan)
+        for k, lb in enumerate(LOOKBACKS[1:]):
+            s = self.cal.prev_or_same([day - pd.DateOffset(years=lb.years, months=lb.months)])[0]
+            if pd.isna(s):
+                continue
+            c = int(np.searchsorted(days, np.datetime64(s.date(), "D"), side="right")) - 1
+            if c >= 0:
+                out[:, k] = self._hist[:, c]
+        return out
+
+    def _push_history(self, day: pd.Timestamp, values: np.ndarray) -> None:
+        if self._n_hist == self._hist.shape[1]:
+            grown = np.empty((self._hist.shape[0], self._hist.shape[1] * 2))
+            grown[:, : self._n_hist] = self._hist[:, : self._n_hist]
+            days = np.empty(self._hist.shape[1] * 2, dtype="datetime64[D]")
+            days[: self._n_hist] = self._hist_days[: self._n_hist]
+            self._hist, self._hist_days = grown, days
+        self._hist[:, self._n_hist] = values
+        self._hist_days[self._n_hist] = np.datetime64(day.date(), "D")
+        self._n_hist += 1
+
+    # ===== スコアと並び =====
+    def _score_rows(self, rows: np.ndarray) -> np.ndarray:
+        picked = np.column_stack([self._p0[rows], self._anchors[rows]])
+        return rsr_scores(picked, self.weights)
+
+    def _rebuild(self) -> None:
+        self._scores = self._score_rows(np.arange(len(self.tickers)))
+        # (-スコア, 行番号) の昇順 = スコアの高い順、同点は元の並び順（rank_order と同じ）
+        self._keys = [(-float(self._scores[i]), int(i)) for i in rank_order(self._scores)]
+
+    def roll(self, day) -> None:
+        """営業日を day に進める（それまでの営業日の終値を履歴に入れ、参照日の価格を引き直す）。"""
+        day = pd.Timestamp(day).normalize()
+        if day <= self.session:
+            raise ValueError(f"営業日は進める方向にしか変えられません: {self.session.date()} → {day.date()}")
+        self._push_history(self.session, self._p0)
+        self.session = day
+        self._anchors = self._anchor_prices(day)
+        self._rebuild()
+
+    def update(self, closes: Mapping[str, float] | pd.Series) -> list[str]:
+        """
+        現在の営業日の終値を反映する（表記揺れ可。NaN と知らないTickerは無視）。
+        値が変わった銘柄だけスコアを計算し直し、並びの中で入れ替える。
+        return: スコアが変わったTicker
+        """
+        items = closes.items() if hasattr(closes, "items") else closes
+        rows, prices = [], []
+        for t, v in items:
+            i = self._aliases.position(str(t))
+            if i < 0 or v is None or pd.isna(v) or float(v) == self._p0[i]:
+                continue
+            rows.append(i)
+            prices.append(float(v))
+        if not rows:
+            return []
+
+        rows_arr = np.asarray(rows)
+        self._p0[rows_arr] = prices
+        new = self._score_rows(rows_arr)
+        for i, s in zip(rows, new):
+            old = self._scores[i]
+            if not np.isnan(old):
+                del self._keys[bisect_left(self._keys, (-float(old), i))]
+            if not np.isnan(s):
+                insort(self._keys, (-float(s), i))
+            self._scores[i] = s
+        return [self.tickers[i] for i in dict.fromkeys(rows)]
+
+    def feed_session(self, day, closes: Mapping[str, float] | pd.Series) -> list[str]:
+        """day の終値を流し込む（day が現在の営業日より後なら先に roll する）。過去の営業日は受け付けない。"""
+        day = pd.Timestamp(day).normalize()
+        if day < self.session:
+            raise ValueError(f"現在の営業日（{self.session.date()}）より前の終値です: {day.date()}")
+        if day > self.session:
+            self.roll(day)
+        return self.update(closes)
+
+    def feed_wide(self, wide: pd.DataFrame) -> None:
+        """
+        ワイド表（index=Ticker, columns=日付）を日付順に流し込む。
+        現在の営業日より前の列は、遅れていた銘柄の「いま分かっている最新の終値」として現在の営業日に反映する
+        （add_price.py は各Tickerの最後に値がある日から取り直すので、その値はメモリ上の値より新しい）。
+        """
+        # 列名は日付文字列のこともあるので、日付に直して並べる
+        days = pd.DatetimeIndex(pd.to_datetime(list(wide.columns))).normalize()
+        for k in np.argsort(days, kind="stable"):
+            day, col = days[k], wide.iloc[:, k].dropna()
+            if day <= self.session:
+                self.update(col)
+            else:
+                self.feed_session(day, col)
+
+    # ===== 読み出し =====
+    def ranking(self, n: int | None = None) -> list[tuple[str, float]]:
+        """[(Ticker, RSR), ...]（高い順。n を渡すと上位 n 件だけ）。"""
+        keys = self._keys if n is None else self._keys[:n]
+        return [(self.tickers[i], -s) for s, i in keys]
+
+    def rank(self, ticker: str) -> int | None:
+        """ticker の順位（1始まり）。計算できない・知らないTickerは None。"""
+        i = self._aliases.position(ticker)
+        if i < 0 or np.isnan(self._scores[i]):
+            return None
+        return bisect_left(self._keys, (-float(self._scores[i]), i)) + 1
+
+    def scores(self) -> pd.Series:
+        return pd.Series(self._scores.copy(), index=pd.Index(self.tickers, name="Ticker"), name=self.session)
+
+
+def print_top_changes(before: list[tuple[str, float]], after: list[tuple[str, float]], label: str) -> None:
+    """上位リストの入れ替わり（新しく入った / 外れた）を表示する。"""
+    old = {t for t, _ in before}
+    new = {t for t, _ in after}
+    entered = [t for t, _ in after if t not in old]
+    exited = [t for t, _ in before if t not in new]
+    if entered or exited:
+        print(f"{label} 入: {', '.join(entered) or '-'} / 出: {', '.join(exited) or '-'}")
+    else:
+        print(f"{label} 入れ替わりなし")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="保存済みの終値を1日ずつ流し込み、RSRランキングを少しずつ更新します。")
+    ap.add_argument("--replay", nargs=2, metavar=("START", "END"), required=True, help="流し込む期間（YYYY-MM-DD）")
+    ap.add_argument("--top", type=int, default=10, help="入れ替わりを見る上位の件数（default: 10）")
+    ap.add_argument("--check", action="store_true", help="各日のランキングを rank_rsr と同じ計算と突き合わせる")
+    ap.add_argument("--csv", default=CSV_PATH, help=f"終値ワイドCSV（default: {CSV_PATH}）")
+    args = ap.parse_args()
+
+    start, end = (pd.Timestamp(s).normalize() for s in args.replay)
+    tickers, dates = load_store_index(args.csv)
+    raw = load_store(ensure_store(args.csv))
+    sessions = dates[(dates >= start) & (dates <= end)]
+    lo = int(dates.searchsorted(start)) - 1
+    if lo < 0 or len(sessions) == 0:
+        raise SystemExit("【注意】流し込む営業日がありません（START より前の日付がストアに必要です）。")
+
+    filled = forward_fill(raw.to_numpy())
+    cal = get_session_calendar(CAL_NAME)
+    t0 = time.perf_counter()
+    scorer = StreamingRsr(tickers, dates[: lo + 1], filled[:, : lo + 1], cal)
+    print(f"【開始】{scorer.session.strftime('%Y/%m/%d')} の状態から {len(sessions)} 営業日を流し込みます（{time.perf_counter() - t0:.2f} 秒）")
+
+    if args.check:
+        from rsr_panel import compute_rsr_rows
+
+    n_updates, n_mismatch = 0, 0
+    t0 = time.perf_counter()
+    for day in sessions:
+        before = scorer.ranking(args.top)
+        n_updates += len(scorer.feed_session(day, raw[day].dropna()))
+        print_top_changes(before, scorer.ranking(args.top), day.strftime("%Y/%m/%d"))
+        if args.check:
+            pos = np.asarray([dates.get_loc(day)])
+            ref = compute_rsr_rows(filled, dates, cal, pos)[0]
+            expect = [(str(tickers[i]), float(ref[i])) for i in rank_order(ref)]
+            if scorer.ranking() != expect:
+                n_mismatch += 1
+                print(f"【注意】{day.strftime('%Y/%m/%d')} のランキングが rank_rsr と一致しません。")
+    elapsed = time.perf_counter() - t0
+    print(f"【速度】{len(sessions)} 営業日 / 終値 {n_updates} 件 / {elapsed:.2f} 秒")
+    if args.check:
+        print(f"【結果】rank_rsr と一致しない日: {n_mismatch} / {len(sessions)}")
+
+
+if __name__ == "__main__":
+    main()
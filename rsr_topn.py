@@ -0,0 +1,184 @@
+# 説明: 複数の基準日のRSR上位N銘柄を1回でまとめて求め、(基準日, 順位) を索引にした1つの表にする。rsr_old.py を日付ごとに呼び出す代わりに使う。
+# 入力方法: `python rsr_topn.py [YYYY_MM_DD ...] [--start YYYY-MM-DD --end YYYY-MM-DD --every 1] [--top 40] [--export] [--csv prices_close_wide.csv]`
+#           （日付を省略すると CSV の最新日）。RSRパネル（rsr_panel.py）があればそこから切り出し、無ければ指定日の分だけ計算する。
+# 出力されるモノ: `top{N}_membership.csv`（date, rank, Ticker, RSR）。`--export` を付けると rsr_old.py と同じ形式の top{N}_tse_YYYYMMDD.txt も日付ごとに保存し、
+#                 各日付について "YYYY-MM-DD,N" を標準出力に出力。
+
+from __future__ import annotations
+
+import argparse
+import datetime as _dt
+import time
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from asof_index import forward_fill
+from price_store import CSV_PATH, ensure_store, latest_date_with_any_data, load_store, load_store_index
+from rsr_engine import WEIGHTS
+from rsr_panel import BLOCK_DATES, compute_rsr_rows, has_rsr_panel, open_rsr_panel
+from session_calendar import get_session_calendar
+
+CAL_NAME = "XTKS"
+TOP_NUMBER = 40
+
+
+def _parse_day(s: str) -> pd.Timestamp:
+    """YYYY_MM_DD / YYYY-MM-DD / YYYY/MM/DD を受け付ける。"""
+    try:
+        return pd.Timestamp(_dt.datetime.strptime(str(s).strip().replace("/", "-").replace("_", "-"), "%Y-%m-%d"))
+    except ValueError as e:
+        raise ValueError(f"日付の形式が不正です。YYYY_MM_DD（例: 2024_12_30）で指定してください: {s}") from e
+
+
+def base_positions(dates: pd.DatetimeIndex, cal, days) -> np.ndarray:
+    """
+    各 days を rsr_old.py と同じく「その日以前の直近営業日 → その日以前の直近のストアの日付」に寄せた位置（重複なし、昇順）。
+    """
+    sessions = cal.prev_or_same(days)
+    if sessions.isna().any():
+        raise ValueError("指定日以前の営業日が見つかりません。")
+    pos = dates.searchsorted(sessions, side="right") - 1
+    if (pos < 0).any():
+        raise ValueError("CSVに指定日以前のデータがありません。")
+    return np.unique(pos)
+
+
+def rsr_rows(
+    positions: np.ndarray,
+    csv_path: str | Path = CSV_PATH,
+    weights: dict[str, float] = WEIGHTS,
+    cal_name: str = CAL_NAME,
+    filled: np.ndarray | None = None,
+) -> np.ndarray:
+    """
+    ストアの positions 番目の日付のRSR（len(positions) x Ticker）。
+    既定の重みでRSRパネルがあればパネルから切り出し（増えた日付は先に計算される）、無ければその日付の分だけ計算する。
+    filled: 呼び出し側で読み込み済みの前方埋めした終値（Ticker x 日付）があれば渡す（ストアを読み直さない）
+    """
+    store_dir = ensure_store(csv_path)
+    if weights == WEIGHTS and has_rsr_panel(store_dir):
+        return np.asarray(open_rsr_panel(csv_path).values[positions])
+
+    tickers, dates = load_store_index(csv_path)
+    if filled is None:
+        filled = forward_fill(load_store(store_dir).to_numpy())
+    cal = get_session_calendar(cal_name)
+    out = np.empty((len(positions), len(tickers)))
+    for a in range(0, len(positions), BLOCK_DATES):
+        b = min(a + BLOCK_DATES, len(positions))
+        out[a:b] = compute_rsr_rows(filled, dates, cal, positions[a:b], weights)
+    return out
+
+
+def top_n_columns(scores: np.ndarray, n: int) -> list[np.ndarray]:
+    """
+    各行（基準日）のスコア上位 n 個の列番号（高い順、NaN は除く）。同点は列の並び順で、rsr_engine.rank_order の先頭 n 個と同じになる。
+    argpartition で n 番目の値を全行まとめて求め、その値以上の候補だけを並べ替える。
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    n_rows, n_cols = scores.shape
+    k = min(n, n_cols)
+    if k == 0:
+        return [np.empty(0, dtype=np.int64) for _ in range(n_rows)]
+    neg = np.where(np.isnan(scores), np.inf, -scores)
+    kth = np.take_along_axis(neg, np.argpartition(neg, k - 1, axis=1)[:, k - 1 : k], axis=1)
+    out = []
+    for i in range(n_rows):
+        cand = np.flatnonzero((neg[i] <= kth[i]) & ~np.isnan(scores[i]))
+        order = np.lexsort((cand, neg[i, cand]))
+        out.append(cand[order][:k])
+    return out
+
+
+def top_n_membership(
+    days,
+    n: int = TOP_NUMBER,
+    csv_path: str | Path = CSV_PATH,
+    weights: dict[str, float] = WEIGHTS,
+    cal_name: str = CAL_NAME,
+) -> pd.DataFrame:
+    """
+    複数の基準日のRSR上位 n 銘柄をまとめて求める。
+    return: index=(date, rank) / columns=Ticker, RSR の表（rank は 1 始まり、基準日はストアの日付に寄せた後の日）
+    """
+    tickers, dates = load_store_index(csv_path)
+    cal = get_session_calendar(cal_name)
+    positions = base_positions(dates, cal, days)
+    scores = rsr_rows(positions, csv_path, weights, cal_name)
+
+    names = np.asarray(tickers, dtype=object)
+    parts = []
+    for i, cols in enumerate(top_n_columns(scores, n)):
+        parts.append(pd.DataFrame({
+            "date": dates[positions[i]],
+            "rank": np.arange(1, len(cols) + 1),
+            "Ticker": names[cols],
+            "RSR": scores[i, cols],
+        }))
+    if not parts:
+        return pd.DataFrame(columns=["Ticker", "RSR"], index=pd.MultiIndex.from_arrays([[], []], names=["date", "rank"]))
+    return pd.concat(parts, ignore_index=True).set_index(["date", "rank"])
+
+
+def tse_list_text(tickers) -> str:
+    """Tickerの並びを "TSE:7203,TSE:6758,...," の形にする（"7203.T" → "TSE:7203"、最後もカンマを付ける）。"""
+    return ",".join(f"TSE:{str(t).split('.')[0]}" for t in tickers) + ","
+
+
+def export_top_texts(table: pd.DataFrame, n: int, out_dir: str | Path = ".") -> list[tuple[pd.Timestamp, Path, int]]:
+    """
+    top_n_membership の表を、基準日ごとに rsr_old.py と同じ top{n}_tse_YYYYMMDD.txt に書き出す。
+    return: [(基準日, 保存先, 銘柄数), ...]
+    """
+    out = []
+    for day, g in table.groupby(level="date", sort=True):
+        path = Path(out_dir) / f"top{n}_tse_{pd.Timestamp(day).strftime('%Y%m%d')}.txt"
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(tse_list_text(g["Ticker"]))
+        out.append((pd.Timestamp(day), path, len(g)))
+    return out
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="複数の基準日のRSR上位N銘柄をまとめて求めます。")
+    ap.add_argument("dates", nargs="*", help="基準日（YYYY_MM_DD / YYYY-MM-DD / YYYY/MM/DD）。未指定でCSV最新日")
+    ap.add_argument("--start", default=None, help="基準日を --every か月ごとに並べる最初の日")
+    ap.add_argument("--end", default=None, help="--start から並べる最後の日（default: CSV最新日）")
+    ap.add_argument("--every", type=int, default=1, help="--start からの間隔（か月, default: 1）")
+    ap.add_argument("--top", type=int, default=TOP_NUMBER, help=f"上位何銘柄か（default: {TOP_NUMBER}）")
+    ap.add_argument("--out", default=None, help="表の保存先（default: top{N}_membership.csv）")
+    ap.add_argument("--export", action="store_true", help="日付ごとの top{N}_tse_YYYYMMDD.txt も保存する")
+    ap.add_argument("--csv", default=CSV_PATH, help=f"終値ワイドCSV（default: {CSV_PATH}）")
+    args = ap.parse_args()
+
+    days = [_parse_day(s) for s in args.dates]
+    if args.start:
+        end = _parse_day(args.end) if args.end else latest_date_with_any_data(args.csv)
+        k = 0
+        while (day := _parse_day(args.start) + pd.DateOffset(months=k * args.every)) <= end:
+            days.append(day)
+            k += 1
+    if not days:
+        latest = latest_date_with_any_data(args.csv)
+        if latest is None:
+            raise SystemExit("CSV内に有効な日付データが見つかりません。")
+        days = [latest]
+
+    t0 = time.perf_counter()
+    table = top_n_membership(days, args.top, args.csv)
+    n_days = table.index.get_level_values("date").nunique()
+    print(f"【速度】{n_days} 日分の上位 {args.top} 銘柄 / {time.perf_counter() - t0:.2f} 秒")
+
+    out = args.out or f"top{args.top}_membership.csv"
+    table.to_csv(out, date_format="%Y-%m-%d")
+    print(f"【保存】{out}（{n_days} 日 / {len(table)} 行）")
+
+    if args.export:
+        for day, _path, saved_n in export_top_texts(table, args.top):
+            print(f"{day.strftime('%Y-%m-%d')},{saved_n}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+# 説明: 取引所の営業日一覧（既定は東証 XTKS）をディスクに保存しておき、「その日以前/以後の直近営業日」を二分探索でまとめて求める。exchange_calendars は保存し直すときだけ読み込む。
+# 入力方法: 各スクリプトから `from session_calendar import get_session_calendar` として使う。`python session_calendar.py [--refresh]` で保存し直す。
+# 出力されるモノ: リポジトリ直下の `calendar_cache/XTKS.npz`（営業日の配列と作成日）。
+
+from __future__ import annotations
+
+import argparse
+import os
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+CACHE_DIR = Path(__file__).resolve().with_name("calendar_cache")
+CAL_NAME = "XTKS"
+# 保存する範囲の始まり（終わりは exchange_calendars の既定 = 今日からおよそ1年先まで）
+START = "2000-01-01"
+# 祝日の追加・変更を取り込むため、この日数より古い保存は作り直す
+REFRESH_DAYS = 30
+# 直近営業日を探すときに遡る/進む上限（これより離れていたら「見つからない」扱い）
+MAX_GAP_DAYS = 40
+
+
+class SessionCalendar:
+    """
+    営業日の配列から作る軽いカレンダー。
+    - prev_or_same(days) / next_or_same(days) : 日付の配列をまとめて直近営業日に寄せる（見つからなければ NaT）
+    - prev_or_same_session(day)                : 1件版（見つからなければ ValueError）
+    - sessions_in_range(start, end)            : exchange_calendars と同じ使い方で範囲の営業日を返す
+    """
+
+    def __init__(self, sessions, name: str = CAL_NAME):
+        self.name = name
+        self.sessions = pd.DatetimeIndex(sessions).normalize()
+        self._days = self.sessions.to_numpy(dtype="datetime64[D]")
+
+    def _to_days(self, days) -> np.ndarray:
+        return pd.DatetimeIndex(pd.to_datetime(list(np.atleast_1d(days)))).normalize().to_numpy(dtype="datetime64[D]")
+
+    def prev_or_same(self, days) -> pd.DatetimeIndex:
+        """各日付の「その日以前の直近営業日」（その日が営業日ならその日）。"""
+        d = self._to_days(days)
+        i = np.searchsorted(self._days, d, side="right") - 1
+        found = self._days[i.clip(min=0)]
+        ok = (i >= 0) & (d - found <= np.timedelta64(MAX_GAP_DAYS, "D"))
+        return pd.DatetimeIndex(np.where(ok, found, np.datetime64("NaT")))
+
+    def next_or_same(self, days) -> pd.DatetimeIndex:
+        """各日付の「その日以後の直近営業日」（その日が営業日ならその日）。"""
+        d = self._to_days(days)
+        i = np.searchsorted(self._days, d, side="left")
+        found = self._days[i.clip(max=len(self._days) - 1)]
+        ok = (i < len(self._days)) & (found - d <= np.timedelta64(MAX_GAP_DAYS, "D"))
+        return pd.DatetimeIndex(np.where(ok, found, np.datetime64("NaT")))
+
+    def prev_or_same_session(self, day) -> pd.Timestamp:
+        s = self.prev_or_same([day])[0]
+        if pd.isna(s):
+            raise ValueError("指定日以前の営業日が見つかりません。")
+        return s
+
+    def next_or_same_session(self, day) -> pd.Timestamp:
+        s = self.next_or_same([day])[0]
+        if pd.isna(s):
+            raise ValueError("指定日以後の営業日が見つかりません。")
+        return s
+
+    def is_session(self, days) -> np.ndarray:
+        d = self._to_days(days)
+        i = np.searchsorted(self._days, d, side="left").clip(max=len(self._days) - 1)
+        return self._days[i] == d
+
+    def sessions_in_range(self, start, end) -> pd.DatetimeIndex:
+        """[start, end] の営業日（両端を含む）。"""
+        lo = self.sessions.searchsorted(pd.Timestamp(start).normalize(), side="left")
+        hi = self.sessions.searchsorted(pd.Timestamp(end).normalize(), side="right")
+        return self.sessions[lo:hi]
+
+
+def cache_path(name: str = CAL_NAME) -> Path:
+    return CACHE_DIR / f"{name}.npz"
+
+
+def build_session_cache(name: str = CAL_NAME) -> SessionCalendar:
+    """exchange_calendars から営業日一覧を作り直して保存する（ここでだけ exchange_calendars を読み込む）。"""
+    import exchange_calendars as xcals
+
+    cal = xcals.get_calendar(name, start=START)
+    sessions = pd.DatetimeIndex(cal.sessions).normalize().to_numpy(dtype="datetime64[D]")
+
+    path = cache_path(name)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(path.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, sessions=sessions, built=np.datetime64(pd.Timestamp.today().date(), "D"))
+    os.replace(tmp, path)
+    return SessionCalendar(sessions, name)
+
+
+def _load_cache(name: str) -> SessionCalendar | None:
+    try:
+        with np.load(cache_path(name), allow_pickle=False) as z:
+            sessions, built = z["sessions"], z["built"]
+    except (OSError, ValueError, KeyError):
+        return None
+    today = np.datetime64(pd.Timestamp.today().date(), "D")
+    if today - built > np.timedelta64(REFRESH_DAYS, "D") or len(sessions) == 0 or sessions[-1] < today:
+        return None
+    return SessionCalendar(sessions, name)
+
+
+_LOADED: dict[str, SessionCalendar] = {}
+
+
+def get_session_calendar(name: str = CAL_NAME, refresh: bool = False) -> SessionCalendar:
+    """
+    保存済みの営業日一覧を返す（同じプロセス内では1回だけ読む）。
+    無い・古い・refresh=True のときだけ exchange_calendars で作り直す。
+    """
+    if not refresh and name in _LOADED:
+        return _LOADED[name]
+    cal = None if refresh else _load_cache(name)
+    if cal is None:
+        cal = build_session_cache(name)
+    _LOADED[name] = cal
+    return cal
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="取引所の営業日一覧を保存します。")
+    ap.add_argument("--name", default=CAL_NAME, help=f"取引所カレンダー名（default: {CAL_NAME}）")
+    ap.add_argument("--refresh", action="store_true", help="保存済みでも exchange_calendars から作り直す")
+    args = ap.parse_args()
+
+    cal = get_session_calendar(args.name, refresh=args.refresh)
+    print(f"【保存】営業日一覧: {cache_path(args.name)}")
+    print(f"【結果】{cal.sessions[0].strftime('%Y-%m-%d')} 〜 {cal.sessions[-1].strftime('%Y-%m-%d')}（{len(cal.sessions)} 日）")
+
+
+if __name__ == "__main__":
+    main()
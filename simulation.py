@@ -6,6 +6,10 @@ import re
 from pathlib import Path
 import pandas as pd
 
+from asof_index import asof_index_for
+from price_store import load_close_wide
+from ticker_alias import alias_index
+
 # 入力ファイル
 TOP45_PATH = Path("top45_codes_20241230.csv")
 WIDE_PATH  = Path("prices_close_wide.csv")
@@ -44,64 +48,6 @@ def extract_codes_from_csv(path: Path) -> list[str]:
     return uniq
 
 
-def load_close_wide(path: Path) -> pd.DataFrame:
-    """
-    prices_close_wide.csv を読み込み、列を日付に正規化して昇順に整列。
-    余計な列があれば日付に変換できる列だけ残す。
-    """
-    df = pd.read_csv(path, index_col=0)
-
-    cols_dt = pd.to_datetime(df.columns, errors="coerce")
-    ok = ~cols_dt.isna()
-    df = df.loc[:, ok].copy()
-
-    df.columns = pd.to_datetime(df.columns, errors="coerce").normalize()
-    df = df.reindex(sorted(df.columns), axis=1)
-    return df
-
-
-def resolve_row_key(df: pd.DataFrame, code: str) -> str | None:
-    """
-    インデックスが '7203.T' / 'TSE:7203' / '7203' など色々でも拾えるようにする。
-    """
-    idx = df.index.astype(str)
-    idx_set = set(idx.tolist())
-
-    candidates = [f"{code}.T", f"TSE:{code}", code]
-    for k in candidates:
-        if k in idx_set:
-            return k
-
-    for k in idx_set:
-        if k.endswith(f"{code}.T") or k == f"TSE:{code}" or k.endswith(code):
-            return k
-
-    return None
-
-
-def last_value_on_or_before(row: pd.Series, target: pd.Timestamp) -> tuple[float | None, pd.Timestamp | None]:
-    """
-    target日付以前で、値が入っている直近の値を返す
-    """
-    s = row.dropna()
-    if s.empty:
-        return None, None
-    s = s[s.index <= target]
-    if s.empty:
-        return None, None
-    return float(s.iloc[-1]), pd.Timestamp(s.index[-1])
-
-
-def last_value(row: pd.Series) -> tuple[float | None, pd.Timestamp | None]:
-    """
-    最新日（rowの最後に値がある日）の値を返す
-    """
-    s = row.dropna()
-    if s.empty:
-        return None, None
-    return float(s.iloc[-1]), pd.Timestamp(s.index[-1])
-
-
 def main() -> None:
     codes = extract_codes_from_csv(TOP45_PATH)
     if not codes:
@@ -112,19 +58,20 @@ def main() -> None:
     ok_rows = []      # 計算できた銘柄
     ng_rows = []      # エラー/データ不足
 
+    # 表記揺れ（7203 / 7203.T / TSE:7203）をまとめて正式な行名に変換
+    keys = alias_index(df.index).resolve_many(codes)
+    # 「その日以前で直近の値」は索引から添字で引く（行ごとに全期間を走査しない）
+    asof = asof_index_for(df)
+
     # 元CSVでの順番を持たせる（1始まり）
-    for pos, code in enumerate(codes, start=1):
+    for pos, (code, key) in enumerate(zip(codes, keys), start=1):
         ticker = f"{code}.T"
-
-        key = resolve_row_key(df, code)
         if key is None:
             ng_rows.append((pos, ticker, "prices_close_wideに行が見つかりません"))
             continue
 
-        row = df.loc[key]
-
-        past_val, _past_used = last_value_on_or_before(row, PAST_DATE)
-        now_val, _now_used = last_value(row)
+        past_val, _past_used = asof.value_and_date(key, PAST_DATE)
+        now_val, _now_used = asof.latest(key)
 
         if past_val is None:
             ng_rows.append((pos, ticker, f"過去データ不足: {PAST_DATE.date()}以前が空"))
@@ -9,6 +9,10 @@ import argparse
 from pathlib import Path
 import pandas as pd
 
+from asof_index import asof_index_for
+from jit_kernels import buy_sell_pnl
+from price_store import load_close_wide
+
 # ========= デフォルト設定 =========
 DEFAULT_TOP_PATH = Path("top45_codes_20241230.txt")   # 参照する銘柄リスト（txt / csv）
 DEFAULT_WIDE_PATH = Path("prices_close_wide.csv")     # 終値ワイドCSV
@@ -49,7 +53,11 @@ def extract_codes_from_any_text(path: Path) -> list[str]:
     except Exception:
         text = path.read_text(encoding="utf-8", errors="ignore")
         vals = re.split(r"[\s,]+", text)
+    return extract_codes(vals)
+
 
+def extract_codes(vals) -> list[str]:
+    """文字列の並び（"TSE:7203" / "7203.T" など）から4桁コードを取り出す（重複除去、順序維持）。"""
     codes = []
     for v in vals:
         m = re.search(r"(\d{4})", str(v))
@@ -65,33 +73,6 @@ def extract_codes_from_any_text(path: Path) -> list[str]:
     return uniq
 
 
-def load_close_wide(path: Path) -> pd.DataFrame:
-    df = pd.read_csv(path, index_col=0)
-    cols_dt = pd.to_datetime(df.columns, errors="coerce")
-    df = df.loc[:, ~cols_dt.isna()].copy()
-    df.columns = pd.to_datetime(df.columns).normalize()
-    return df.reindex(sorted(df.columns), axis=1)
-
-
-def resolve_row_key(df: pd.DataFrame, code: str) -> str | None:
-    idx = df.index.astype(str).tolist()
-    for k in (f"{code}.T", f"TSE:{code}", code):
-        if k in idx:
-            return k
-    for k in idx:
-        if k.endswith(code):
-            return k
-    return None
-
-
-def last_value_on_or_before(row: pd.Series, target: pd.Timestamp):
-    s = row.dropna()
-    s = s[s.index <= target]
-    if s.empty:
-        return None, None
-    return float(s.iloc[-1]), pd.Timestamp(s.index[-1])
-
-
 def main(argv=None) -> None:
     argv = sys.argv if argv is None else argv
     args = _parse_args(argv)
@@ -106,36 +87,43 @@ def main(argv=None) -> None:
         raise SystemExit("銘柄コードを抽出できませんでした")
 
     df = load_close_wide(Path(args.wide))
+    print_onebuy_report(df, codes, buy_date, sell_date, args.top)
+
 
+def print_onebuy_report(df: pd.DataFrame, codes: list[str], buy_date: pd.Timestamp, sell_date: pd.Timestamp, list_label) -> None:
+    """
+    読み込み済みの終値ワイド表で、codes を各1株ずつ buy_date に買い sell_date に売った損益を表示する。
+    simulation_v3.py など、同じプロセス内から呼ぶときもこれを使う（CSVを読み直さない）。
+    """
     ok_rows, ng_rows = [], []
 
-    for pos, code in enumerate(codes, start=1):
+    # 表記揺れ（7203 / 7203.T / TSE:7203）をまとめて正式な行名に変換（見つからなければ -1）
+    asof = asof_index_for(df)
+    rows = asof.rows(codes)
+    # 全銘柄の買値・売値（その日以前で直近の値）を索引からまとめて引き、損益もまとめて計算する
+    vals, used = asof.lookup(rows[:, None], asof.columns([buy_date, sell_date])[None, :])
+    buy_all, sell_all = vals[:, 0], vals[:, 1]
+    _cost, _value, diff_all, pct_all = buy_sell_pnl(buy_all, sell_all)
+
+    for k, code in enumerate(codes):
+        pos = k + 1
         ticker = f"{code}.T"
-        key = resolve_row_key(df, code)
-        if key is None:
+        if rows[k] < 0:
             ng_rows.append((pos, ticker, "行が見つかりません"))
             continue
-
-        row = df.loc[key]
-        buy, buy_used = last_value_on_or_before(row, buy_date)
-        sell, sell_used = last_value_on_or_before(row, sell_date)
-
-        if buy is None or sell is None or buy == 0:
+        if used[k, 0] < 0 or used[k, 1] < 0 or buy_all[k] == 0:
             ng_rows.append((pos, ticker, "データ不足"))
             continue
 
-        diff = sell - buy
-        pct = diff / buy * 100.0
-
         ok_rows.append({
             "pos": pos,
             "ticker": ticker,
-            "buy": buy,
-            "sell": sell,
-            "diff": diff,
-            "pct": pct,
-            "buy_used": buy_used,
-            "sell_used": sell_used,
+            "buy": float(buy_all[k]),
+            "sell": float(sell_all[k]),
+            "diff": float(diff_all[k]),
+            "pct": float(pct_all[k]),
+            "buy_used": asof.dates[used[k, 0]],
+            "sell_used": asof.dates[used[k, 1]],
         })
 
     ok_rows.sort(key=lambda x: x["pct"], reverse=True)
@@ -146,7 +134,7 @@ def main(argv=None) -> None:
     total_pct = total_profit / total_buy * 100 if total_buy else float("nan")
 
     print("ーーーー")
-    print(f"条件: 各銘柄1株 / BUY={buy_date.date()} / SELL={sell_date.date()} / LIST={args.top}")
+    print(f"条件: 各銘柄1株 / BUY={buy_date.date()} / SELL={sell_date.date()} / LIST={list_label}")
     print("")
 
     for r in ok_rows:
@@ -1,20 +1,24 @@
-# 説明: `rsr_old.py` を実行して生成された銘柄リスト名を受け、`simulation_onebuy_in_v3.py` を呼び出すオーケストレータ。
-# 入力方法: 同ディレクトリで `python simulation_v3.py` を実行（`rsr_old.py` が存在し正常に実行可能であること）。
-# 出力されるモノ: `rsr_old.py` と `simulation_onebuy_in_v3.py` の標準出力を表示し、最後に `prices_close_wide.csv` を用いて日経平均の利益率（%）を標準出力に表示。
+# 説明: 指定日のRSR上位銘柄を求め、各1株ずつ買って今日売った損益と日経平均の利益率を表示するスクリプト。rsr_old.py / simulation_onebuy_in_v3.py を別プロセスで呼ばず、同じプロセス内で価格を1回だけ読んで計算する。
+# 入力方法: 同ディレクトリで `python simulation_v3.py` を実行（内部定数 `date_str`, `TOP_NUMBER` を使用）。複数の入れ替え日を続けて回したいときは backtest.py を使う。
+# 出力されるモノ: 基準日と銘柄数（"YYYY-MM-DD,N"）、simulation_onebuy_in_v3.py と同じ損益表、最後に `prices_close_wide.csv` を用いて日経平均の利益率（%）を標準出力に表示。ファイルは書かない。
 
-import subprocess
 import datetime
-import sys
 import pandas as pd
-from pathlib import Path
 
+from asof_index import asof_index_for
+from price_store import load_close_wide
+from rsr_topn import top_n_membership
+from simulation_onebuy_in_v3 import extract_codes, print_onebuy_report
+
+CSV_PATH = "prices_close_wide.csv"
+TOP_NUMBER = 40
 
 # 実行日（明示指定 or 今日）
 date_str = "2024_12_30"
 date_str_today = datetime.date.today().strftime("%Y_%m_%d")
 
 def nikkei225_return_pct(
-    csv_path: str | Path,
+    df: pd.DataFrame,
     buy_date: str,
     sell_date: str,
     ticker: str = "^N225",
@@ -26,20 +30,11 @@ def nikkei225_return_pct(
     日付がCSVに無い場合は、その日以前の直近データを使用。
     """
 
-    df = pd.read_csv(csv_path, index_col=0)
-
-    # 日付列を正規化
-    df.columns = pd.to_datetime(df.columns, errors="coerce").normalize()
-    df = df.loc[:, ~df.columns.isna()].copy()
-    df = df.reindex(sorted(df.columns), axis=1)
+    asof = asof_index_for(df)
 
     if ticker not in df.index:
         raise ValueError(f"{ticker} がCSVに見つかりません")
 
-    row = df.loc[ticker].dropna()
-    if row.empty:
-        raise ValueError(f"{ticker} のデータが空です")
-
     buy_date = pd.Timestamp(buy_date.replace("_", "-")).normalize()
     sell_date = pd.Timestamp(sell_date.replace("_", "-")).normalize()
 
@@ -47,62 +42,42 @@ def nikkei225_return_pct(
         raise ValueError("売る日が買う日より前です")
 
     # 買値（buy_date 以前の直近）
-    buy_series = row[row.index <= buy_date]
-    if buy_series.empty:
+    buy_price = asof.value(ticker, buy_date)
+    if buy_price is None:
         raise ValueError("買い日のデータが見つかりません")
-    buy_price = float(buy_series.iloc[-1])
 
     # 売値（sell_date 以前の直近）
-    sell_series = row[row.index <= sell_date]
-    if sell_series.empty:
+    sell_price = asof.value(ticker, sell_date)
+    if sell_price is None:
         raise ValueError("売り日のデータが見つかりません")
-    sell_price = float(sell_series.iloc[-1])
 
     return (sell_price - buy_price) / buy_price * 100.0
 
-# 実行コマンド
-cmd = [sys.executable, "rsr_old.py", date_str]
-
-# コマンド実行（標準出力をキャプチャ）
-result = subprocess.run(cmd, capture_output=True, text=True)
-
-# エラーがあれば即表示
-if result.returncode != 0:
-    print("=== STDERR ===")
-    print(result.stderr)
-    raise RuntimeError("rsr_old.py failed")
-
-# 標準出力（例: "2025-08-29,45"）
-out = result.stdout.strip()
-print("=== STDOUT ===")
-print(out)
-
-# ---- ここがポイント ----
-date_out, saved_n_str = out.split(",")
-saved_n = int(saved_n_str)
-
-ymd = date_out.replace("-", "")  # "20250829"
 
-f_name = f"top{saved_n}_tse_{ymd}.txt"
+def main() -> None:
+    buy_date = pd.Timestamp(date_str.replace("_", "-")).normalize()
+    sell_date = pd.Timestamp(date_str_today.replace("_", "-")).normalize()
 
-print("生成されたファイル名:")
-print(f_name)
+    # 価格はここで1回だけ読む
+    df = load_close_wide(CSV_PATH)
 
-# 実行コマンド
-cmd = [sys.executable, "simulation_onebuy_in_v3.py", date_str, date_str_today,"--top",f_name]
+    # RSR上位（rsr_old.py と同じ基準日の寄せ方・同じ並び）
+    table = top_n_membership([buy_date], TOP_NUMBER, CSV_PATH)
+    if table.empty:
+        print(f"【注意】{buy_date.strftime('%Y-%m-%d')} 時点でRSRを計算できる銘柄がありません（過去1年分の終値が無い可能性）。")
+        return
+    date_out = table.index.get_level_values("date")[0]
+    saved_n = len(table)
+    print(f"{date_out.strftime('%Y-%m-%d')},{saved_n}")
 
-print(cmd)
+    # top{N}_tse_YYYYMMDD.txt を書いて読み直す代わりに、同じ規則でコードを取り出す
+    codes = extract_codes(table["Ticker"])
+    list_label = f"top{saved_n}_tse_{date_out.strftime('%Y%m%d')}.txt"
+    print_onebuy_report(df, codes, buy_date, sell_date, list_label)
 
-# コマンド実行（標準出力をキャプチャ）
-result = subprocess.run(cmd, capture_output=True, text=True)
-out = result.stdout.strip()
-print("=== STDOUT ===")
-print(out)
+    pct = nikkei225_return_pct(df, date_str, date_str_today)
+    print(f"日経平均 利益率: {pct:.2f}%")
 
-pct = nikkei225_return_pct(
-    "prices_close_wide.csv",
-    date_str,
-    date_str_today,
-)
 
-print(f"日経平均 利益率: {pct:.2f}%")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
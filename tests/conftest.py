@@ -0,0 +1,8 @@
+# 説明: テストからリポジトリ直下のモジュール（fetch_engine.py など）を import できるようにする。
+# 入力方法: リポジトリ直下で `python -m pytest -q tests` を実行。
+# 出力されるモノ: なし。
+
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
@@ -0,0 +1,71 @@
+# 説明: fetch_engine が複数スレッドから取得元を呼んでも、チャンクの結果が混ざったり欠けたりしないことを確かめるテスト。
+#       yfinance の代わりに、yf.download と同じく「呼ぶたびにモジュール全体の結果置き場を空にしてから使う」偽モジュールを差し込む。
+# 入力方法: リポジトリ直下で `python -m pytest -q tests` を実行（ネットワーク不要）。
+# 出力されるモノ: なし（pytest の結果のみ）。
+
+import sys
+import threading
+import time
+import types
+
+import numpy as np
+import pandas as pd
+
+from fetch_engine import fetch_wide, source_downloader
+from price_source import YFinanceSource
+
+DATES = pd.bdate_range("2024-01-01", periods=5)
+
+
+def _price(ticker: str) -> float:
+    return float(int(ticker.split(".")[0]))
+
+
+def _fake_yfinance() -> types.ModuleType:
+    """yfinance.shared._DFS と同じく、結果をモジュール全体で1つの dict に溜めてから表にする偽の yf.download。"""
+    yf = types.ModuleType("yfinance")
+    state = {"dfs": {}, "active": 0, "max_active": 0}
+    guard = threading.Lock()
+
+    def download(tickers, interval="1d", progress=False, threads=True, **kwargs):
+        with guard:
+            state["active"] += 1
+            state["max_active"] = max(state["max_active"], state["active"])
+        try:
+            state["dfs"] = {}  # yf.download と同じく、呼ぶたびに空にする
+            for t in tickers:
+                state["dfs"][t] = np.full(len(DATES), _price(t))
+                time.sleep(0.001)  # 他のスレッドが割り込む隙を作る
+            got = dict(state["dfs"])
+        finally:
+            with guard:
+                state["active"] -= 1
+        cols = pd.MultiIndex.from_product([["Close"], list(got)])
+        return pd.DataFrame(np.column_stack(list(got.values())), index=DATES, columns=cols)
+
+    yf.download = download
+    yf.state = state
+    return yf
+
+
+def test_yfinance_source_is_safe_from_many_threads(monkeypatch):
+    yf = _fake_yfinance()
+    monkeypatch.setitem(sys.modules, "yfinance", yf)
+    tickers = [f"{1000 + i}.T" for i in range(120)]
+
+    res = fetch_wide(
+        tickers,
+        source_downloader(YFinanceSource(), period="5d"),
+        chunk_size=10,
+        max_workers=8,
+        refetch_single=False,  # 取り直しで隠れないように、最初の取得の結果だけを見る
+        adaptive=False,
+        sleep=lambda s: None,
+    )
+
+    assert res.failed == []
+    assert sorted(res.close.index) == sorted(tickers)
+    for t in tickers:
+        assert (res.close.loc[t] == _price(t)).all()
+    # yf.download は同時に1本しか呼ばれていない
+    assert yf.state["max_active"] == 1
@@ -0,0 +1,85 @@
+# 説明: jit_kernels の numba 版と NumPy 版が1ビット違わず同じ結果を返すこと、numba が使えないときは NumPy 版に切り替わることを確かめるテスト。
+# 入力方法: リポジトリ直下で `python -m pytest -q tests` を実行（一致のテストは numba が入っていなければ飛ばす）。
+# 出力されるモノ: なし（pytest の結果のみ）。
+
+import sys
+
+import numpy as np
+import pytest
+
+import jit_kernels
+from asof_index import AsofIndex
+from jit_kernels import asof_lookup, buy_sell_pnl, rsr_kernel
+from rsr_engine import WEIGHTS
+
+
+def _same(a, b) -> bool:
+    return a.dtype == b.dtype and a.shape == b.shape and np.array_equal(a, b, equal_nan=True)
+
+
+@pytest.fixture
+def data():
+    """NaN・0 を混ぜた価格と、範囲外（-1）を混ぜた行・列の組。"""
+    rng = np.random.default_rng(0)
+    n_t, n_d, n = 30, 200, 5000
+    values = rng.uniform(1, 1000, (n_t, n_d)).round(2)
+    values[rng.random(values.shape) < 0.2] = np.nan
+    asof = AsofIndex(values, [str(i) for i in range(n_t)], np.arange(n_d).astype("datetime64[D]"))
+    picked = rng.uniform(1, 1000, (n, 5)).round(2)
+    picked[rng.random(picked.shape) < 0.02] = np.nan
+    picked[rng.random(picked.shape) < 0.02] = 0.0
+    return {
+        "asof": asof,
+        "rows": rng.integers(-1, n_t, n),
+        "cols": rng.integers(-1, n_d, (3, n)),
+        "picked": picked,
+        "shares": rng.integers(0, 100, n).astype(np.float64),
+    }
+
+
+@pytest.fixture
+def numba_backend():
+    pytest.importorskip("numba")
+    if jit_kernels._numba_kernels() is None:
+        pytest.skip("numba はあるがカーネルを作れない環境")
+
+
+def test_asof_lookup_parity(data, numba_backend):
+    a = data["asof"]
+    rows, cols = data["rows"][None, :], data["cols"]
+    for x, y in zip(
+        asof_lookup(a.last, a.filled, rows, cols, backend="numpy"),
+        asof_lookup(a.last, a.filled, rows, cols, backend="numba"),
+    ):
+        assert _same(x, y)
+
+
+def test_rsr_parity(data, numba_backend):
+    picked = data["picked"]
+    assert _same(rsr_kernel(picked, WEIGHTS, backend="numpy"), rsr_kernel(picked, WEIGHTS, backend="numba"))
+
+
+def test_buy_sell_pnl_parity(data, numba_backend):
+    buy, sell, shares = data["picked"][:, 0], data["picked"][:, 1], data["shares"]
+    for x, y in zip(
+        buy_sell_pnl(buy, sell, shares, backend="numpy"),
+        buy_sell_pnl(buy, sell, shares, backend="numba"),
+    ):
+        assert _same(x, y)
+
+
+def test_falls_back_to_numpy_when_numba_fails(data, monkeypatch):
+    # numba が入っていても import に失敗する環境を再現する
+    jit_kernels._numba_kernels.cache_clear()
+    monkeypatch.setitem(sys.modules, "numba", None)
+    monkeypatch.setattr(jit_kernels, "HAS_NUMBA", True)
+    monkeypatch.setattr(jit_kernels, "BACKEND", "numba")
+    try:
+        picked = data["picked"]
+        got = rsr_kernel(picked, WEIGHTS)
+        assert jit_kernels.BACKEND == "numpy"
+        assert _same(got, rsr_kernel(picked, WEIGHTS, backend="numpy"))
+        with pytest.raises(RuntimeError):
+            rsr_kernel(picked, WEIGHTS, backend="numba")
+    finally:
+        jit_kernels._numba_kernels.cache_clear()
@@ -0,0 +1,120 @@
+# 説明: ティッカー表記の揺れ（7203 / 7203.T / 7203_T / TSE:7203）を、データ上の正式な行名（または列名）に O(1) で対応付ける索引。
+# 入力方法: 各スクリプトから `from ticker_alias import alias_index` として使う（単体実行はしない）。
+# 出力されるモノ: なし（索引オブジェクトを返すだけ）。
+
+from __future__ import annotations
+
+import re
+import weakref
+from typing import Iterable
+
+import numpy as np
+import pandas as pd
+
+# 同じコードに複数の表記がデータ側にある場合の優先順（小さいほど優先）
+#   7203.T > TSE:7203 > 7203 > その他（7203_T など）
+_PREFERENCE = (
+    re.compile(r"^[0-9A-Z]+\.T$"),
+    re.compile(r"^TSE:[0-9A-Z]+$"),
+    re.compile(r"^[0-9A-Z]+$"),
+)
+
+_CODE_PREFIX = re.compile(r"^TSE:", re.IGNORECASE)
+_CODE_SUFFIX = re.compile(r"[._]T$", re.IGNORECASE)
+
+
+def ticker_code(ticker: str) -> str:
+    """'7203.T' / '7203_T' / 'TSE:7203' / '7203' → '7203'（比較用に大文字化）。"""
+    s = str(ticker).strip().upper()
+    s = _CODE_PREFIX.sub("", s)
+    return _CODE_SUFFIX.sub("", s)
+
+
+def _preference(label: str) -> int:
+    for rank, pat in enumerate(_PREFERENCE):
+        if pat.match(label.upper()):
+            return rank
+    return len(_PREFERENCE)
+
+
+class TickerAliasIndex:
+    """
+    正式な行名の一覧から一度だけ作る索引。
+    - resolve("7203") / resolve("TSE:7203") / resolve("7203_T") → "7203.T"
+    - positions([...]) で多数のコードをまとめて行番号に変換（見つからなければ -1）
+    """
+
+    def __init__(self, labels: Iterable[str]):
+        self.labels: list[str] = [str(x) for x in labels]
+
+        # 完全一致を最優先し、無ければコードで引く
+        self._exact: dict[str, int] = {}
+        for i, label in enumerate(self.labels):
+            self._exact.setdefault(label, i)
+        by_code: dict[str, int] = {}
+        for i, label in enumerate(self.labels):
+            code = ticker_code(label)
+            j = by_code.get(code)
+            if j is None or _preference(label) < _preference(self.labels[j]):
+                by_code[code] = i
+        self._by_code = by_code
+        self._exact_keys = pd.Index(list(self._exact.keys()), dtype=object)
+        self._exact_pos = np.fromiter(self._exact.values(), dtype=np.int64, count=len(self._exact))
+        self._code_keys = pd.Index(list(by_code.keys()), dtype=object)
+        self._code_pos = np.fromiter(by_code.values(), dtype=np.int64, count=len(by_code))
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    def position(self, ticker: str) -> int:
+        """行番号を返す。見つからなければ -1。"""
+        i = self._exact.get(str(ticker))
+        if i is not None:
+            return i
+        return self._by_code.get(ticker_code(ticker), -1)
+
+    def resolve(self, ticker: str) -> str | None:
+        """正式な行名を返す。見つからなければ None。"""
+        i = self.position(ticker)
+        return self.labels[i] if i >= 0 else None
+
+    def positions(self, tickers: Iterable[str]) -> np.ndarray:
+        """コード一覧をまとめて行番号（int配列, 見つからなければ -1）に変換する。"""
+        keys = pd.Index([str(t) for t in tickers], dtype=object)
+        if len(keys) == 0:
+            return np.empty(0, dtype=np.int64)
+        codes = keys.str.strip().str.upper().str.replace(_CODE_PREFIX, "", regex=True)
+        codes = codes.str.replace(_CODE_SUFFIX, "", regex=True)
+
+        hit = self._code_keys.get_indexer(codes)
+        out = np.where(hit >= 0, self._code_pos[hit.clip(min=0)], -1)
+
+        # 完全一致があればそちらを優先（resolve と同じ結果にする）
+        exact = self._exact_keys.get_indexer(keys)
+        return np.where(exact >= 0, self._exact_pos[exact.clip(min=0)], out)
+
+    def resolve_many(self, tickers: Iterable[str]) -> list[str | None]:
+        """コード一覧をまとめて正式な行名に変換する（見つからなければ None）。"""
+        return [self.labels[i] if i >= 0 else None for i in self.positions(tickers)]
+
+
+_CACHE: dict[int, tuple[weakref.ref, TickerAliasIndex]] = {}
+
+
+def alias_index(labels: pd.Index | Iterable[str]) -> TickerAliasIndex:
+    """
+    DataFrame の index / columns から索引を返す。
+    同じ Index オブジェクトに対しては1回だけ作り、以後は使い回す。
+    """
+    if not isinstance(labels, pd.Index):
+        return TickerAliasIndex(labels)
+
+    key = id(labels)
+    hit = _CACHE.get(key)
+    if hit is not None and hit[0]() is labels:
+        return hit[1]
+
+    index = TickerAliasIndex(labels)
+    _CACHE[key] = (weakref.ref(labels), index)
+    weakref.finalize(labels, _CACHE.pop, key, None)
+    return index
@@ -17,6 +17,8 @@ import pandas as pd
 import os
 from typing import Optional, Dict, Any
 
+from price_store import load_close_by_date
+
 
 def _parse_date(d):
     if isinstance(d, (pd.Timestamp, datetime)):
@@ -27,13 +29,12 @@ def _parse_date(d):
 def load_prices(path: str = "prices_close_wide.csv") -> pd.DataFrame:
     """価格CSVを読み込み、日付インデックスのDataFrameを返す。
 
-    CSVは先頭列が日付、以降がティッカー列という想定。
+    CSVは行=ティッカー、列=日付のワイド形式（prices_close_wide.csv）。
+    読み込みは共通の `price_store` に任せ、日付優先に並べ替えた表を返す。
     """
     if not os.path.exists(path):
         raise FileNotFoundError(f"価格ファイルが見つかりません: {path}")
-    df = pd.read_csv(path, index_col=0, parse_dates=True)
-    df.index = pd.to_datetime(df.index).normalize()
-    return df
+    return load_close_by_date(path)
 
 
 def _get_nearest_date_index(dates, target: pd.Timestamp, direction: str = "next") -> int:
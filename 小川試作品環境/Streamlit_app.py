@@ -3,21 +3,20 @@ import pandas as pd
 import plotly.express as px
 from pathlib import Path
 import datetime
+import sys
 
+# 共通の価格読み込みモジュール（1つ上の階層の price_store.py）を使う
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
 
-@st.cache_data
-def load_prices(path: Path):
-    df = pd.read_csv(path)
+from price_store import load_close_by_date
 
-    if "Ticker" in df.columns:
-        df = df.set_index("Ticker").T
 
-    idx = pd.to_datetime(df.index, errors="coerce")
-    mask = ~idx.isna()
-    df = df.loc[mask].copy()
-    df.index = pd.DatetimeIndex(idx[mask])
-    df = df.apply(pd.to_numeric, errors="coerce").sort_index()
-    return df
+@st.cache_resource
+def load_prices(path: Path):
+    # memmap をそのまま使う（セッションごとにコピーを持たない）。読み取り専用
+    return load_close_by_date(path, mmap=True)
 
 
 def normalize_series(s: pd.Series):
@@ -27,7 +26,7 @@ def normalize_series(s: pd.Series):
 def main():
     st.title("株価シミュレーション")
 
-    csv_path = Path(__file__).resolve().parents[1] / "prices_close_wide.csv"
+    csv_path = ROOT / "prices_close_wide.csv"
     df = load_prices(csv_path)
 
     if df.empty:
@@ -151,9 +150,9 @@ def main():
         results.append(
             {
                 "Ticker": ticker,
-                "開始価格": round(start_price, 2),
-                "終了価格": round(end_price, 2),
-                "騰落率 (%)": round(rtn_pct, 2),
+                "開始価格": round(float(start_price), 2),
+                "終了価格": round(float(end_price), 2),
+                "騰落率 (%)": round(float(rtn_pct), 2),
             }
         )
 
@@ -8,8 +8,23 @@ so it can be imported more easily from other scripts. Functionality is identical
 from datetime import datetime
 import pandas as pd
 import os
+import sys
 from typing import Optional, Dict, Any
 
+# 共通の価格読み込みモジュール（1つ上の階層の price_store.py）を使う
+_ROOT = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+if _ROOT not in sys.path:
+    sys.path.insert(0, _ROOT)
+
+from price_store import load_close_by_date, load_field_by_date
+from ticker_alias import alias_index
+from dividend_store import DIVIDENDS_PATH, dividend_index_for, load_dividend_index
+from download_cache import cached_dividends
+
+# 約定価格の選び方
+BUY_AT = ("close", "open")  # 購入日の終値 / 購入日の始値
+SELL_AT = ("close", "next_open")  # 売却日の終値 / 売却日の翌営業日の始値
+
 
 def _parse_date(d):
     if isinstance(d, (pd.Timestamp, datetime)):
@@ -20,10 +35,9 @@ def _parse_date(d):
         raise ValueError(f"日付の解析に失敗しました: {d!r}. 引数の順序を確認してください (ticker buy_date <sell_date|hold_days>)")
 
 
-def load_prices(path: str = "prices_close_wide.csv") -> pd.DataFrame:
-    """価格CSVを読み込み。複数候補を試して親フォルダも探索します。
-
-    優先順:
+def _find_price_file(path: str) -> str:
+    """
+    価格ファイルの場所を決める。優先順:
     1. 引数 `path`
     2. スクリプトの親フォルダにある `../prices_close_wide.csv`
     3. カレントディレクトリの `prices_close_wide.csv`
@@ -35,29 +49,32 @@ def load_prices(path: str = "prices_close_wide.csv") -> pd.DataFrame:
 
     for p in candidates:
         if os.path.exists(p):
-            # まずは文字列として読み込む（自動日時解析で誤判定されるのを避ける）
-            df = pd.read_csv(p, index_col=0)
-
-            # インデックスが日付かどうか判定する
-            idx_parsed = pd.to_datetime(df.index, errors="coerce")
-            valid_idx = idx_parsed.notna().sum()
-            if valid_idx / max(1, len(df.index)) >= 0.9:
-                # 行が日付インデックスになっていると判断
-                df.index = idx_parsed.normalize()
-                return df
+            return p
+    raise FileNotFoundError(f"価格ファイルが見つかりません。試した場所: {candidates}")
 
-            # そうでなければ、列が日付になっている可能性があるので転置を試す
-            cols_parsed = pd.to_datetime(df.columns, errors="coerce")
-            valid_cols = cols_parsed.notna().sum()
-            if valid_cols / max(1, len(df.columns)) >= 0.9:
-                df = df.T
-                df.index = cols_parsed.normalize()
-                return df
 
-            # 日付形式が見つからない場合はエラー
-            raise ValueError(f"CSVのフォーマットが想定外です: 日付列が見つかりません ({p})")
+def load_prices(path: str = "prices_close_wide.csv") -> pd.DataFrame:
+    """価格データを読み込み、日付インデックス（列=ティッカー）のDataFrameを返す。
+
+    読み込みは共通の `price_store` に任せる（2回目以降はCSVを解析せずストアから読む）。
+    ファイルの探し方は `_find_price_file` を参照。
+    """
+    p = _find_price_file(path)
+    df = load_close_by_date(p)
 
-    raise FileNotFoundError(f"価格ファイルが見つかりません。試した場所: {candidates}")
+    # 日付形式が見つからない場合はエラー
+    if df.empty:
+        raise ValueError(f"CSVのフォーマットが想定外です: 日付列が見つかりません ({p})")
+    return df
+
+
+def load_open_prices(path: str = "prices_close_wide.csv") -> pd.DataFrame:
+    """始値を終値と同じ形（日付インデックス, 列=ティッカー）で返す。
+
+    始値は get_price.py で取得したストアにだけ入っている（CSVには無い）。
+    無ければ KeyError。
+    """
+    return load_field_by_date("open", _find_price_file(path))
 
 
 def _get_nearest_date_index(dates, target: pd.Timestamp, direction: str = "next") -> int:
@@ -72,153 +89,55 @@ def _get_nearest_date_index(dates, target: pd.Timestamp, direction: str = "next"
         return i - 1
 
 
-def dividends_in_period(dividends_df: pd.DataFrame, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> bool:
-    if dividends_df is None:
-        return False
-    df = dividends_df.copy()
-    if "date" in df.columns:
-        s = pd.to_datetime(df["date"], errors="coerce")
-        # タイムゾーンがある場合はナイーブに変換して正しく比較できるようにする
-        try:
-            if s.dt.tz is not None:
-                s = s.dt.tz_convert(None)
-        except Exception:
-            # s.dt.tz が存在しない場合は無視
-            pass
-        df["date"] = s.dt.normalize()
-        date_col = "date"
-    else:
-        df.index = pd.to_datetime(df.index).normalize()
-        df = df.reset_index().rename(columns={"index": "date"})
-        date_col = "date"
-
-    if "ticker" in df.columns:
-        df = df[df["ticker"] == ticker]
-
-    # start/end をナイーブな正規化された Timestamp に揃える
-    start_ts = pd.to_datetime(start)
-    end_ts = pd.to_datetime(end)
-    try:
-        if getattr(start_ts, 'tz', None) is not None:
-            start_ts = start_ts.tz_convert(None)
-    except Exception:
-        pass
-    try:
-        if getattr(end_ts, 'tz', None) is not None:
-            end_ts = end_ts.tz_convert(None)
-    except Exception:
-        pass
-    start_ts = start_ts.normalize()
-    end_ts = end_ts.normalize()
+def dividends_in_period(dividends_df, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> bool:
+    """保有期間 [start, end] に配当があったかを返す。
 
-    mask = (df[date_col] >= start_ts) & (df[date_col] <= end_ts)
-    return mask.any()
+    dividends_df は配当DataFrame（ticker / date / dividend 列など）か DividendIndex。
+    DataFrame は初回だけ索引に変換し、以後は二分探索だけで判定する。
+    """
+    index = dividend_index_for(dividends_df)
+    if index is None:
+        return False
+    return index.any_in(ticker, start, end)
 
 
-def calculate_total_dividends(dividends_df: pd.DataFrame, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> float:
+def calculate_total_dividends(dividends_df, ticker: str, start: pd.Timestamp, end: pd.Timestamp) -> float:
     """保有期間中の配当金の合計を計算する(1株あたり)"""
-    if dividends_df is None:
+    index = dividend_index_for(dividends_df)
+    if index is None:
         return 0.0
-    df = dividends_df.copy()
-    if "date" in df.columns:
-        s = pd.to_datetime(df["date"], errors="coerce")
-        try:
-            if s.dt.tz is not None:
-                s = s.dt.tz_convert(None)
-        except Exception:
-            pass
-        df["date"] = s.dt.normalize()
-        date_col = "date"
-    else:
-        df.index = pd.to_datetime(df.index).normalize()
-        df = df.reset_index().rename(columns={"index": "date"})
-        date_col = "date"
-
-    if "ticker" in df.columns:
-        df = df[df["ticker"] == ticker]
-
-    # start/end をナイーブな正規化された Timestamp に揃える
-    start_ts = pd.to_datetime(start).normalize()
-    end_ts = pd.to_datetime(end).normalize()
-    try:
-        if getattr(start_ts, 'tz', None) is not None:
-            start_ts = start_ts.tz_convert(None)
-    except Exception:
-        pass
-    try:
-        if getattr(end_ts, 'tz', None) is not None:
-            end_ts = end_ts.tz_convert(None)
-    except Exception:
-        pass
-
-    mask = (df[date_col] >= start_ts) & (df[date_col] <= end_ts)
-    filtered_df = df[mask]
-
-    # 配当列を探す("dividend", "dividends", "div" など複数の名前に対応)
-    div_col = None
-    for col in ["dividend", "dividends", "div", "value"]:
-        if col in filtered_df.columns:
-            div_col = col
-            break
-    
-    if div_col is None:
-        return 0.0
-
-    try:
-        total_div = float(filtered_df[div_col].sum())
-    except Exception:
-        return 0.0
-
-    return total_div
+    return index.total_in(ticker, start, end)
 
 
 def _find_column_for_ticker(df: pd.DataFrame, ticker: str) -> str:
-    """与えられたティッカー文字列からDataFrameの列名を柔軟に探索して返す。
+    """与えられたティッカー文字列からDataFrameの列名を探して返す。
 
-    試行順:
-    1. 完全一致
-    2. '_' <-> '.' の置換
-    3. 数字部分のみ（例: '3382' -> '3382.T' のような候補を検索）
-    4. 部分一致で最初に見つかったもの
+    '3382' / '3382.T' / '3382_T' / 'TSE:3382' のどれでも同じ列に対応付ける。
+    索引は価格データごとに1回だけ作り、以後は辞書引きだけで済ませる。
     """
-    cols = list(df.columns.astype(str))
-    if ticker in cols:
-        return ticker
-
-    alt = ticker.replace("_", ".")
-    if alt in cols:
-        return alt
-
-    alt2 = ticker.replace(".", "_")
-    if alt2 in cols:
-        return alt2
-
-    # 数字のみを取り出してマッチを試みる
-    import re
-
-    m = re.match(r"^(\d{3,6})", ticker)
-    code = None
-    if m:
-        code = m.group(1)
-        for c in cols:
-            if str(c).startswith(code):
-                return c
-
-    # 部分一致の最初の候補
-    for c in cols:
-        if code and code in str(c):
-            return c
+    col = alias_index(df.columns).resolve(ticker)
+    if col is not None:
+        return col
 
     # 失敗するときは候補を一部返して分かりやすくする
-    sample = cols[:20]
+    sample = list(df.columns.astype(str))[:20]
     raise KeyError(f"ティッカー '{ticker}' に一致する列が見つかりません。候補例: {sample}")
 
 
 def load_dividends_for_ticker(ticker: str):
-    """ローカルの配当CSVを探して読み込む。見つからなければ yfinance で取得を試みる。
+    """配当データを探して読み込む。
+
+    1. まとめ済みの配当ストア（1つ上の階層の dividends_store.npz。`python add_dividend.py` で作成）があればそれを使う
+       （ストアに無い銘柄は配当なしとみなし、実行中には取得しに行かない）
+    2. 無ければローカルの配当CSVを探す
+    3. それでも無ければ yfinance で取得を試みる（取得結果はディスクにキャッシュされる）
 
-    返り値: DataFrame または None
+    返り値: DividendIndex / DataFrame または None
     """
+    store = load_dividend_index(os.path.join(_ROOT, DIVIDENDS_PATH))
+    if store is not None:
+        return store
+
     # 候補ファイル名
     here = os.path.dirname(__file__)
     candidates = []
@@ -240,16 +159,9 @@ def load_dividends_for_ticker(ticker: str):
             except Exception:
                 continue
 
-    # ローカルに見つからなければ yfinance で取得を試みる
+    # ローカルに見つからなければ yfinance で取得を試みる (ticker の形式が 1332.T のような場合)
     try:
-        import yfinance as yf
-    except Exception:
-        return None
-
-    # yfinance で配当取得 (ticker の形式が 1332.T のような場合)
-    try:
-        tk = yf.Ticker(ticker.replace('_', '.'))
-        div = tk.dividends
+        div = cached_dividends(ticker.replace('_', '.'))
         if div is None or len(div) == 0:
             return None
         df = div.reset_index()
@@ -266,9 +178,24 @@ def simulate_trade(
     hold_days: Optional[int] = None,
     prices_df: Optional[pd.DataFrame] = None,
     dividends_df: Optional[pd.DataFrame] = None,
+    buy_at: str = "close",
+    sell_at: str = "close",
+    open_df: Optional[pd.DataFrame] = None,
 ) -> Dict[str, Any]:
+    """1回の売買を計算する。
+
+    buy_at : "close"=購入日の終値で買う / "open"=購入日の始値で買う
+    sell_at: "close"=売却日の終値で売る / "next_open"=売却日の翌営業日の始値で売る
+    open_df: 始値の表（prices_df と同じ形）。始値を使うのに渡されなければストアから読む
+    """
+    if buy_at not in BUY_AT:
+        raise ValueError(f"buy_at は {BUY_AT} のいずれかを指定してください: {buy_at!r}")
+    if sell_at not in SELL_AT:
+        raise ValueError(f"sell_at は {SELL_AT} のいずれかを指定してください: {sell_at!r}")
     if prices_df is None:
         prices_df = load_prices()
+    if open_df is None and (buy_at == "open" or sell_at == "next_open"):
+        open_df = load_open_prices()
 
     dates = prices_df.index
     buy_ts = _parse_date(buy_date)
@@ -283,16 +210,23 @@ def simulate_trade(
     else:
         raise ValueError("sell_date か hold_days のいずれかを指定してください")
 
+    # 翌営業日の始値で売るときは、約定日を1営業日後ろにずらす
+    if sell_at == "next_open":
+        if sell_idx + 1 >= len(dates):
+            raise KeyError(f"売値取得エラー: {dates[sell_idx]:%Y-%m-%d} の翌営業日のデータがありません")
+        sell_idx += 1
     actual_sell_date = dates[sell_idx]
 
     # ティッカー名をDataFrameの列名にマッピング
     col = _find_column_for_ticker(prices_df, ticker)
+    buy_src = open_df if buy_at == "open" else prices_df
+    sell_src = open_df if sell_at == "next_open" else prices_df
     try:
-        buy_price = float(prices_df.at[actual_buy_date, col])
+        buy_price = float(buy_src.at[actual_buy_date, _find_column_for_ticker(buy_src, ticker)])
     except Exception as e:
         raise KeyError(f"買値取得エラー: ティッカー '{ticker}' -> 列 '{col}' または日付が存在しません ({e})")
     try:
-        sell_price = float(prices_df.at[actual_sell_date, col])
+        sell_price = float(sell_src.at[actual_sell_date, _find_column_for_ticker(sell_src, ticker)])
     except Exception as e:
         raise KeyError(f"売値取得エラー: ティッカー '{ticker}' -> 列 '{col}' または日付が存在しません ({e})")
 
@@ -320,6 +254,8 @@ if __name__ == "__main__":
     parser.add_argument("ticker", help="ティッカー (例: 3382_T or 1332.T)")
     parser.add_argument("buy_date", help="購入日 (YYYY-MM-DD)")
     parser.add_argument("arg3", help="売却日 (YYYY-MM-DD) または保有日数 (整数)")
+    parser.add_argument("--buy-at", choices=BUY_AT, default="close", help="買う価格: close=購入日の終値, open=購入日の始値")
+    parser.add_argument("--sell-at", choices=SELL_AT, default="close", help="売る価格: close=売却日の終値, next_open=翌営業日の始値")
 
     args = parser.parse_args()
 
@@ -347,7 +283,10 @@ if __name__ == "__main__":
         print("配当データが見つかりませんでした。ローカルCSVか yfinance が必要です。配当チェックは無効化されます。")
 
     try:
-        res = simulate_trade(ticker, buy_date, sell_date=sell_date, hold_days=hold_days, prices_df=prices, dividends_df=dividends_df)
+        res = simulate_trade(
+            ticker, buy_date, sell_date=sell_date, hold_days=hold_days, prices_df=prices, dividends_df=dividends_df,
+            buy_at=args.buy_at, sell_at=args.sell_at,
+        )
     except ValueError as e:
         print(f"入力エラー: {e}")
         raise SystemExit(2)